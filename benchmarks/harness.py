@@ -0,0 +1,126 @@
+"""Shared measurement, reporting and baseline helpers for the benchmark scripts."""
+
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Optional
+
+# Metrics compared against a baseline and whether a higher value is better.
+METRICS = {"ops_per_sec": True, "p50_us": False, "p90_us": False, "p99_us": False}
+
+
+@dataclass
+class Result:
+    name: str
+    iterations: int
+    ops_per_sec: float
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    max_us: float
+
+
+def summarize(name: str, latencies_ns: list[int], elapsed_s: float) -> Result:
+    latencies_us = sorted(latency / 1000 for latency in latencies_ns)
+    quantiles = statistics.quantiles(latencies_us, n=100, method="inclusive") if len(latencies_us) > 1 else None
+
+    def percentile(p: int) -> float:
+        return quantiles[p - 1] if quantiles else latencies_us[0]
+
+    return Result(
+        name=name,
+        iterations=len(latencies_us),
+        ops_per_sec=len(latencies_us) / elapsed_s,
+        p50_us=percentile(50),
+        p90_us=percentile(90),
+        p99_us=percentile(99),
+        max_us=latencies_us[-1],
+    )
+
+
+def measure(name: str, operation: Callable[[int], object], iterations: int, warmup: int = 0) -> Result:
+    """Time `operation(i)` for `iterations` sequential calls after `warmup` untimed calls."""
+    for i in range(warmup):
+        operation(i)
+    latencies = []
+    clock = time.perf_counter_ns
+    start = clock()
+    for i in range(warmup, warmup + iterations):
+        begin = clock()
+        operation(i)
+        latencies.append(clock() - begin)
+    return summarize(name, latencies, (clock() - start) / 1e9)
+
+
+async def ameasure(
+    name: str,
+    operation: Callable[[int], Awaitable[object]],
+    iterations: int,
+    warmup: int = 0,
+    concurrency: int = 1,
+) -> Result:
+    """Asynchronous `measure`, running the calls on `concurrency` concurrent workers."""
+    for i in range(warmup):
+        await operation(i)
+    latencies = []
+    clock = time.perf_counter_ns
+    indexes = iter(range(warmup, warmup + iterations))
+
+    async def worker() -> None:
+        for i in indexes:
+            begin = clock()
+            await operation(i)
+            latencies.append(clock() - begin)
+
+    start = clock()
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    return summarize(name, latencies, (clock() - start) / 1e9)
+
+
+def print_results(results: list[Result]) -> None:
+    width = max([len(result.name) for result in results] + [4]) + 2
+    print(f"{'case':<{width}}{'ops/s':>12}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>10}")
+    for r in results:
+        print(
+            f"{r.name:<{width}}{r.ops_per_sec:>12.0f}{r.p50_us:>10.1f}{r.p90_us:>10.1f}{r.p99_us:>10.1f}{r.max_us:>10.1f}"
+        )
+
+
+def save_baseline(path: str, results: list[Result]) -> None:
+    baseline = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": {result.name: asdict(result) for result in results},
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+    print(f"Baseline written to {path}")
+
+
+def compare_baseline(path: str, results: list[Result], threshold: float) -> list[str]:
+    """Print the change of every metric against the baseline and return the regressions beyond `threshold`."""
+    with open(path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\nChange against {path} (regression threshold {threshold:.0%}):")
+    for result in results:
+        previous: Optional[dict] = baseline.get(result.name)
+        if previous is None:
+            print(f"  {result.name}: no baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in METRICS.items():
+            before, after = previous[metric], getattr(result, metric)
+            change = (after - before) / before if before else 0.0
+            changes.append(f"{metric} {change:+.1%}")
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f"{result.name} {metric}: {before:.1f} -> {after:.1f}")
+        print(f"  {result.name}: {', '.join(changes)}")
+    return regressions
+
+
+__all__ = ["Result", "ameasure", "compare_baseline", "measure", "print_results", "save_baseline", "summarize"]
@@ -0,0 +1,67 @@
+"""Compare the cost of logging on a hot path flooded with failures, such as a token replay attack.
+
+Every call logs one error the way the package used to (an eager f-string through the root logger)
+and through `hot_log`, rate limited, with and without the background queue. Records are written
+to /dev/null by a stream handler, so the figures include formatting and the write.
+
+Usage: python benchmarks/hot_logging.py [--iterations 50000]
+"""
+
+import argparse
+import logging
+import os
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+
+from harness import measure, print_results
+
+from tp_auth_serverside.utilities.hot_logging import HotPathLogger, Masked, start_log_queue, stop_log_queue
+
+ERROR = ValueError("Signature verification failed")
+USER_ID = "7d1f0c1e-4b7a-4a36-9a59-2f1d3c8e5b61"
+TOKEN = "GdpjnAtfWvYqB4Q8kLq9nC"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50000, help="timed calls per case")
+    args = parser.parse_args()
+
+    sink = open(os.devnull, "w")
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+    limited = HotPathLogger(rate=10)
+    unlimited = HotPathLogger(rate=0)
+
+    def eager(i: int) -> None:
+        logging.error(f"Error refreshing token for user_id: {USER_ID}, token: {TOKEN}, error: {ERROR}")
+
+    def lazy(log: HotPathLogger):
+        def operation(i: int) -> None:
+            log.error(
+                "refresh.failed",
+                "Error refreshing token for user_id: %s, token: %s, error: %s",
+                USER_ID,
+                Masked(TOKEN),
+                ERROR,
+            )
+
+        return operation
+
+    results = [
+        measure("eager_fstring", eager, args.iterations, warmup=1000),
+        measure("hot_log/unlimited", lazy(unlimited), args.iterations, warmup=1000),
+        measure("hot_log/rate_limited", lazy(limited), args.iterations, warmup=1000),
+    ]
+    start_log_queue(size=args.iterations)
+    try:
+        results.append(measure("hot_log/unlimited_queued", lazy(unlimited), args.iterations, warmup=1000))
+    finally:
+        stop_log_queue()
+    print_results(results)
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
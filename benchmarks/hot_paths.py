@@ -0,0 +1,279 @@
+"""Benchmark the authentication hot paths and track them against a saved baseline.
+
+Cases:
+- validator: `AuthValidator.__call__` for a stored session with a required scope
+- validator_stateless: `AuthValidator.__call__` for a stateless token checked against the revocation list
+- validator_machine: `AuthValidator.__call__` for a machine token from `MachineTokenProvider`
+- validator_rejected[/negative_cache]: `AuthValidator.__call__` replaying an unknown session handle
+- authenticate: `AuthenticationHandler.authenticate` (sign, store the session, restrict refresh)
+- token_route: `POST /token` through the app built by `generate_fastapi_app`
+- refresh_rpc: `RefreshService.RefreshToken` over a local gRPC server
+- jwt_encode/<alg>, jwt_decode/<alg>: `JWTUtil` per algorithm
+- requestor: `TPRequestor.aio_get` against a local keep-alive HTTP server
+
+By default the memory database is the in-process backend (`DB_URL=memory://`); point `DB_URL`
+at a Redis server to include the network round trips.
+
+Usage:
+    python benchmarks/hot_paths.py [--iterations 2000] [--concurrency 1] [--only validator]
+    python benchmarks/hot_paths.py --save baseline.json
+    python benchmarks/hot_paths.py --compare baseline.json [--threshold 0.1]
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import socket
+import sys
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+os.environ.setdefault("DB_URL", "memory://")
+os.environ.setdefault("AUTHORIZATION_SERVER", "true")
+os.environ.setdefault("REFRESH_URL", f"127.0.0.1:{_free_port()}")
+os.environ.setdefault("AUTH_SCOPES", '{"user:read": "Read users", "user:write": "Write users"}')
+
+import grpc
+import httpx
+from fastapi import HTTPException, Response
+from fastapi.security import SecurityScopes
+from harness import Result, ameasure, compare_baseline, measure, print_results, save_baseline
+from jwt_algorithms import generate_keys
+
+from tp_auth_serverside import (
+    FastAPIConfig,
+    JWTUtil,
+    SupportedAlgorithms,
+    TPRequestor,
+    UserInfoSchema,
+    generate_fastapi_app,
+)
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.auth.machine_token import MachineTokenProvider, MachineTokenVerifier
+from tp_auth_serverside.auth.negative_cache import NegativeCache
+from tp_auth_serverside.auth.revocation_list import RevocationList
+from tp_auth_serverside.core.fastapi_configurer import start_refresh_service
+from tp_auth_serverside.core.handler.authentication_handler import AuthenticationHandler
+from tp_auth_serverside.db.memorydb import close_pools, open_pools
+from tp_auth_serverside.db.memorydb.login import set_token
+from tp_auth_serverside.pb import refresh_pb2
+from tp_auth_serverside.pb.refresh_pb2_grpc import RefreshServiceStub
+from tp_auth_serverside.utilities.http_clients import close_http_clients
+
+USER_ID = "user_099"
+MACHINE_KEY = "benchmark-machine-key-with-at-least-32-bytes"
+PAYLOAD = {
+    "user_id": USER_ID,
+    "username": "Admin",
+    "email": "admin@prismatica.in",
+    "scopes": ["user:read", "user:write"],
+}
+
+
+async def bench_validator(args) -> list[Result]:
+    validator = AuthValidator()
+    short_token = await set_token(USER_ID, JWTUtil().encode(dict(PAYLOAD)))
+    scopes = SecurityScopes(scopes=["user:read"])
+
+    async def operation(i: int) -> None:
+        await validator(scopes, token=short_token, user_id=USER_ID, refresh=False)
+
+    return [await ameasure("validator", operation, args.iterations, args.warmup, args.concurrency)]
+
+
+async def bench_validator_stateless(args) -> list[Result]:
+    revocations = RevocationList()
+    await revocations.start()
+    validator = AuthValidator(revocations=revocations)
+    token = JWTUtil().encode({**PAYLOAD, "jti": "benchmark"})
+    scopes = SecurityScopes(scopes=["user:read"])
+    try:
+
+        async def operation(i: int) -> None:
+            await validator(scopes, token=token, user_id=USER_ID, refresh=False)
+
+        return [await ameasure("validator_stateless", operation, args.iterations, args.warmup, args.concurrency)]
+    finally:
+        await revocations.stop()
+
+
+async def bench_validator_machine(args) -> list[Result]:
+    verifier = MachineTokenVerifier({"benchmark": {"key": MACHINE_KEY, "scopes": ["user:read"]}})
+    validator = AuthValidator(machine_tokens=True, machine_verifier=verifier)
+    provider = MachineTokenProvider(service_id="benchmark", scopes=["user:read"], key=MACHINE_KEY)
+    scopes = SecurityScopes(scopes=["user:read"])
+
+    async def operation(i: int) -> None:
+        await validator(scopes, token=await provider.atoken(), refresh=False)
+
+    return [await ameasure("validator_machine", operation, args.iterations, args.warmup, args.concurrency)]
+
+
+async def bench_validator_rejected(args) -> list[Result]:
+    scopes = SecurityScopes(scopes=["user:read"])
+    results = []
+    for name, negative_cache in (("validator_rejected", None), ("validator_rejected/negative_cache", NegativeCache())):
+        validator = AuthValidator(negative_cache=negative_cache)
+
+        async def operation(i: int, validator: AuthValidator = validator) -> None:
+            try:
+                await validator(scopes, token="GdpjnAtfWvYqB4Q8kLq9nC", user_id=USER_ID, refresh=False)
+            except HTTPException:
+                pass
+
+        results.append(await ameasure(name, operation, args.iterations, args.warmup, args.concurrency))
+    return results
+
+
+async def bench_authenticate(args) -> list[Result]:
+    handler = AuthenticationHandler()
+    payload = UserInfoSchema(**PAYLOAD)
+
+    async def operation(i: int) -> None:
+        await handler.authenticate(Response(), f"user_{i}", payload)
+
+    return [await ameasure("authenticate", operation, args.iterations, args.warmup, args.concurrency)]
+
+
+async def bench_token_route(args) -> list[Result]:
+    async def login(form_data, request, response, dependency):
+        return form_data.username, UserInfoSchema(**{**PAYLOAD, "user_id": form_data.username})
+
+    def no_dependency():
+        return None
+
+    app = generate_fastapi_app(
+        FastAPIConfig(title="Benchmark", version="0", description="", root_path=""),
+        routers=[],
+        token_route_handler=(login, True, no_dependency),
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+
+        async def operation(i: int) -> None:
+            response = await client.post("/token", data={"username": f"user_{i}", "password": "secret"})
+            response.raise_for_status()
+
+        return [await ameasure("token_route", operation, args.iterations, args.warmup, args.concurrency)]
+
+
+async def bench_refresh_rpc(args) -> list[Result]:
+    # Every refresh restricts its session, so each call gets a session of its own.
+    jwt_token = JWTUtil().encode(dict(PAYLOAD))
+    sessions = [await set_token(USER_ID, jwt_token) for _ in range(args.warmup + args.iterations)]
+    server = await start_refresh_service()
+    channel = grpc.aio.insecure_channel(os.environ["REFRESH_URL"])
+    try:
+        stub = RefreshServiceStub(channel)
+
+        async def operation(i: int) -> None:
+            await stub.RefreshToken(refresh_pb2.RefreshRequest(user_id=USER_ID, token=sessions[i]))
+
+        return [await ameasure("refresh_rpc", operation, args.iterations, args.warmup, args.concurrency)]
+    finally:
+        await channel.close()
+        await server.stop(grace=None)
+
+
+async def bench_jwt(args) -> list[Result]:
+    results = []
+    for algorithm in SupportedAlgorithms:
+        write_key, read_key = generate_keys(algorithm)
+        jwt_util = JWTUtil(algorithm=algorithm, write_key=write_key, read_key=read_key)
+        token = jwt_util.encode(dict(PAYLOAD))
+        encode = functools.partial(lambda jwt_util, i: jwt_util.encode(dict(PAYLOAD)), jwt_util)
+        decode = functools.partial(lambda jwt_util, token, i: jwt_util.decode(token), jwt_util, token)
+        results.append(measure(f"jwt_encode/{algorithm}", encode, args.iterations, args.warmup))
+        results.append(measure(f"jwt_decode/{algorithm}", decode, args.iterations, args.warmup))
+    return results
+
+
+async def _serve_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    body = b'{"status": 200}'
+    response = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+    try:
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def bench_requestor(args) -> list[Result]:
+    server = await asyncio.start_server(_serve_http, "127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/user"
+    requestor = TPRequestor("benchmark-token")
+    try:
+
+        async def operation(i: int) -> None:
+            await requestor.aio_get(url=url)
+
+        return [await ameasure("requestor", operation, args.iterations, args.warmup, args.concurrency)]
+    finally:
+        await close_http_clients()
+        server.close()
+
+
+CASES = {
+    "validator": bench_validator,
+    "validator_stateless": bench_validator_stateless,
+    "validator_machine": bench_validator_machine,
+    "validator_rejected": bench_validator_rejected,
+    "authenticate": bench_authenticate,
+    "token_route": bench_token_route,
+    "refresh_rpc": bench_refresh_rpc,
+    "jwt": bench_jwt,
+    "requestor": bench_requestor,
+}
+
+
+async def run(args) -> list[Result]:
+    await open_pools()
+    results = []
+    try:
+        for name, case in CASES.items():
+            if args.only and not any(selected in name for selected in args.only):
+                continue
+            results.extend(await case(args))
+    finally:
+        await close_pools()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="timed calls per case")
+    parser.add_argument("--warmup", type=int, default=200, help="untimed calls before each case")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent callers for asynchronous cases")
+    parser.add_argument("--only", nargs="*", help=f"run only the cases whose name contains one of: {', '.join(CASES)}")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results against a baseline")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    # The refresh path logs every call, keep it out of the measurements.
+    logging.disable(logging.WARNING)
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.save:
+        save_baseline(args.save, results)
+    if args.compare:
+        regressions = compare_baseline(args.compare, results, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Measure import time of the package entry points and guard against eager imports.
+
+Each target is imported in a fresh interpreter with `python -X importtime`. The script exits
+non-zero when a target imports one of its forbidden modules or exceeds `--max-ms`, so it can
+run in CI as an import-time regression test.
+
+Usage: python benchmarks/import_time.py [--runs 5] [--max-ms 0]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("fastapi", "grpc", "httpx", "redis", "google.protobuf")
+
+# (label, statement, modules that must not be imported by the statement)
+TARGETS = [
+    ("package", "import tp_auth_serverside", HEAVY_MODULES + ("cryptography", "pydantic_settings", "jwt")),
+    ("config", "from tp_auth_serverside.config import Secrets", HEAVY_MODULES),
+    ("JWTUtil", "from tp_auth_serverside import JWTUtil; JWTUtil()", HEAVY_MODULES),
+    ("AuthValidator", "from tp_auth_serverside import AuthValidator", ("httpx",)),
+    ("generate_fastapi_app", "from tp_auth_serverside import generate_fastapi_app", ()),
+]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def environment() -> dict:
+    """The current environment, with the settings needed to import every target."""
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+    # The package may be importable from a path entry rather than installed, e.g. under pytest.
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, sys.path))
+    return env
+
+
+def startup_modules(env: dict) -> set[str]:
+    """Interpreter start-up imports (site, encodings, ...), which happen before the statement runs."""
+    return {match.group(4) for match in IMPORT_LINE.finditer(import_log("pass", env))}
+
+
+def leaked_modules(modules: set[str], forbidden: tuple[str, ...]) -> list[str]:
+    """Top-level names of the forbidden packages among `modules`."""
+    leaked = {name.split(".")[0] for name in modules if any(name == f or name.startswith(f"{f}.") for f in forbidden)}
+    return sorted(leaked)
+
+
+def import_log(statement: str, env: dict) -> str:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, env=env, check=True
+    )
+    return result.stderr
+
+
+def measure(statement: str, env: dict, startup: set[str]) -> tuple[float, set[str]]:
+    """Return the cumulative import time in milliseconds and the modules imported by `statement`."""
+    total_us = 0
+    modules = set()
+    for match in IMPORT_LINE.finditer(import_log(statement, env)):
+        name = match.group(4)
+        if name in startup:
+            continue
+        modules.add(name)
+        if len(match.group(3)) == 1:
+            # Only top-level entries: their cumulative time already includes nested imports.
+            total_us += int(match.group(2))
+    return total_us / 1000, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per target")
+    parser.add_argument("--max-ms", type=float, default=0, help="fail when a target's median exceeds this")
+    args = parser.parse_args()
+
+    env = environment()
+    startup = startup_modules(env)
+    failures = []
+    print(f"{'target':<22}{'median ms':>12}{'min ms':>10}{'modules':>10}")
+    for label, statement, forbidden in TARGETS:
+        timings = []
+        modules = set()
+        for _ in range(args.runs):
+            elapsed, modules = measure(statement, env, startup)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        print(f"{label:<22}{median:>12.1f}{min(timings):>10.1f}{len(modules):>10}")
+        leaked = leaked_modules(modules, forbidden)
+        if leaked:
+            failures.append(f"{label}: imports {', '.join(leaked)}")
+        if args.max_ms and median > args.max_ms:
+            failures.append(f"{label}: {median:.1f} ms exceeds {args.max_ms:.1f} ms")
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Compare sign/verify throughput and token size of every supported JWT algorithm.
+
+Usage: python benchmarks/jwt_algorithms.py [--seconds 1.0]
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from tp_auth_serverside.config import SupportedAlgorithms
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+PAYLOAD = {
+    "user_id": "user_099",
+    "username": "Admin",
+    "email": "admin@prismatica.in",
+    "scopes": ["user:read", "user:write"],
+}
+
+
+def generate_keys(algorithm: SupportedAlgorithms) -> tuple[str, str]:
+    if algorithm == SupportedAlgorithms.HS256:
+        secret = os.environ["SECRET_KEY"]
+        return secret, secret
+    if algorithm == SupportedAlgorithms.RS256:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == SupportedAlgorithms.ES256:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem.decode("utf-8"), public_pem.decode("utf-8")
+
+
+def ops_per_second(operation, seconds: float) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        operation()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per measurement")
+    args = parser.parse_args()
+
+    print(f"{'algorithm':<10}{'sign/s':>12}{'verify/s':>12}{'token bytes':>14}")
+    for algorithm in SupportedAlgorithms:
+        write_key, read_key = generate_keys(algorithm)
+        jwt_util = JWTUtil(algorithm=algorithm, write_key=write_key, read_key=read_key)
+        token = jwt_util.encode(dict(PAYLOAD))
+        sign = ops_per_second(lambda jwt_util=jwt_util: jwt_util.encode(dict(PAYLOAD)), args.seconds)
+        verify = ops_per_second(lambda jwt_util=jwt_util, token=token: jwt_util.decode(token), args.seconds)
+        print(f"{algorithm:<10}{sign:>12.0f}{verify:>12.0f}{len(token):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Load test the gRPC refresh service over TCP and a Unix domain socket.
+
+The refresh service runs in a process of its own against the in-process memory database, with the
+given server settings. This process drives `RefreshToken` calls from `--concurrency` concurrent
+callers spread over `--channels` channels, each call refreshing a session of its own. Calls
+rejected by `--max-concurrent-rpcs` (RESOURCE_EXHAUSTED) are counted separately; their latency
+is included.
+
+Usage:
+    python benchmarks/refresh_load.py [--requests 3000] [--concurrency 1 16 64 256] [--channels 4]
+    python benchmarks/refresh_load.py --transport uds --max-concurrent-rpcs 32 --compression gzip
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+os.environ.setdefault("DB_URL", "memory://")
+os.environ.setdefault("AUTHORIZATION_SERVER", "true")
+
+import grpc
+from harness import ameasure, print_results
+
+from tp_auth_serverside import JWTUtil
+from tp_auth_serverside.config import RefreshCompression, Secrets
+from tp_auth_serverside.core.fastapi_configurer import start_refresh_service
+from tp_auth_serverside.db.memorydb import close_pools, open_pools
+from tp_auth_serverside.db.memorydb.login import set_token
+from tp_auth_serverside.pb import refresh_pb2
+from tp_auth_serverside.pb.refresh_pb2_grpc import RefreshServiceStub
+from tp_auth_serverside.utilities.grpc_options import channel_options, compression
+
+USER_ID = "user_099"
+PAYLOAD = {"user_id": USER_ID, "username": "Admin", "email": "admin@prismatica.in", "scopes": ["user:read"]}
+
+
+def _address(transport: str, directory: str) -> str:
+    if transport == "uds":
+        return f"unix://{directory}/refresh.sock"
+    return f"127.0.0.1:{_free_port()}"
+
+
+def serve(address: str, args, sessions: int, ready, stop) -> None:
+    """Refresh server process with `sessions` sessions named `s<i>` to refresh."""
+    logging.disable(logging.WARNING)
+    Secrets.refresh_url = address
+    Secrets.refresh_max_concurrent_rpcs = args.max_concurrent_rpcs
+    Secrets.refresh_compression = args.compression
+
+    async def run_server() -> None:
+        await open_pools()
+        jwt_token = JWTUtil().encode(dict(PAYLOAD))
+        for i in range(sessions):
+            await set_token(USER_ID, jwt_token, short_token=f"s{i}")
+        server = await start_refresh_service()
+        ready.set()
+        await asyncio.to_thread(stop.wait)
+        await server.stop(grace=None)
+        await close_pools()
+
+    asyncio.run(run_server())
+
+
+async def drive(address: str, concurrency: int, args, first: int):
+    Secrets.refresh_compression = args.compression
+    channels = [
+        grpc.aio.insecure_channel(address, options=channel_options(), compression=compression())
+        for _ in range(args.channels)
+    ]
+    stubs = [RefreshServiceStub(channel) for channel in channels]
+    rejected = 0
+
+    async def operation(i: int) -> None:
+        nonlocal rejected
+        request = refresh_pb2.RefreshRequest(user_id=USER_ID, token=f"s{first + i}")
+        try:
+            await stubs[i % len(stubs)].RefreshToken(request)
+        except grpc.aio.AioRpcError as e:
+            if e.code() != grpc.StatusCode.RESOURCE_EXHAUSTED:
+                raise
+            rejected += 1
+
+    try:
+        await asyncio.gather(*(channel.channel_ready() for channel in channels))
+        name = f"{address.split(':')[0].replace('unix', 'uds').replace('127.0.0.1', 'tcp')}/concurrency={concurrency}"
+        return await ameasure(name, operation, args.requests, 0, concurrency), rejected
+    finally:
+        await asyncio.gather(*(channel.close() for channel in channels))
+
+
+def run(args) -> None:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    rejections = []
+    with tempfile.TemporaryDirectory() as directory:
+        for transport in args.transport:
+            address = _address(transport, directory)
+            ready, stop = context.Event(), context.Event()
+            # Every refresh restricts its session, so each call gets a session of its own.
+            sessions = args.requests * len(args.concurrency)
+            server = context.Process(target=serve, args=(address, args, sessions, ready, stop))
+            server.start()
+            try:
+                if not ready.wait(timeout=120):
+                    raise RuntimeError("Refresh server did not start")
+                for n, concurrency in enumerate(args.concurrency):
+                    result, rejected = asyncio.run(drive(address, concurrency, args, n * args.requests))
+                    results.append(result)
+                    rejections.append((result.name, rejected))
+            finally:
+                stop.set()
+                server.join()
+    print_results(results)
+    if args.max_concurrent_rpcs:
+        print(f"\n{'case':<32}{'rejected':>10}")
+        for name, rejected in rejections:
+            print(f"{name:<32}{rejected:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000, help="refresh calls per configuration")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64, 256], help="concurrent callers")
+    parser.add_argument("--channels", type=int, default=4, help="client channels, as REFRESH_CHANNEL_POOL_SIZE")
+    parser.add_argument("--transport", nargs="+", choices=["tcp", "uds"], default=["tcp", "uds"])
+    parser.add_argument("--max-concurrent-rpcs", type=int, default=None, help="as REFRESH_MAX_CONCURRENT_RPCS")
+    parser.add_argument(
+        "--compression", type=RefreshCompression, default=RefreshCompression.NONE, help="as REFRESH_COMPRESSION"
+    )
+    args = parser.parse_args()
+    # The refresh path logs every call, keep it out of the measurements.
+    logging.disable(logging.WARNING)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
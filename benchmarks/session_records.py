@@ -0,0 +1,63 @@
+"""Compare the size and coding cost of the session record formats stored in the login hash.
+
+The record size is what every `hget` of the session transfers and, plus the per-field overhead of
+the hash, what the memory database holds per session. The projection multiplies it by a million.
+
+Usage: python benchmarks/session_records.py [--iterations 20000] [--scopes 10]
+"""
+
+import argparse
+import functools
+import os
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+
+from harness import measure, print_results
+from jwt_algorithms import generate_keys
+
+from tp_auth_serverside import JWTUtil, SupportedAlgorithms
+from tp_auth_serverside.config import SessionRecordFormat
+from tp_auth_serverside.db.memorydb.records import decode_record, encode_record
+
+
+def payload(scopes: int) -> dict:
+    return {
+        "user_id": "7d1f0c1e-4b7a-4a36-9a59-2f1d3c8e5b61",
+        "username": "Jane Doe",
+        "email": "jane.doe@prismatica.in",
+        "scopes": [f"project:{i}:read" for i in range(scopes)],
+        "jti": "GdpjnAtfWvYqB4Q8kLq9nC",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000, help="timed calls per case")
+    parser.add_argument("--scopes", type=int, default=10, help="scopes granted in the token")
+    args = parser.parse_args()
+
+    results = []
+    sizes = []
+    for algorithm in (SupportedAlgorithms.HS256, SupportedAlgorithms.ES256, SupportedAlgorithms.RS256):
+        write_key, read_key = generate_keys(algorithm)
+        token = JWTUtil(algorithm=algorithm, write_key=write_key, read_key=read_key).encode(payload(args.scopes))
+        for record_format in SessionRecordFormat:
+            record = encode_record(token, 1440, record_format)
+            assert decode_record(record) == token
+            name = f"{algorithm}/{record_format}"
+            sizes.append((name, len(record)))
+            encode = functools.partial(
+                lambda token, record_format, i: encode_record(token, 1440, record_format), token, record_format
+            )
+            decode = functools.partial(lambda record, i: decode_record(record), record)
+            results.append(measure(f"encode/{name}", encode, args.iterations, warmup=500))
+            results.append(measure(f"decode/{name}", decode, args.iterations, warmup=500))
+
+    print_results(results)
+    print(f"\n{'record':<24}{'bytes':>8}{'MB per million':>16}")
+    for name, size in sizes:
+        print(f"{name:<24}{size:>8}{size * 1_000_000 / 2**20:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
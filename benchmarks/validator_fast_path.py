@@ -0,0 +1,159 @@
+"""Compare CPU time and per-call allocations of the validator fast path with the previous implementation.
+
+The previous `AuthValidator.__call__` is reproduced here: it built the 401 exception and formatted the
+`WWW-Authenticate` value on every call and scanned the scope list for every required scope.
+The `user_info` rows compare validating the claims with `UserInfoSchema.from_claims`, which the validator
+uses, and with pydantic's `model_construct`,
+and `scopes/bitmask` is the check used for tokens issued with `SCOPE_ENCODING=bitmask`.
+
+Usage: python benchmarks/validator_fast_path.py [--iterations 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import tracemalloc
+
+import jwt
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-with-at-least-32-bytes")
+os.environ.setdefault("DB_URL", "memory://")
+
+from fastapi import HTTPException, status
+from fastapi.security import SecurityScopes
+from harness import ameasure, measure, print_results
+
+from tp_auth_serverside import JWTUtil, UserInfoSchema
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.db.memorydb.login import set_token
+from tp_auth_serverside.utilities.scope_codec import ScopeCodec
+
+USER_ID = "user_099"
+CLAIMS = {
+    "user_id": USER_ID,
+    "username": "Admin",
+    "email": "admin@prismatica.in",
+    "scopes": [f"scope:{i}" for i in range(40)] + ["user:read", "user:write"],
+    "department": "platform",
+}
+REQUIRED = ["user:read", "user:write"]
+
+
+class PreviousValidator(AuthValidator):
+    async def __call__(self, security_scopes: SecurityScopes, token: str, user_id: str, refresh: bool = True):
+        if security_scopes.scopes:
+            authenticate_value = f"Bearer scope={security_scopes.scope_str}"
+        else:
+            authenticate_value = "Bearer"
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": authenticate_value},
+        )
+        try:
+            user_info = await self._load_user_info(user_id, token)
+            if user_info is None:
+                raise credentials_exception
+            available_scopes = user_info.scopes
+            if refresh:
+                await self._trigger_refresh(user_id, token)
+        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, jwt.InvalidSignatureError):
+            raise credentials_exception
+        for scope in security_scopes.scopes:
+            if not available_scopes or scope not in available_scopes:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Not enough permissions",
+                    headers={"WWW-Authenticate": authenticate_value},
+                )
+        return user_info
+
+
+def allocated(operation, calls: int = 500) -> float:
+    """Average transient memory in bytes allocated by one synchronous call."""
+    tracemalloc.start()
+    total = 0
+    for _ in range(calls):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        operation()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / calls
+
+
+async def aallocated(operation, calls: int = 500) -> float:
+    """Asynchronous `allocated`."""
+    tracemalloc.start()
+    total = 0
+    for _ in range(calls):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await operation()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / calls
+
+
+async def run(iterations: int) -> None:
+    jwt_util = JWTUtil()
+    validator = AuthValidator(jwt_util=jwt_util)
+    previous_validator = PreviousValidator(jwt_util=jwt_util)
+    short_token = await set_token(USER_ID, jwt_util.encode(dict(CLAIMS)))
+    security_scopes = SecurityScopes(scopes=REQUIRED)
+    payload = jwt_util.decode(jwt_util.encode(dict(CLAIMS)))
+    required = frozenset(REQUIRED)
+    codec = ScopeCodec(CLAIMS["scopes"])
+    user_mask, _ = codec.mask_of(CLAIMS["scopes"])
+    required_mask = codec.required_mask(REQUIRED)
+
+    def previous_call() -> object:
+        return previous_validator(security_scopes, token=short_token, user_id=USER_ID, refresh=False)
+
+    def current_call() -> object:
+        return validator(security_scopes, token=short_token, user_id=USER_ID, refresh=False)
+
+    sync_cases = {
+        "user_info/validate": lambda: UserInfoSchema(**payload),
+        "user_info/from_claims": lambda: UserInfoSchema.from_claims(payload),
+        # Kept to track pydantic: model_construct is still slower than validating through pydantic-core.
+        "user_info/construct": lambda: UserInfoSchema.model_construct(**payload),
+        "scopes/list_scan": lambda: all(scope in payload["scopes"] for scope in REQUIRED),
+        "scopes/set": lambda: required.issubset(payload["scopes"]),
+        "scopes/bitmask": lambda: required_mask & user_mask == required_mask,
+        "exception/eager": lambda: HTTPException(
+            status_code=401, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"}
+        ),
+    }
+    # Alternate the two validators and keep the best round of each to even out machine noise.
+    rounds = {"validator/previous": [], "validator/current": []}
+    for _ in range(3):
+        for name, call in (("validator/previous", previous_call), ("validator/current", current_call)):
+            rounds[name].append(await ameasure(name, lambda i, call=call: call(), iterations, warmup=500))
+    results = [max(measured, key=lambda result: result.ops_per_sec) for measured in rounds.values()]
+    allocations = {
+        "validator/previous": await aallocated(previous_call),
+        "validator/current": await aallocated(current_call),
+    }
+    for name, operation in sync_cases.items():
+        results.append(measure(name, lambda i, operation=operation: operation(), iterations, warmup=500))
+        allocations[name] = allocated(operation)
+
+    print_results(results)
+    names_token = jwt_util.encode(dict(CLAIMS))
+    bitmask_token = jwt_util.encode(codec.encode_claims(dict(CLAIMS)))
+    print(f"\ntoken bytes: {len(names_token)} with scope names, {len(bitmask_token)} with a scope bitmask")
+    print(f"\n{'case':<24}{'bytes/call':>12}")
+    for name, size in allocations.items():
+        print(f"{name:<24}{size:>12.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000, help="timed calls per case")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,51 @@
-from tp_auth_serverside.auth.auth_validator import AuthValidator, AuthValidatorInstance, UserInfo
-from tp_auth_serverside.auth.requestor import TPRequestor, TPRequestorInstance
-from tp_auth_serverside.auth.schemas import Token
-from tp_auth_serverside.auth.user_specs import UserInfoSchema
-from tp_auth_serverside.config import Secrets, SupportedAlgorithms
-from tp_auth_serverside.core.fastapi_configurer import FastAPIConfig, generate_fastapi_app
-from tp_auth_serverside.utilities.jwt_util import JWTUtil
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from tp_auth_serverside.auth.auth_validator import AuthValidator, AuthValidatorInstance, UserInfo
+    from tp_auth_serverside.auth.machine_token import MachineTokenProvider
+    from tp_auth_serverside.auth.requestor import TPRequestor, TPRequestorInstance
+    from tp_auth_serverside.auth.schemas import Token
+    from tp_auth_serverside.auth.user_specs import UserInfoSchema
+    from tp_auth_serverside.config import Secrets, SupportedAlgorithms
+    from tp_auth_serverside.core.fastapi_configurer import FastAPIConfig, generate_fastapi_app
+    from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+# Public names are imported on first access so that, for example, using `JWTUtil`
+# does not pay for FastAPI, gRPC, httpx and the Redis client.
+_LAZY_IMPORTS = {
+    "AuthValidator": "tp_auth_serverside.auth.auth_validator",
+    "AuthValidatorInstance": "tp_auth_serverside.auth.auth_validator",
+    "UserInfo": "tp_auth_serverside.auth.auth_validator",
+    "MachineTokenProvider": "tp_auth_serverside.auth.machine_token",
+    "TPRequestor": "tp_auth_serverside.auth.requestor",
+    "TPRequestorInstance": "tp_auth_serverside.auth.requestor",
+    "Token": "tp_auth_serverside.auth.schemas",
+    "UserInfoSchema": "tp_auth_serverside.auth.user_specs",
+    "Secrets": "tp_auth_serverside.config",
+    "SupportedAlgorithms": "tp_auth_serverside.config",
+    "FastAPIConfig": "tp_auth_serverside.core.fastapi_configurer",
+    "generate_fastapi_app": "tp_auth_serverside.core.fastapi_configurer",
+    "JWTUtil": "tp_auth_serverside.utilities.jwt_util",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_IMPORTS])
+
 
 __all__ = [
     "AuthValidator",
     "AuthValidatorInstance",
+    "MachineTokenProvider",
     "TPRequestor",
     "TPRequestorInstance",
     "UserInfo",
@@ -1,67 +1,238 @@
-import grpc
+import functools
+import time
+from typing import Optional
+
 import jwt
-from fastapi import Cookie, Depends, Header, HTTPException, status
+from fastapi import Cookie, Depends, Header, HTTPException, Request, status
 from fastapi.security import SecurityScopes
 from typing_extensions import Annotated
 
+from tp_auth_serverside.auth.machine_token import MachineTokenVerifier
+from tp_auth_serverside.auth.negative_cache import NegativeCache
+from tp_auth_serverside.auth.refresh_client import RefreshClient
+from tp_auth_serverside.auth.revocation_list import RevocationList, get_revocation_list
+from tp_auth_serverside.auth.session_cache import SessionCache, get_session_cache
+from tp_auth_serverside.auth.throttle import FailureThrottle
 from tp_auth_serverside.auth.user_specs import UserInfoSchema
 from tp_auth_serverside.config import Secrets, oauth2_scheme
 from tp_auth_serverside.db.memorydb.login import get_token
-from tp_auth_serverside.pb import refresh_pb2
-from tp_auth_serverside.pb.refresh_pb2_grpc import RefreshServiceStub
 from tp_auth_serverside.utilities.jwt_util import JWTUtil
+from tp_auth_serverside.utilities.metrics import metrics
+from tp_auth_serverside.utilities.scope_codec import decode_scopes, get_scope_codec
+
+
+@functools.lru_cache(maxsize=256)
+def _route_requirements(scopes: tuple[str, ...]) -> tuple[frozenset[str], Optional[int], dict[str, str]]:
+    """Required scope set and mask and `WWW-Authenticate` header of a route, computed once per scope list."""
+    authenticate_value = f"Bearer scope={' '.join(scopes)}" if scopes else "Bearer"
+    codec = get_scope_codec()
+    required_mask = codec.required_mask(scopes) if codec is not None else None
+    return frozenset(scopes), required_mask, {"WWW-Authenticate": authenticate_value}
+
+
+def _has_scopes(user_info: UserInfoSchema, required_scopes: frozenset[str], required_mask: Optional[int]) -> bool:
+    user_mask = user_info._scope_mask
+    if required_mask is not None and user_mask is not None:
+        return required_mask & user_mask == required_mask
+    return required_scopes.issubset(user_info.scopes or ())
+
+
+MACHINE_CACHE_SIZE = 1024
 
 
 class AuthValidator:
-    def __init__(self, jwt_util: JWTUtil = None) -> None:
+    def __init__(
+        self,
+        jwt_util: JWTUtil = None,
+        session_cache: SessionCache = None,
+        refresh_client: RefreshClient = None,
+        revocations: RevocationList = None,
+        negative_cache: NegativeCache = None,
+        throttle: FailureThrottle = None,
+        machine_tokens: bool = None,
+        machine_verifier: MachineTokenVerifier = None,
+    ) -> None:
         self.jwt_utils = jwt_util or JWTUtil()
+        self.refresh_client = refresh_client or RefreshClient()
+        # The shared revocation list and session cache are the ones the app lifespan starts and stops.
+        if revocations is None and Secrets.stateless_tokens:
+            revocations = get_revocation_list()
+        self.revocations = revocations
+        # Stateless tokens are verified locally, there is no session lookup to cache.
+        if session_cache is None and Secrets.session_cache_enabled and revocations is None:
+            session_cache = get_session_cache()
+        self.session_cache = session_cache
+        if negative_cache is None and Secrets.negative_cache_enabled:
+            negative_cache = NegativeCache()
+        self.negative_cache = negative_cache
+        if throttle is None and Secrets.auth_throttle_enabled:
+            throttle = FailureThrottle()
+        self.throttle = throttle
+        self.machine_tokens = Secrets.machine_tokens_enabled if machine_tokens is None else machine_tokens
+        if machine_verifier is None and self.machine_tokens:
+            machine_verifier = MachineTokenVerifier()
+        self.machine_verifier = machine_verifier
+        # Verified machine tokens until their expiry; services reuse one token for many calls.
+        self._machine_cache: dict[str, tuple[UserInfoSchema, float]] = {}
+
+    def _user_info(self, payload: dict) -> UserInfoSchema:
+        with metrics.stage("validator.user_info"):
+            claims, scope_mask = decode_scopes(payload)
+            try:
+                user_info = UserInfoSchema.from_claims(claims)
+            except ValueError as e:
+                raise jwt.InvalidTokenError(str(e)) from e
+            user_info._scope_mask = scope_mask
+        return user_info
+
+    def _machine_user_info(self, token: str, payload: dict) -> UserInfoSchema:
+        user_info = self._user_info(payload)
+        user_info._machine = True
+        if len(self._machine_cache) >= MACHINE_CACHE_SIZE:
+            self._machine_cache.clear()
+        self._machine_cache[token] = (user_info, payload.get("exp", 0))
+        return user_info
+
+    async def _verify_jwt(self, user_id: str | None, token: str) -> UserInfoSchema | None:
+        """Verify a token carrying the JWT itself without touching the session store.
+
+        Machine tokens are verified with the key of the service that signed them, stateless tokens are
+        checked against the revocations in memory.
+        """
+        machine_verifier = self.machine_verifier
+        if machine_verifier is not None:
+            cached = self._machine_cache.get(token)
+            if cached is not None and cached[1] > time.time():
+                user_info = cached[0]
+                return user_info if not user_id or user_info.user_id == user_id else None
+            service_id = machine_verifier.service_of(token)
+            if service_id is not None:
+                with metrics.stage("validator.jwt_decode"):
+                    payload = await machine_verifier.adecode(service_id, token)
+                if user_id and service_id != user_id:
+                    return None
+                metrics.count("validator.machine")
+                return self._machine_user_info(token, payload)
+        with metrics.stage("validator.jwt_decode"):
+            payload = await self.jwt_utils.adecode(token)
+        if user_id and payload.get("user_id") != user_id:
+            return None
+        if payload.get("token_type") != "access" or self.revocations is None:
+            return None
+        # Validators used outside the app lifespan start following the revocations on first use.
+        if not self.revocations.following:
+            await self.revocations.start()
+        if self.revocations.is_revoked(payload.get("user_id"), payload.get("jti"), payload.get("iat", 0)):
+            metrics.count("validator.revoked")
+            return None
+        return self._user_info(payload)
+
+    async def _load_user_info(self, user_id: str | None, token: str | None) -> UserInfoSchema | None:
+        if not token:
+            return None
+        # Session handles never contain dots, JWTs always do.
+        if self.revocations is not None or (self.machine_verifier is not None and "." in token):
+            return await self._verify_jwt(user_id, token)
+        if not user_id:
+            return None
+        cache = self.session_cache
+        if cache is not None:
+            user_info = cache.get(user_id, token)
+            if user_info is not None:
+                metrics.count("session_cache.hit")
+                return user_info
+            metrics.count("session_cache.miss")
+            generation = cache.generation
+        with metrics.stage("validator.session_store"):
+            jwt_token = await get_token(user_id, token)
+        if not jwt_token:
+            return None
+        # With sliding expiry the session field TTL in Redis is authoritative, not the JWT exp.
+        sliding = Secrets.sliding_expiry
+        with metrics.stage("validator.jwt_decode"):
+            payload = await self.jwt_utils.adecode(jwt_token, verify_exp=not sliding)
+        if payload.get("token_type") != "access":
+            return None
+        user_info = self._user_info(payload)
+        if cache is not None:
+            exp = None if sliding else payload.get("exp")
+            cache.put(user_id, token, user_info, exp=exp, generation=generation)
+        return user_info
+
+    def _identities(self, request: Optional[Request]) -> list[tuple[str, str]]:
+        # Keyed on the client address only: the user id cookie is chosen by the client, throttling it would
+        # let anyone lock a user out by sending bad tokens under their user id.
+        client = self.throttle.client_address(request) if request is not None else None
+        return [("client", client)] if client is not None else []
+
+    async def _authenticate(
+        self, request: Optional[Request], user_id: Optional[str], token: Optional[str], headers: dict[str, str]
+    ) -> UserInfoSchema:
+        """Load the user of the credentials, turning away throttled identities and recently rejected credentials.
+
+        Both checks run before the session store is touched, so repeated bad credentials cost no round trip.
+        Only requests presenting a token are throttled, a missing token costs nothing to turn away.
+        """
+        throttle = self.throttle if token else None
+        identities = self._identities(request) if throttle is not None else ()
+        if throttle is not None:
+            retry_after = throttle.retry_after(identities)
+            if retry_after:
+                metrics.count("throttle.rejected")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many failed authentication attempts",
+                    headers={"Retry-After": str(retry_after)},
+                )
+        negative_cache = self.negative_cache
+        user_info = None
+        if negative_cache is not None and (user_id, token) in negative_cache:
+            metrics.count("negative_cache.hit")
+        else:
+            try:
+                user_info = await self._load_user_info(user_id, token)
+            except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, jwt.InvalidSignatureError):
+                user_info = None
+            if user_info is None and negative_cache is not None and token:
+                negative_cache.add(user_id, token)
+        if user_info is None:
+            metrics.count("validator.unauthorized")
+            if throttle is not None:
+                throttle.record_failure(identities)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers=dict(headers),
+            )
+        return user_info
 
     async def _trigger_refresh(self, user_id: str, token: str) -> None:
-        try:
-            async with grpc.aio.insecure_channel(Secrets.refresh_url) as channel:
-                stub = RefreshServiceStub(channel)
-                request = refresh_pb2.RefreshRequest(user_id=user_id, token=token)
-                await stub.RefreshToken(request)
-        except Exception:
-            pass
+        await self.refresh_client.trigger(user_id, token)
 
     async def __call__(
         self,
         security_scopes: SecurityScopes,
         token: Annotated[str, Depends(oauth2_scheme)],
-        user_id: Annotated[str, Cookie()],
+        user_id: Annotated[Optional[str], Cookie()] = None,
         refresh: Annotated[bool, Header()] = True,
+        request: Request = None,
     ) -> UserInfoSchema:
-        if security_scopes.scopes:
-            authenticate_value = f"Bearer scope={security_scopes.scope_str}"
-        else:
-            authenticate_value = "Bearer"
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": authenticate_value},
-        )
-        try:
-            jwt_token = await get_token(user_id, token)
-            if not jwt_token:
-                raise credentials_exception
-            payload = self.jwt_utils.decode(jwt_token)
-            if payload.get("token_type") != "access":
-                raise credentials_exception
-            user_info = UserInfoSchema(**payload)
-            available_scopes = user_info.scopes
-            if refresh:
-                await self._trigger_refresh(user_id, token)
-        except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, jwt.InvalidSignatureError):
-            raise credentials_exception
-        for scope in security_scopes.scopes:
-            if not available_scopes or scope not in available_scopes:
+        required_scopes, required_mask, headers = _route_requirements(tuple(security_scopes.scopes))
+        with metrics.stage("validator"):
+            user_info = await self._authenticate(request, user_id, token, headers)
+            # A refresh re-signs the stored session copy, which stateless and machine clients do not hold.
+            if refresh and self.revocations is None and not user_info._machine:
+                with metrics.stage("validator.refresh"):
+                    await self._trigger_refresh(user_id, token)
+            if required_scopes and not _has_scopes(user_info, required_scopes, required_mask):
+                metrics.count("validator.forbidden")
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail="Not enough permissions",
-                    headers={"WWW-Authenticate": authenticate_value},
+                    headers=dict(headers),
                 )
-        return user_info
+            metrics.count("validator.authorized")
+            return user_info
 
 
 AuthValidatorInstance = AuthValidator()
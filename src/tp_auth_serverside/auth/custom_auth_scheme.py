@@ -3,10 +3,15 @@ from typing import Optional
 from fastapi import HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 
+from tp_auth_serverside.config import Secrets
+
 
 class CustomOAuth2PasswordBearer(OAuth2PasswordBearer):
     async def __call__(self, request: Request) -> Optional[str]:
         token = request.cookies.get("access_token")
+        if not token and (Secrets.stateless_tokens or Secrets.machine_tokens_enabled):
+            # Stateless and machine tokens are self-contained, so clients without cookies may send them as bearer.
+            return await super().__call__(request)
         if not token:
             if self.auto_error:
                 raise HTTPException(
@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from typing import Optional
+
+import jwt
+
+from tp_auth_serverside.config import Secrets, SupportedAlgorithms
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+from tp_auth_serverside.utilities.keyset import KeySet, load_key
+from tp_auth_serverside.utilities.metrics import metrics
+from tp_auth_serverside.utilities.scope_codec import decode_scopes, encode_scopes
+
+MACHINE_TOKEN_TYPE = "machine"
+# Machine tokens name the service whose key signed them in their `kid` header.
+MACHINE_KID_PREFIX = "machine:"
+
+
+def machine_key_id(service_id: str) -> str:
+    return f"{MACHINE_KID_PREFIX}{service_id}"
+
+
+class MachineTokenProvider:
+    """Service tokens for calls a service makes as itself rather than on behalf of a user.
+
+    Tokens are JWTs of type `machine` for `MACHINE_TOKEN_SERVICE_ID` with `MACHINE_TOKEN_SCOPES`,
+    signed locally with the service's own `MACHINE_TOKEN_KEY` and valid for `MACHINE_TOKEN_EXPIRY`
+    minutes. The token is reused until `MACHINE_TOKEN_REFRESH_SECONDS` before it expires; from then
+    on callers keep getting it while a single background task mints its successor. A custom
+    `jwt_util` has to sign with the `kid` of `machine_key_id(service_id)`.
+    """
+
+    def __init__(
+        self,
+        service_id: str = None,
+        scopes: list[str] = None,
+        expiry: int = None,
+        refresh_seconds: int = None,
+        key: str = None,
+        jwt_util: JWTUtil = None,
+    ) -> None:
+        self._service_id = service_id
+        self._scopes = scopes
+        self._expiry = expiry
+        self._refresh_seconds = refresh_seconds
+        self._key = key
+        self._jwt_util = jwt_util
+        self._token: Optional[str] = None
+        self._refresh_at = 0.0
+        self._expires_at = 0.0
+        self._minting: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def service_id(self) -> str:
+        service_id = self._service_id or Secrets.machine_token_service_id
+        if not service_id:
+            raise ValueError("MACHINE_TOKEN_SERVICE_ID must be set to issue machine tokens")
+        return service_id
+
+    @functools.cached_property
+    def scopes(self) -> list[str]:
+        return list(Secrets.machine_token_scopes if self._scopes is None else self._scopes)
+
+    @functools.cached_property
+    def expiry(self) -> int:
+        return self._expiry or Secrets.machine_token_expiry
+
+    @functools.cached_property
+    def refresh_seconds(self) -> float:
+        refresh_seconds = (
+            Secrets.machine_token_refresh_seconds if self._refresh_seconds is None else self._refresh_seconds
+        )
+        # Short lived tokens are still reused for at least half of their lifetime.
+        return min(refresh_seconds, self.expiry * 30)
+
+    @functools.cached_property
+    def jwt_util(self) -> JWTUtil:
+        if self._jwt_util is not None:
+            return self._jwt_util
+        key = self._key or Secrets.machine_token_key
+        if not key:
+            raise ValueError("MACHINE_TOKEN_KEY must be set to issue machine tokens")
+        algorithm = SupportedAlgorithms(Secrets.algorithm)
+        signing_key = load_key(algorithm, key, private=algorithm.asymmetric)
+        keyset = KeySet(algorithm, signing_key=signing_key, signing_kid=machine_key_id(self.service_id))
+        return JWTUtil(token_type=MACHINE_TOKEN_TYPE, algorithm=algorithm, keyset=keyset)
+
+    def _claims(self) -> dict:
+        return encode_scopes({"user_id": self.service_id, "username": self.service_id, "scopes": list(self.scopes)})
+
+    def _store(self, token: str, minted_at: float) -> str:
+        self._token = token
+        self._expires_at = minted_at + self.expiry * 60
+        self._refresh_at = self._expires_at - self.refresh_seconds
+        metrics.count("machine_token.minted")
+        return token
+
+    def token(self) -> str:
+        """The current token, signed inline when there is none or it is due for refresh."""
+        token = self._token
+        if token is not None and time.monotonic() < self._refresh_at:
+            return token
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._refresh_at:
+                minted_at = time.monotonic()
+                self._store(self.jwt_util.encode(self._claims(), self.expiry), minted_at)
+            return self._token
+
+    async def atoken(self) -> str:
+        """The current token, waiting for a new one only when there is no unexpired token."""
+        token = self._token
+        now = time.monotonic()
+        if token is not None and now < self._refresh_at:
+            return token
+        minting = self._mint()
+        if token is not None and now < self._expires_at:
+            return token
+        return await asyncio.shield(minting)
+
+    def _mint(self) -> asyncio.Task:
+        """The task signing the next token, started unless one is already running on this loop."""
+        minting = self._minting
+        if minting is None or minting.done() or minting.get_loop() is not asyncio.get_running_loop():
+            minting = self._minting = asyncio.ensure_future(self._sign())
+            minting.add_done_callback(_log_failure)
+        return minting
+
+    async def _sign(self) -> str:
+        minted_at = time.monotonic()
+        return self._store(await self.jwt_util.aencode(self._claims(), self.expiry), minted_at)
+
+    def invalidate(self) -> None:
+        """Drop the current token, e.g. after rotating the signing key."""
+        with self._lock:
+            self._token = None
+            self._refresh_at = self._expires_at = 0.0
+
+
+class MachineTokenVerifier:
+    """Verify machine tokens with the key and scope allow-list of the service that signed them.
+
+    `MACHINE_TOKEN_SERVICES` maps the id of every service whose tokens are accepted to the key
+    verifying them (`SECRET_KEY`-like for HS256, otherwise a public key) and the scopes it may
+    grant itself. Tokens are matched to a service by their `kid` header and verified with that
+    key alone. Tokens naming another service, or granting a scope outside the allow-list, are
+    rejected, and so are tokens of services missing from the map.
+    """
+
+    def __init__(self, services: dict = None) -> None:
+        self._config = services
+
+    @functools.cached_property
+    def _services(self) -> dict[str, tuple[JWTUtil, frozenset[str]]]:
+        services = Secrets.machine_token_services if self._config is None else self._config
+        algorithm = SupportedAlgorithms(Secrets.algorithm)
+        verifiers = {}
+        for service_id, service in (services or {}).items():
+            kid = machine_key_id(service_id)
+            keyset = KeySet(algorithm, verification_keys={kid: load_key(algorithm, service["key"])})
+            jwt_util = JWTUtil(token_type=MACHINE_TOKEN_TYPE, algorithm=algorithm, keyset=keyset)
+            verifiers[service_id] = (jwt_util, frozenset(service.get("scopes") or ()))
+        return verifiers
+
+    @staticmethod
+    def service_of(token: str) -> Optional[str]:
+        """Service id named by the `kid` header of a machine token, None for any other token."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        if isinstance(kid, str) and kid.startswith(MACHINE_KID_PREFIX):
+            return kid[len(MACHINE_KID_PREFIX) :]
+        return None
+
+    async def adecode(self, service_id: str, token: str) -> dict:
+        """Verified claims of a machine token of `service_id`, `jwt.InvalidTokenError` when it is not accepted."""
+        service = self._services.get(service_id)
+        if service is None:
+            raise jwt.InvalidTokenError(f"Machine tokens of service {service_id!r} are not accepted")
+        jwt_util, allowed_scopes = service
+        payload = await jwt_util.adecode(token)
+        if payload.get("token_type") != MACHINE_TOKEN_TYPE or payload.get("user_id") != service_id:
+            raise jwt.InvalidTokenError(f"Token is not a machine token of service {service_id!r}")
+        claims, _ = decode_scopes(payload)
+        if not allowed_scopes.issuperset(claims.get("scopes") or ()):
+            raise jwt.InvalidTokenError(f"Machine token grants scopes not allowed for service {service_id!r}")
+        return payload
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Error issuing machine token: {task.exception()}")
+
+
+machine_tokens = MachineTokenProvider()
+
+__all__ = ["MACHINE_TOKEN_TYPE", "MachineTokenProvider", "MachineTokenVerifier", "machine_key_id", "machine_tokens"]
@@ -0,0 +1,46 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from tp_auth_serverside.config import Secrets
+
+
+class NegativeCache:
+    """In-process LRU/TTL set of recently rejected `(user_id, token)` pairs for `AuthValidator`.
+
+    A pair seen again within `NEGATIVE_CACHE_TTL` seconds is rejected without a session lookup or
+    JWT decode. Session handles are random, so a rejected handle never becomes valid later; the
+    short TTL only bounds how long a session read too early from a lagging replica stays rejected.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None) -> None:
+        self.max_size = max_size or Secrets.negative_cache_size
+        self.ttl = ttl or Secrets.negative_cache_ttl
+        self._entries: OrderedDict[tuple[Optional[str], str], float] = OrderedDict()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: tuple[Optional[str], str]) -> bool:
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, user_id: Optional[str], token: str) -> None:
+        key = (user_id, token)
+        self._entries[key] = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+__all__ = ["NegativeCache"]
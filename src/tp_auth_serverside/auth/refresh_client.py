@@ -0,0 +1,177 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import grpc
+
+from tp_auth_serverside.config import RefreshDispatchMode, Secrets
+from tp_auth_serverside.pb import refresh_pb2
+from tp_auth_serverside.pb.refresh_pb2_grpc import RefreshServiceStub
+from tp_auth_serverside.utilities.grpc_options import channel_options, compression
+from tp_auth_serverside.utilities.hot_logging import hot_log
+
+
+class RefreshClient:
+    """Long-lived gRPC client used by resource servers to trigger session refreshes.
+
+    Channels are created once per event loop, each with a connection of its own, and reused
+    round-robin. `REFRESH_URL` may be a `unix:` address for an authorization server on the same
+    host. Refreshes for the same `(user_id, token)` are coalesced so at most one RPC is sent per
+    coalescing window.
+    In `background` mode refreshes are queued on a bounded queue and sent by worker tasks,
+    so request handling never waits on the authorization server. `batch` mode queues the same
+    way but workers gather everything pending within a short window into one `BatchRefresh` RPC.
+    """
+
+    def __init__(
+        self,
+        target: str = None,
+        pool_size: int = None,
+        mode: RefreshDispatchMode = None,
+        queue_size: int = None,
+        workers: int = None,
+        deadline: float = None,
+        coalesce_window: float = None,
+        batch_size: int = None,
+        batch_window_ms: int = None,
+    ) -> None:
+        self.target = target or Secrets.refresh_url
+        self.pool_size = max(pool_size or Secrets.refresh_channel_pool_size, 1)
+        self.mode = mode or Secrets.refresh_dispatch_mode
+        self.queue_size = queue_size or Secrets.refresh_queue_size
+        self.workers = max(workers or Secrets.refresh_workers, 1)
+        self.deadline = deadline or Secrets.refresh_deadline_seconds
+        self.coalesce_window = Secrets.refresh_coalesce_seconds if coalesce_window is None else coalesce_window
+        self.batch_size = max(batch_size or Secrets.refresh_batch_size, 1)
+        self.batch_window = (Secrets.refresh_batch_window_ms if batch_window_ms is None else batch_window_ms) / 1000
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._channels: list[grpc.aio.Channel] = []
+        self._stubs: Optional[itertools.cycle] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._recent: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self.dropped = 0
+
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Channels and queues belong to a single event loop, start over when the loop changes.
+        self._loop = loop
+        self._channels = [
+            grpc.aio.insecure_channel(self.target, options=channel_options(), compression=compression())
+            for _ in range(self.pool_size)
+        ]
+        self._stubs = itertools.cycle([RefreshServiceStub(channel) for channel in self._channels])
+        self._queue = None
+        self._worker_tasks = []
+
+    def _should_send(self, user_id: str, token: str) -> bool:
+        now = time.monotonic()
+        recent = self._recent
+        while recent:
+            key, sent_at = next(iter(recent.items()))
+            if now - sent_at < self.coalesce_window:
+                break
+            recent.popitem(last=False)
+        key = (user_id, token)
+        if key in recent:
+            return False
+        recent[key] = now
+        return True
+
+    async def _send(self, user_id: str, token: str) -> None:
+        self._bind()
+        request = refresh_pb2.RefreshRequest(user_id=user_id, token=token)
+        await next(self._stubs).RefreshToken(request, timeout=self.deadline)
+
+    async def _send_batch(self, sessions: list[tuple[str, str]]) -> None:
+        self._bind()
+        request = refresh_pb2.BatchRefreshRequest(
+            requests=[refresh_pb2.RefreshRequest(user_id=user_id, token=token) for user_id, token in sessions]
+        )
+        await next(self._stubs).BatchRefresh(request, timeout=self.deadline)
+
+    async def _batch_worker(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await asyncio.sleep(self.batch_window)
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._send_batch(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                hot_log.debug("refresh_client.batch_failed", "Batched refresh of %d sessions failed: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _worker(self) -> None:
+        while True:
+            user_id, token = await self._queue.get()
+            try:
+                await self._send(user_id, token)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                hot_log.debug("refresh_client.failed", "Background refresh failed: %s", e)
+            finally:
+                self._queue.task_done()
+
+    def _ensure_workers(self) -> None:
+        self._bind()
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            worker = self._batch_worker if self.mode == RefreshDispatchMode.BATCH else self._worker
+            self._worker_tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+
+    async def refresh(self, user_id: str, token: str) -> None:
+        """Send a refresh and wait for it, bounded by the per-RPC deadline."""
+        if not self._should_send(user_id, token):
+            return
+        try:
+            await self._send(user_id, token)
+        except Exception as e:
+            hot_log.debug("refresh_client.failed", "Refresh failed: %s", e)
+
+    def dispatch(self, user_id: str, token: str) -> None:
+        """Queue a refresh without waiting for it. Refreshes are dropped when the queue is full."""
+        if not self._should_send(user_id, token):
+            return
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((user_id, token))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            # Allow a later request to retry the dropped refresh.
+            self._recent.pop((user_id, token), None)
+
+    async def trigger(self, user_id: str, token: str) -> None:
+        if self.mode in (RefreshDispatchMode.BACKGROUND, RefreshDispatchMode.BATCH):
+            self.dispatch(user_id, token)
+        else:
+            await self.refresh(user_id, token)
+
+    async def start(self) -> None:
+        self._bind()
+        if self.mode in (RefreshDispatchMode.BACKGROUND, RefreshDispatchMode.BATCH):
+            self._ensure_workers()
+
+    async def close(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        await asyncio.gather(*(channel.close() for channel in self._channels), return_exceptions=True)
+        self._loop = None
+        self._channels = []
+        self._stubs = None
+        self._queue = None
+        self._worker_tasks = []
+        self._recent.clear()
+
+
+__all__ = ["RefreshClient"]
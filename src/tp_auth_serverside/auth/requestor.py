@@ -1,17 +1,32 @@
-from typing import Any, override
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator, Iterable, Optional, override
 
 import httpx
 from fastapi import Depends
 from typing_extensions import Annotated
 
+from tp_auth_serverside.auth.machine_token import MachineTokenProvider, machine_tokens
 from tp_auth_serverside.config import oauth2_scheme
+from tp_auth_serverside.utilities.http_clients import (
+    SlotHoldingStream,
+    acquire_async_host_slot,
+    async_host_slot,
+    cookie_header,
+    get_async_http_client,
+    get_http_client,
+    host_slot,
+)
 
 
 class TPRequestor:
     """A class to handle requests to the TP Resource Servers.
 
     Supports synchronous and asynchronous requests.
-    Uses the `httpx` library to make requests.
+    Uses the `httpx` library to make requests through process-wide pooled clients,
+    so connections are kept alive across calls and users. The caller's bearer token is added per
+    request, no `Authorization` header is sent without one. Calls made as the service itself, e.g.
+    in background jobs, carry its machine token instead, see `as_service`.
     For all available parameters, see the `httpx` documentation.
 
     Supports the following methods:
@@ -27,14 +42,27 @@ class TPRequestor:
     - aio_post
     - aio_put
     - aio_request
+    - aio_stream
+    - aio_gather
+    - aio_as_completed
 
     """
 
     def __init__(self, token: Annotated[str, Depends(oauth2_scheme)]) -> None:
         self.__dict__["_token"] = token
+        self.__dict__["_machine_tokens"] = None
+
+    @classmethod
+    def as_service(cls, provider: MachineTokenProvider = None) -> "TPRequestor":
+        """A requestor calling as this service with the machine tokens of `provider`."""
+        requestor = cls(None)
+        requestor.__dict__["_machine_tokens"] = provider or machine_tokens
+        return requestor
 
     @property
-    def token(self):
+    def token(self) -> Optional[str]:
+        if self._machine_tokens is not None:
+            return self._machine_tokens.token()
         return self._token
 
     @override
@@ -42,106 +70,166 @@ class TPRequestor:
         """Prevent setting attributes"""
         raise AttributeError("Cannot set attributes")
 
-    def _update_headers(self, headers: dict) -> dict:
-        headers.update({"Authorization": f"Bearer {self.token}"})
+    def _update_headers(self, headers: dict, token: Optional[str]) -> dict:
+        if token:
+            headers.update({"Authorization": f"Bearer {token}"})
         headers.update({"refresh": "false"})
         return headers
 
+    def _prepare(self, kwargs: dict, token: Optional[str]) -> dict:
+        """Attach the per-request headers; the pooled clients themselves carry no user state."""
+        headers = self._update_headers(dict(kwargs.pop("headers", None) or {}), token)
+        cookies = cookie_header(kwargs.pop("cookies", None))
+        if cookies:
+            headers["Cookie"] = cookies
+        kwargs["headers"] = headers
+        return kwargs
+
     def delete(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        with httpx.Client(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return client.delete(**kwargs)
+        return self.request(method="DELETE", **kwargs)
 
     def get(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        with httpx.Client(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return client.get(**kwargs)
+        return self.request(method="GET", **kwargs)
 
     def patch(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        with httpx.Client(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return client.patch(**kwargs)
+        return self.request(method="PATCH", **kwargs)
 
     def post(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        with httpx.Client(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return client.post(**kwargs)
+        return self.request(method="POST", **kwargs)
 
     def put(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        with httpx.Client(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return client.put(**kwargs)
+        return self.request(method="PUT", **kwargs)
 
     def request(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        with httpx.Client(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
+        client = get_http_client(kwargs.pop("verify", False))
+        kwargs = self._prepare(kwargs, self.token)
+        with host_slot(kwargs["url"]):
             return client.request(**kwargs)
 
     async def aio_delete(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        async with httpx.AsyncClient(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return await client.delete(**kwargs)
+        return await self.aio_request(method="DELETE", **kwargs)
 
     async def aio_get(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        async with httpx.AsyncClient(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return await client.get(**kwargs)
+        return await self.aio_request(method="GET", **kwargs)
 
     async def aio_patch(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        async with httpx.AsyncClient(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return await client.patch(**kwargs)
+        return await self.aio_request(method="PATCH", **kwargs)
 
     async def aio_post(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        async with httpx.AsyncClient(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return await client.post(**kwargs)
+        return await self.aio_request(method="POST", **kwargs)
 
     async def aio_put(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        async with httpx.AsyncClient(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return await client.put(**kwargs)
+        return await self.aio_request(method="PUT", **kwargs)
 
     async def aio_request(self, **kwargs) -> httpx.Response:
-        headers = kwargs.pop("headers", {})
-        self._update_headers(headers)
-        async with httpx.AsyncClient(
-            headers=headers, cookies=kwargs.pop("cookies", None), verify=kwargs.pop("verify", False)
-        ) as client:
-            return await client.request(**kwargs)
+        return await self._aio_send(kwargs)
+
+    @contextlib.asynccontextmanager
+    async def aio_stream(self, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Send a request without buffering the body, read it with `response.aiter_bytes()` and friends."""
+        response = await self._aio_send(kwargs, stream=True)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def aio_gather(
+        self,
+        requests: Iterable[dict],
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        return_exceptions: bool = True,
+    ) -> list[httpx.Response | BaseException]:
+        """Send `requests` (keyword arguments of `aio_request`) concurrently and return results in order.
+
+        At most `concurrency` requests are in flight and all of them share the `timeout` deadline.
+        With `return_exceptions`, failed and timed out requests are returned as exceptions next to the
+        successful responses; otherwise the first failure cancels the remaining requests and is raised.
+        """
+        requests = list(requests)
+        results: list[httpx.Response | BaseException] = [None] * len(requests)
+        async for index, result in self.aio_as_completed(requests, concurrency, timeout, return_exceptions):
+            results[index] = result
+        return results
+
+    async def aio_as_completed(
+        self,
+        requests: Iterable[dict],
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        return_exceptions: bool = True,
+        stream: bool = False,
+    ) -> AsyncIterator[tuple[int, httpx.Response | BaseException]]:
+        """Yield `(index, response)` pairs as the concurrently sent `requests` complete.
+
+        Takes the same arguments as `aio_gather`. With `stream`, bodies are not buffered and a response
+        stays readable until the iteration advances, after which it is closed. Requests still in flight
+        are cancelled when the iteration stops early.
+        """
+        loop = asyncio.get_running_loop()
+        requests = list(requests)
+        semaphore = asyncio.Semaphore(max(concurrency or len(requests), 1))
+        deadline = loop.time() + timeout if timeout is not None else None
+
+        async def send(index: int, kwargs: dict) -> tuple[int, httpx.Response | Exception]:
+            async with semaphore:
+                try:
+                    return index, await self._aio_send(dict(kwargs), stream=stream)
+                except Exception as e:
+                    return index, e
+
+        pending = {asyncio.ensure_future(send(index, kwargs)): index for index, kwargs in enumerate(requests)}
+        try:
+            while pending:
+                remaining = None if deadline is None else max(deadline - loop.time(), 0)
+                done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    error = TimeoutError(f"Requests did not complete within {timeout} seconds")
+                    if not return_exceptions:
+                        raise error
+                    for index in sorted(pending.values()):
+                        yield index, error
+                    break
+                for task in done:
+                    index, result = task.result()
+                    if isinstance(result, Exception) and not return_exceptions:
+                        raise result
+                    del pending[task]
+                    try:
+                        yield index, result
+                    finally:
+                        if stream and isinstance(result, httpx.Response):
+                            await result.aclose()
+        finally:
+            for task in pending:
+                task.cancel()
+            for outcome in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(outcome, tuple) and isinstance(outcome[1], httpx.Response):
+                    await outcome[1].aclose()
+
+    async def _aio_send(self, kwargs: dict, stream: bool = False) -> httpx.Response:
+        client = get_async_http_client(kwargs.pop("verify", False))
+        token = self._token if self._machine_tokens is None else await self._machine_tokens.atoken()
+        kwargs = self._prepare(kwargs, token)
+        if not stream:
+            async with async_host_slot(kwargs["url"]):
+                return await client.request(**kwargs)
+        send_kwargs = {
+            "auth": kwargs.pop("auth", httpx.USE_CLIENT_DEFAULT),
+            "follow_redirects": kwargs.pop("follow_redirects", httpx.USE_CLIENT_DEFAULT),
+        }
+        # A streamed body is still read over the connection, so the slot is held until the response is closed.
+        release = await acquire_async_host_slot(kwargs["url"])
+        try:
+            response = await client.send(client.build_request(**kwargs), stream=True, **send_kwargs)
+        except BaseException:
+            release()
+            raise
+        if response.is_closed:
+            release()
+        else:
+            response.stream = SlotHoldingStream(response.stream, release)
+        return response
 
 
 TPRequestorInstance = Annotated[TPRequestor, Depends(TPRequestor)]
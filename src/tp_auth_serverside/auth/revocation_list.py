@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import Optional
+
+from tp_auth_serverside.config import Secrets
+from tp_auth_serverside.db.memorydb import get_login_db
+from tp_auth_serverside.db.memorydb.revocation import (
+    REVOCATION_CHANNEL,
+    Revocation,
+    add_revocation_listener,
+    decode_revocation,
+    get_revocations,
+    remove_revocation_listener,
+)
+
+
+class RevocationList:
+    """In-process copy of the revoked stateless tokens for `AuthValidator`.
+
+    Revocations published by this process are applied before they are stored, those of other
+    processes are received over Redis pub/sub as they are published. The whole set is reloaded
+    from its snapshot after every (re)subscription and every `REVOCATION_SNAPSHOT_SECONDS`, which
+    catches up on anything missed while disconnected. Lookups never touch Redis, so the last known
+    revocations keep being enforced through an outage. Until the first snapshot has loaded every
+    token counts as revoked. Entries are forgotten once every token they cover has expired.
+    """
+
+    def __init__(self, snapshot_interval: int = None) -> None:
+        self.snapshot_interval = snapshot_interval or Secrets.revocation_snapshot_seconds
+        self.retention = (Secrets.expiry + Secrets.leeway) * 60
+        # (user_id, short_token) -> forget at, for single sessions.
+        self._sessions: dict[tuple[str, str], float] = {}
+        # user_id -> (revoked at, forget at), for every token of a user issued until then.
+        self._users: dict[str, tuple[float, float]] = {}
+        self._tasks: list[asyncio.Task] = []
+        self.synced_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions) + len(self._users)
+
+    def is_revoked(self, user_id: str, short_token: Optional[str], issued_at: float) -> bool:
+        if self.synced_at is None:
+            return True
+        if short_token is not None and (user_id, short_token) in self._sessions:
+            return True
+        user = self._users.get(user_id)
+        return user is not None and issued_at < user[0]
+
+    def add(self, revocation: Revocation) -> None:
+        user_id, short_token, revoked_at = revocation
+        forget_at = revoked_at + self.retention
+        if short_token:
+            self._sessions[(user_id, short_token)] = forget_at
+            return
+        previous = self._users.get(user_id)
+        if previous is None or revoked_at > previous[0]:
+            self._users[user_id] = (revoked_at, forget_at)
+
+    def prune(self, now: float = None) -> None:
+        now = time.time() if now is None else now
+        self._sessions = {key: forget_at for key, forget_at in self._sessions.items() if forget_at > now}
+        self._users = {user_id: entry for user_id, entry in self._users.items() if entry[1] > now}
+
+    async def sync(self) -> None:
+        # Merged rather than swapped in, so revocations received while the snapshot loads are kept.
+        for revocation in await get_revocations():
+            self.add(revocation)
+        self.prune()
+        self.synced_at = time.time()
+
+    @property
+    def following(self) -> bool:
+        """Whether the background tasks keeping the list current are running."""
+        return bool(self._tasks) and not self._tasks[1].done()
+
+    async def start(self) -> None:
+        """Load the revocations in effect, then follow them in the background.
+
+        Concurrent and repeated calls wait for the same first load, the list is restarted when the
+        event loop it followed on has gone. A failed first load is logged and retried by the listener,
+        tokens are rejected until it succeeds.
+        """
+        if not self.following:
+            remove_revocation_listener(self.add)
+            add_revocation_listener(self.add)
+            self._tasks = [
+                asyncio.create_task(self._load()),
+                asyncio.create_task(self._listen()),
+                asyncio.create_task(self._resync()),
+            ]
+        await asyncio.shield(self._tasks[0])
+
+    async def stop(self) -> None:
+        remove_revocation_listener(self.add)
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _load(self) -> None:
+        try:
+            await self.sync()
+        except Exception as e:
+            logging.error(f"Loading the revocations failed, stateless tokens are rejected until they load: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = get_login_db().pubsub()
+            try:
+                await pubsub.psubscribe(REVOCATION_CHANNEL)
+                await self.sync()
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self.add(decode_revocation(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Revocation listener failed, serving the last known revocations: {e}")
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(1)
+
+    async def _resync(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logging.warning(f"Revocation snapshot failed, serving the last known revocations: {e}")
+
+
+@functools.lru_cache(maxsize=1)
+def get_revocation_list() -> RevocationList:
+    """Revocation list shared by every `AuthValidator` built without one of its own."""
+    return RevocationList()
+
+
+__all__ = ["RevocationList", "get_revocation_list"]
@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from tp_auth_serverside.auth.user_specs import UserInfoSchema
+from tp_auth_serverside.config import Secrets
+from tp_auth_serverside.db.memorydb import get_login_db, keyspace_pubsubs, login_db_index
+from tp_auth_serverside.db.memorydb.keys import login_user_id
+from tp_auth_serverside.db.memorydb.login import add_session_listener, remove_session_listener
+
+# Keyspace event classes required for invalidation: K (keyspace channel), g (DEL/EXPIRE), h (hash commands).
+REQUIRED_KEYSPACE_FLAGS = "Kgh"
+
+
+class SessionCache:
+    """In-process LRU/TTL cache of verified sessions for `AuthValidator`.
+
+    Entries map `(user_id, short_token)` to an already decoded `UserInfoSchema` and live until the JWT
+    `exp` or the configured TTL, whichever is sooner. Every entry of a user is dropped as soon as the
+    login hash of that user is touched (login, refresh, revoke, expiry), which is observed through Redis
+    keyspace notifications, from every primary in cluster mode. Sessions revoked or refreshed by this
+    process are dropped as soon as the change is written, without waiting for the notification. The cache
+    only serves entries while the notification listener is subscribed.
+    """
+
+    def __init__(self, max_size: int = None, ttl: int = None) -> None:
+        self.max_size = max_size or Secrets.session_cache_size
+        self.ttl = ttl or Secrets.session_cache_ttl
+        self._entries: OrderedDict[tuple[str, str], tuple[UserInfoSchema, float]] = OrderedDict()
+        self._user_index: dict[str, set[str]] = {}
+        self._generation = 0
+        self._active = False
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    @property
+    def generation(self) -> int:
+        """Invalidation counter, taken before a lookup and handed back to `put`."""
+        return self._generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str, short_token: str) -> Optional[UserInfoSchema]:
+        if not self._active:
+            return None
+        key = (user_id, short_token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        user_info, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return user_info
+
+    def put(
+        self,
+        user_id: str,
+        short_token: str,
+        user_info: UserInfoSchema,
+        exp: Optional[float] = None,
+        generation: Optional[int] = None,
+    ) -> None:
+        # Skip writes racing with an invalidation that arrived while the session was being fetched.
+        if not self._active or (generation is not None and generation != self._generation):
+            return
+        ttl = self.ttl if exp is None else min(self.ttl, exp - time.time())
+        if ttl <= 0:
+            return
+        key = (user_id, short_token)
+        self._entries[key] = (user_info, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        self._user_index.setdefault(user_id, set()).add(short_token)
+        while len(self._entries) > self.max_size:
+            oldest, _ = self._entries.popitem(last=False)
+            self._unindex(oldest)
+
+    def invalidate(self, user_id: str, short_token: str = None) -> None:
+        self._generation += 1
+        if short_token:
+            self._discard((user_id, short_token))
+            return
+        for cached_token in self._user_index.pop(user_id, ()):
+            self._entries.pop((user_id, cached_token), None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._user_index.clear()
+
+    def _discard(self, key: tuple[str, str]) -> None:
+        if self._entries.pop(key, None) is not None:
+            self._unindex(key)
+
+    def _unindex(self, key: tuple[str, str]) -> None:
+        user_id, short_token = key
+        tokens = self._user_index.get(user_id)
+        if tokens is not None:
+            tokens.discard(short_token)
+            if not tokens:
+                del self._user_index[user_id]
+
+    async def start(self) -> None:
+        if self._listener is None:
+            # Changes made by this process are applied at once, the keyspace events may arrive later.
+            add_session_listener(self.invalidate)
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        remove_session_listener(self.invalidate)
+        self._active = False
+        self.clear()
+
+    async def _keyspace_events_enabled(self) -> bool:
+        try:
+            config = await get_login_db().config_get("notify-keyspace-events")
+        except Exception as e:
+            # CONFIG is commonly disabled on managed servers. Without proof that notifications are
+            # published, cached sessions could outlive a logout on another instance.
+            logging.warning(f"Session cache disabled: notify-keyspace-events could not be read: {e}")
+            return False
+        flags = config.get("notify-keyspace-events", "")
+        enabled = set(flags.replace("A", "g$lshzxetd"))
+        if not all(flag in enabled for flag in REQUIRED_KEYSPACE_FLAGS):
+            logging.warning(f"Session cache disabled: notify-keyspace-events must include '{REQUIRED_KEYSPACE_FLAGS}'")
+            return False
+        return True
+
+    async def _listen(self) -> None:
+        if not await self._keyspace_events_enabled():
+            return
+        channel_prefix = f"__keyspace@{login_db_index()}__:"
+        while True:
+            pubsubs = keyspace_pubsubs()
+            try:
+                for pubsub in pubsubs:
+                    await pubsub.psubscribe(f"{channel_prefix}*")
+                self._active = True
+                # A task group stops every node listener as soon as one of them fails.
+                async with asyncio.TaskGroup() as listeners:
+                    for pubsub in pubsubs:
+                        listeners.create_task(self._consume(pubsub, channel_prefix))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Session cache invalidation listener failed: {e}")
+            finally:
+                self._active = False
+                self.clear()
+                await asyncio.gather(*(pubsub.aclose() for pubsub in pubsubs), return_exceptions=True)
+            await asyncio.sleep(1)
+
+    async def _consume(self, pubsub, channel_prefix: str) -> None:
+        async for message in pubsub.listen():
+            if message["type"] == "pmessage":
+                user_id = login_user_id(message["channel"][len(channel_prefix) :])
+                if user_id is not None:
+                    self.invalidate(user_id)
+
+
+@functools.lru_cache(maxsize=1)
+def get_session_cache() -> SessionCache:
+    """Session cache shared by every `AuthValidator` built without one of its own."""
+    return SessionCache()
+
+
+__all__ = ["SessionCache", "get_session_cache"]
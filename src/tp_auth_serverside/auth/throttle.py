@@ -0,0 +1,96 @@
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional
+
+from fastapi import Request
+
+from tp_auth_serverside.config import Secrets
+
+
+class FailureThrottle:
+    """In-process token buckets of failed authentications per identity for `AuthValidator`.
+
+    Every identity (a client address for `AuthValidator`) may fail `AUTH_THROTTLE_BURST` times, and the
+    allowance refills at `AUTH_THROTTLE_RATE` failures per second. Once it is used up, requests of
+    that identity are turned away before any credential check until the next failure is allowed
+    again. Successful requests cost nothing. The least recently failed identities are forgotten
+    beyond `AUTH_THROTTLE_MAX_IDENTITIES`. Behind the proxies of `AUTH_THROTTLE_TRUSTED_PROXIES`
+    the client address is taken from `X-Forwarded-For`.
+    """
+
+    def __init__(
+        self,
+        rate: float = None,
+        burst: int = None,
+        max_identities: int = None,
+        trusted_proxies: list[str] = None,
+    ) -> None:
+        self.rate = rate or Secrets.auth_throttle_rate
+        self.burst = burst or Secrets.auth_throttle_burst
+        self.max_identities = max_identities or Secrets.auth_throttle_max_identities
+        trusted_proxies = Secrets.auth_throttle_trusted_proxies if trusted_proxies is None else trusted_proxies
+        self.trusted_proxies = [ipaddress.ip_network(proxy.strip(), strict=False) for proxy in trusted_proxies]
+        # identity -> (allowance, updated at)
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_proxies)
+
+    def client_address(self, request: Request) -> Optional[str]:
+        """Address of the client, the right-most `X-Forwarded-For` entry not added by a trusted proxy."""
+        if request.client is None:
+            return None
+        address = request.client.host
+        if not self.trusted_proxies or not self._trusted(address):
+            return address
+        # Entries left of the last untrusted one may be forged by the client itself.
+        for hop in reversed(request.headers.get("x-forwarded-for", "").split(",")):
+            hop = hop.strip()
+            if not hop:
+                continue
+            address = hop
+            if not self._trusted(hop):
+                break
+        return address
+
+    def _allowance(self, identity: Hashable, now: float) -> float:
+        bucket = self._buckets.get(identity)
+        if bucket is None:
+            return self.burst
+        allowance, updated_at = bucket
+        return min(self.burst, allowance + (now - updated_at) * self.rate)
+
+    def retry_after(self, identities: Iterable[Hashable]) -> int:
+        """Seconds until every identity may fail again, 0 when the request may proceed."""
+        if not self._buckets:
+            return 0
+        now = time.monotonic()
+        wait = max((1 - self._allowance(identity, now) for identity in identities), default=0)
+        if wait <= 0:
+            return 0
+        self.rejected += 1
+        return max(math.ceil(wait / self.rate), 1)
+
+    def record_failure(self, identities: Iterable[Hashable]) -> None:
+        now = time.monotonic()
+        for identity in identities:
+            self._buckets[identity] = (max(self._allowance(identity, now) - 1, 0), now)
+            self._buckets.move_to_end(identity)
+        while len(self._buckets) > self.max_identities:
+            self._buckets.popitem(last=False)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+__all__ = ["FailureThrottle"]
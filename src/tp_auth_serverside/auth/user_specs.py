@@ -1,6 +1,7 @@
+import functools
 from typing import Optional
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 
 
 class UserInfoSchema(BaseModel):
@@ -9,3 +10,35 @@ class UserInfoSchema(BaseModel):
     email: Optional[str] = None
     user_id: str
     scopes: Optional[list[str]] = None
+    # Bitmask of `scopes` over the scope table when the token carried them compactly.
+    _scope_mask: Optional[int] = PrivateAttr(None)
+    # Set for machine tokens, which identify a service and have no session behind them.
+    _machine: bool = PrivateAttr(False)
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "UserInfoSchema":
+        """Build the user info of a verified token without validating its claims again.
+
+        Equal to `UserInfoSchema(**claims)` for the claims this package issues, the signature already
+        vouches for them. Raises `ValueError` when the claims carry no `user_id`.
+        """
+        user_id = claims.get("user_id")
+        if not isinstance(user_id, str):
+            raise ValueError("Claims carry no user_id")
+        fields = {
+            "username": claims.get("username"),
+            "email": claims.get("email"),
+            "user_id": user_id,
+            "scopes": claims.get("scopes"),
+        }
+        user_info = cls.__new__(cls)
+        object.__setattr__(user_info, "__dict__", fields)
+        object.__setattr__(user_info, "__pydantic_extra__", {k: v for k, v in claims.items() if k not in fields})
+        object.__setattr__(user_info, "__pydantic_fields_set__", set(claims))
+        object.__setattr__(user_info, "__pydantic_private__", dict(_private_defaults(cls)))
+        return user_info
+
+
+@functools.cache
+def _private_defaults(cls: type[UserInfoSchema]) -> dict:
+    return {name: attribute.get_default() for name, attribute in cls.__private_attributes__.items()}
@@ -1,11 +1,12 @@
 from enum import StrEnum
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Optional
 
 from pydantic import BeforeValidator, Field, model_validator
 from pydantic_settings import BaseSettings
 from typing_extensions import Annotated
 
-from tp_auth_serverside.auth.custom_auth_scheme import CustomOAuth2PasswordBearer
+if TYPE_CHECKING:
+    from tp_auth_serverside.auth.custom_auth_scheme import CustomOAuth2PasswordBearer
 
 
 def options_decoder(v):
@@ -20,6 +21,52 @@ OptionsType = Annotated[Any, BeforeValidator(options_decoder)]
 class SupportedAlgorithms(StrEnum):
     HS256 = "HS256"
     RS256 = "RS256"
+    ES256 = "ES256"
+    EdDSA = "EdDSA"
+
+    @property
+    def asymmetric(self) -> bool:
+        return self != SupportedAlgorithms.HS256
+
+
+class CryptoExecutor(StrEnum):
+    NONE = "none"
+    THREAD = "thread"
+    PROCESS = "process"
+
+
+class RefreshDispatchMode(StrEnum):
+    AWAIT = "await"
+    BACKGROUND = "background"
+    BATCH = "batch"
+
+
+class RefreshCompression(StrEnum):
+    NONE = "none"
+    GZIP = "gzip"
+    DEFLATE = "deflate"
+
+
+class ReplicaReads(StrEnum):
+    OFF = "off"
+    FALLBACK = "fallback"
+    STALE = "stale"
+
+
+class SessionRecordFormat(StrEnum):
+    JSON = "json"
+    BINARY = "binary"
+    COMPRESSED = "compressed"
+
+
+class SessionEviction(StrEnum):
+    OLDEST = "oldest"
+    LEAST_RECENTLY_REFRESHED = "lru"
+
+
+class ScopeEncoding(StrEnum):
+    NAMES = "names"
+    BITMASK = "bitmask"
 
 
 class _Service(BaseSettings):
@@ -31,52 +78,194 @@ class _Service(BaseSettings):
     cors_allow_credentials: bool = True
     cors_allow_methods: OptionsType = ["GET", "POST", "DELETE", "PUT", "OPTIONS", "PATCH"]
     cors_allow_headers: OptionsType = ["*"]
+    http_client_http2: Optional[bool] = False
+    http_client_timeout: Optional[float] = 10.0
+    http_client_connect_timeout: Optional[float] = 5.0
+    http_client_max_connections: Optional[int] = 100
+    http_client_max_keepalive_connections: Optional[int] = 20
+    http_client_keepalive_expiry: Optional[float] = 30.0
+    http_client_max_connections_per_host: Optional[int] = 0
+    metrics_enabled: Optional[bool] = False
+    metrics_url: Optional[str] = "/metrics"
+    tracing_enabled: Optional[bool] = False
+    log_rate_limit: Optional[float] = 10
+    log_sample_rates: Optional[dict] = None
+    log_queue_enabled: Optional[bool] = False
+    log_queue_size: Optional[int] = 10000
 
 
 class _Database(BaseSettings):
+    db_url: Optional[str] = None
     login_redis_db: Optional[int] = 9
     refresh_restrict_db: Optional[int] = 8
+    redis_connection_type: Optional[str] = "direct"
+    redis_master_service: Optional[str] = None
+    db_pool_max_connections: Optional[int] = 50
+    db_socket_timeout: Optional[float] = 5.0
+    db_socket_connect_timeout: Optional[float] = 5.0
+    db_health_check_interval: Optional[int] = 30
+    db_replica_url: Optional[str] = None
+    db_replica_reads: Optional[ReplicaReads] = ReplicaReads.OFF
+    session_record_format: Optional[SessionRecordFormat] = SessionRecordFormat.JSON
 
 
 class _Secrets(BaseSettings):
     public_key: Optional[str] = Field(None, env="PUBLIC_KEY")
     private_key: Optional[str] = Field(None, env="PRIVATE_KEY")
     secret_key: Optional[str] = Field(None, env="SECRET_KEY")
+    key_id: Optional[str] = Field(None, env="KEY_ID")
+    verification_keys: Optional[dict] = Field(None, env="VERIFICATION_KEYS")
     algorithm: Optional[SupportedAlgorithms] = Field(default=SupportedAlgorithms.HS256, env="ALGORITHM")
     issuer: Optional[str] = Field("prismaticain", env="ISSUER")
     leeway: Optional[int] = Field(10, env="LEEWAY")
     expiry: Optional[int] = Field(1440, env="EXPIRY")
     authorization_server: Optional[bool] = Field(False, env="AUTHORIZATION_SERVER")
     scopes: Optional[dict] = Field(None, alias="AUTH_SCOPES")
+    scope_encoding: Optional[ScopeEncoding] = Field(default=ScopeEncoding.NAMES, env="SCOPE_ENCODING")
+    scope_table_version: Optional[int] = Field(1, env="SCOPE_TABLE_VERSION")
     token_url: Optional[str] = Field("/token", env="TOKEN_URL")
     refresh_url: Optional[str] = Field("/refresh", env="REFRESH_URL")
     refresh_restrict_minutes: Optional[int] = Field(2, env="REFRESH_RESTRICT_MINUTES")
+    crypto_executor: Optional[CryptoExecutor] = Field(default=CryptoExecutor.NONE, env="CRYPTO_EXECUTOR")
+    crypto_workers: Optional[int] = Field(4, env="CRYPTO_WORKERS")
+    crypto_batch_size: Optional[int] = Field(64, env="CRYPTO_BATCH_SIZE")
+    crypto_batch_window_ms: Optional[int] = Field(0, env="CRYPTO_BATCH_WINDOW_MS")
+    sliding_expiry: Optional[bool] = Field(False, env="SLIDING_EXPIRY")
+    resign_threshold_minutes: Optional[int] = Field(60, env="RESIGN_THRESHOLD_MINUTES")
+    refresh_dispatch_mode: Optional[RefreshDispatchMode] = Field(
+        default=RefreshDispatchMode.AWAIT, env="REFRESH_DISPATCH_MODE"
+    )
+    refresh_channel_pool_size: Optional[int] = Field(2, env="REFRESH_CHANNEL_POOL_SIZE")
+    refresh_queue_size: Optional[int] = Field(1024, env="REFRESH_QUEUE_SIZE")
+    refresh_workers: Optional[int] = Field(4, env="REFRESH_WORKERS")
+    refresh_deadline_seconds: Optional[float] = Field(2.0, env="REFRESH_DEADLINE_SECONDS")
+    refresh_coalesce_seconds: Optional[float] = Field(30, env="REFRESH_COALESCE_SECONDS")
+    refresh_batch_size: Optional[int] = Field(500, env="REFRESH_BATCH_SIZE")
+    refresh_batch_window_ms: Optional[int] = Field(50, env="REFRESH_BATCH_WINDOW_MS")
+    refresh_server_urls: Optional[list[str]] = Field(None, env="REFRESH_SERVER_URLS")
+    refresh_max_concurrent_rpcs: Optional[int] = Field(None, env="REFRESH_MAX_CONCURRENT_RPCS")
+    refresh_keepalive_seconds: Optional[int] = Field(None, env="REFRESH_KEEPALIVE_SECONDS")
+    refresh_keepalive_timeout_seconds: Optional[int] = Field(20, env="REFRESH_KEEPALIVE_TIMEOUT_SECONDS")
+    refresh_max_connection_age_seconds: Optional[int] = Field(None, env="REFRESH_MAX_CONNECTION_AGE_SECONDS")
+    refresh_max_connection_age_grace_seconds: Optional[int] = Field(
+        None, env="REFRESH_MAX_CONNECTION_AGE_GRACE_SECONDS"
+    )
+    refresh_compression: Optional[RefreshCompression] = Field(
+        default=RefreshCompression.NONE, env="REFRESH_COMPRESSION"
+    )
+    session_cache_enabled: Optional[bool] = Field(False, env="SESSION_CACHE_ENABLED")
+    session_cache_size: Optional[int] = Field(4096, env="SESSION_CACHE_SIZE")
+    session_cache_ttl: Optional[int] = Field(60, env="SESSION_CACHE_TTL")
+    negative_cache_enabled: Optional[bool] = Field(False, env="NEGATIVE_CACHE_ENABLED")
+    negative_cache_size: Optional[int] = Field(10000, env="NEGATIVE_CACHE_SIZE")
+    negative_cache_ttl: Optional[float] = Field(10, env="NEGATIVE_CACHE_TTL")
+    auth_throttle_enabled: Optional[bool] = Field(False, env="AUTH_THROTTLE_ENABLED")
+    auth_throttle_rate: Optional[float] = Field(1.0, env="AUTH_THROTTLE_RATE")
+    auth_throttle_burst: Optional[int] = Field(20, env="AUTH_THROTTLE_BURST")
+    auth_throttle_max_identities: Optional[int] = Field(100000, env="AUTH_THROTTLE_MAX_IDENTITIES")
+    auth_throttle_trusted_proxies: Optional[list[str]] = Field([], env="AUTH_THROTTLE_TRUSTED_PROXIES")
+    stateless_tokens: Optional[bool] = Field(False, env="STATELESS_TOKENS")
+    revocation_snapshot_seconds: Optional[int] = Field(60, env="REVOCATION_SNAPSHOT_SECONDS")
+    max_sessions_per_user: Optional[int] = Field(None, env="MAX_SESSIONS_PER_USER")
+    session_eviction: Optional[SessionEviction] = Field(default=SessionEviction.OLDEST, env="SESSION_EVICTION")
+    machine_tokens_enabled: Optional[bool] = Field(False, env="MACHINE_TOKENS_ENABLED")
+    machine_token_service_id: Optional[str] = Field(None, env="MACHINE_TOKEN_SERVICE_ID")
+    machine_token_scopes: Optional[list[str]] = Field([], env="MACHINE_TOKEN_SCOPES")
+    machine_token_expiry: Optional[int] = Field(15, env="MACHINE_TOKEN_EXPIRY")
+    machine_token_refresh_seconds: Optional[int] = Field(60, env="MACHINE_TOKEN_REFRESH_SECONDS")
+    machine_token_key: Optional[str] = Field(None, env="MACHINE_TOKEN_KEY")
+    machine_token_services: Optional[dict] = Field(None, env="MACHINE_TOKEN_SERVICES")
 
     @model_validator(mode="before")
     def check_secrets(cls, values) -> dict:
-        algorithm = values.get("algorithm", SupportedAlgorithms.HS256)
-        if algorithm == SupportedAlgorithms.RS256:
+        algorithm = SupportedAlgorithms(values.get("algorithm", SupportedAlgorithms.HS256))
+        if algorithm.asymmetric:
             import base64
+            import json
 
             if not values.get("public_key"):
-                raise ValueError("Public key must be provided for RS256 algorithm")
+                raise ValueError(f"Public key must be provided for {algorithm} algorithm")
             public_bytes = values["public_key"].encode("utf-8")
             values["public_key"] = base64.b64decode(public_bytes).decode("utf-8")
-            if values["authorization_server"] and not values["private_key"]:
-                raise ValueError("Private key must be provided for RS256 algorithm when used as authorization server")
+            if values.get("authorization_server") and not values.get("private_key"):
+                raise ValueError(
+                    f"Private key must be provided for {algorithm} algorithm when used as authorization server"
+                )
             private_bytes = values.get("private_key")
             if private_bytes:
                 private_bytes = private_bytes.encode("utf-8")
                 values["private_key"] = base64.b64decode(private_bytes).decode("utf-8")
+            verification_keys = values.get("verification_keys")
+            if isinstance(verification_keys, str):
+                verification_keys = json.loads(verification_keys)
+            if verification_keys:
+                values["verification_keys"] = {
+                    kid: base64.b64decode(key.encode("utf-8")).decode("utf-8") for kid, key in verification_keys.items()
+                }
+            if values.get("machine_token_key"):
+                values["machine_token_key"] = base64.b64decode(values["machine_token_key"].encode("utf-8")).decode(
+                    "utf-8"
+                )
+            machine_token_services = values.get("machine_token_services")
+            if isinstance(machine_token_services, str):
+                machine_token_services = json.loads(machine_token_services)
+            if machine_token_services:
+                values["machine_token_services"] = {
+                    service_id: {**service, "key": base64.b64decode(service["key"].encode("utf-8")).decode("utf-8")}
+                    for service_id, service in machine_token_services.items()
+                }
         elif algorithm == SupportedAlgorithms.HS256:
             if not values.get("secret_key"):
                 raise ValueError("Secret key must be provided for HS256 algorithm")
         return values
 
 
-Secrets = _Secrets()
-Service = _Service()
-Database = _Database()
-oauth2_scheme = CustomOAuth2PasswordBearer(tokenUrl=Secrets.token_url, scopes=Secrets.scopes, auto_error=False)
+Secrets: _Secrets
+Service: _Service
+Database: _Database
+oauth2_scheme: "CustomOAuth2PasswordBearer"
+
+
+def _oauth2_scheme():
+    from tp_auth_serverside.auth.custom_auth_scheme import CustomOAuth2PasswordBearer
+
+    secrets = _setting("Secrets")
+    return CustomOAuth2PasswordBearer(tokenUrl=secrets.token_url, scopes=secrets.scopes, auto_error=False)
+
+
+# Settings are read from the environment on first access rather than at import,
+# and building `oauth2_scheme` is what pulls in FastAPI.
+_LAZY_SETTINGS = {
+    "Secrets": _Secrets,
+    "Service": _Service,
+    "Database": _Database,
+    "oauth2_scheme": _oauth2_scheme,
+}
+
+
+def _setting(name: str) -> Any:
+    if name not in globals():
+        globals()[name] = _LAZY_SETTINGS[name]()
+    return globals()[name]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _setting(name)
+
 
-__all__ = ["Secrets", "SupportedAlgorithms", "Database", "Service", "oauth2_scheme"]
+__all__ = [
+    "Secrets",
+    "SupportedAlgorithms",
+    "RefreshDispatchMode",
+    "CryptoExecutor",
+    "ScopeEncoding",
+    "RefreshCompression",
+    "ReplicaReads",
+    "SessionRecordFormat",
+    "SessionEviction",
+    "Database",
+    "Service",
+    "oauth2_scheme",
+]
@@ -1,10 +1,9 @@
 import logging
-from concurrent import futures
 from contextlib import asynccontextmanager
 from typing import Callable, Optional, Tuple
 
 from asgi_correlation_id import CorrelationIdMiddleware
-from fastapi import APIRouter, Cookie, Depends, FastAPI, Request, Response
+from fastapi import APIRouter, Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import ORJSONResponse
@@ -15,8 +14,13 @@ from typing_extensions import Annotated
 from tp_auth_serverside.auth.auth_validator import AuthValidatorInstance
 from tp_auth_serverside.auth.schemas import Token
 from tp_auth_serverside.auth.user_specs import UserInfoSchema
-from tp_auth_serverside.config import Secrets, Service
+from tp_auth_serverside.config import Secrets, Service, oauth2_scheme
 from tp_auth_serverside.core.handler.authentication_handler import AuthenticationHandler
+from tp_auth_serverside.db.memorydb import close_pools, open_pools
+from tp_auth_serverside.utilities.crypto_executor import shutdown_crypto_executor
+from tp_auth_serverside.utilities.hot_logging import start_log_queue, stop_log_queue
+from tp_auth_serverside.utilities.http_clients import close_http_clients
+from tp_auth_serverside.utilities.metrics import CONTENT_TYPE, metrics
 
 
 class FastAPIConfig(BaseModel):
@@ -86,6 +90,19 @@ def add_health_check(app: FastAPI, health_check_routine: Callable = None, asynce
     return app
 
 
+def add_metrics(app: FastAPI) -> FastAPI:
+    if metrics.enabled:
+
+        @app.get(Service.metrics_url, name="Metrics", tags=["Operational Services"], include_in_schema=False)
+        async def export_metrics():
+            """
+            This function returns the auth pipeline metrics in the Prometheus text format.
+            """
+            return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+    return app
+
+
 def add_security(app: FastAPI, routers: list[APIRouter]) -> FastAPI:
     [app.include_router(router, dependencies=[Depends(AuthValidatorInstance)]) for router in routers]
     return app
@@ -126,7 +143,7 @@ def add_logout_route(app: FastAPI, handler: Callable = None, asynced: bool = Fal
     async def logout(
         request: Request,
         response: Response,
-        access_token: Annotated[str, Cookie()],
+        access_token: Annotated[str, Depends(oauth2_scheme)],
         user: Annotated[UserInfoSchema, Depends(AuthValidatorInstance)],
     ) -> StatusResponse:
         if handler is not None:
@@ -149,11 +166,21 @@ async def start_refresh_service():
 
     from tp_auth_serverside.core.handler.refresh_handler import RefreshHandler
     from tp_auth_serverside.pb import refresh_pb2_grpc
-
-    server = grpc.aio.server(futures.ThreadPoolExecutor(max_workers=2))
+    from tp_auth_serverside.utilities.grpc_options import compression, remove_stale_socket, server_options
+
+    # The handlers are coroutines served on the event loop, no thread pool is involved. Beyond
+    # `REFRESH_MAX_CONCURRENT_RPCS` calls are rejected with RESOURCE_EXHAUSTED instead of queueing up.
+    server = grpc.aio.server(
+        options=server_options(),
+        maximum_concurrent_rpcs=Secrets.refresh_max_concurrent_rpcs,
+        compression=compression(),
+    )
     refresh_pb2_grpc.add_RefreshServiceServicer_to_server(RefreshHandler(), server)
-    server.add_insecure_port(Secrets.refresh_url)
-    logging.info(f"Starting refresh service on {Secrets.refresh_url}")
+    urls = Secrets.refresh_server_urls or [Secrets.refresh_url]
+    for url in urls:
+        remove_stale_socket(url)
+        server.add_insecure_port(url)
+    logging.info(f"Starting refresh service on {', '.join(urls)}")
     await server.start()
     logging.info("Refresh service started")
     return server
@@ -167,30 +194,57 @@ def generate_fastapi_app(
     logout_route_handler: Optional[Callable | Tuple[Callable, bool]] = None,
     health_check_routine: Optional[Callable | Tuple[Callable, bool]] = None,
 ) -> FastAPI:
-    # Create lifespan context manager for gRPC server lifecycle
+    # Create lifespan context manager for pools, HTTP clients, gRPC server, refresh client, session cache and revocations
     @asynccontextmanager
-    async def lifespan_with_grpc(app: FastAPI):
+    async def lifespan_with_services(app: FastAPI):
         grpc_server = None
+        session_cache = AuthValidatorInstance.session_cache
+        revocations = AuthValidatorInstance.revocations
+        refresh_client = AuthValidatorInstance.refresh_client
+        # Startup: Move hot path logging off the request path
+        if Service.log_queue_enabled:
+            start_log_queue()
+        # Startup: Open the memory database connection pools
+        await open_pools()
         # Startup: Start the gRPC refresh service
         if Secrets.authorization_server:
             logging.info("Initializing gRPC refresh service...")
             grpc_server = await start_refresh_service()
-
-        # Call user-provided lifespan if exists
-        if app_config.lifespan:
-            async with app_config.lifespan(app):
+        # Startup: Open the refresh channel pool
+        await refresh_client.start()
+        # Startup: Subscribe the session cache to login invalidations
+        if session_cache is not None:
+            await session_cache.start()
+        # Startup: Load and subscribe to the revocations of stateless tokens
+        if revocations is not None:
+            await revocations.start()
+
+        # Everything started above is shut down even when the user lifespan or the app fails.
+        try:
+            # Call user-provided lifespan if exists
+            if app_config.lifespan:
+                async with app_config.lifespan(app):
+                    yield
+            else:
                 yield
-        else:
-            yield
-
-        # Shutdown: Stop the gRPC server gracefully
-        if grpc_server:
-            logging.info("Shutting down gRPC refresh service...")
-            await grpc_server.stop(grace=5)
-            logging.info("gRPC refresh service stopped")
-
-    # Use the combined lifespan if authorization_server is enabled
-    final_lifespan = lifespan_with_grpc if Secrets.authorization_server else app_config.lifespan
+        finally:
+            # Shutdown: Stop the session cache and revocation listeners and close the refresh channel pool
+            if session_cache is not None:
+                await session_cache.stop()
+            if revocations is not None:
+                await revocations.stop()
+            await refresh_client.close()
+            # Shutdown: Stop the gRPC server gracefully
+            if grpc_server:
+                logging.info("Shutting down gRPC refresh service...")
+                await grpc_server.stop(grace=5)
+                logging.info("gRPC refresh service stopped")
+            # Shutdown: Release the crypto pool, the outgoing HTTP clients and the memory database connection pools
+            shutdown_crypto_executor()
+            await close_http_clients()
+            await close_pools()
+            # Shutdown: Write out the queued log records
+            stop_log_queue()
 
     app = FastAPI(
         title=app_config.title,
@@ -200,7 +254,7 @@ def generate_fastapi_app(
         openapi_url=app_config.openapi_url,
         docs_url=app_config.docs_url,
         redoc_url=app_config.redoc_url,
-        lifespan=final_lifespan,
+        lifespan=lifespan_with_services,
         exception_handlers=app_config.exception_handlers,
         default_response_class=ORJSONResponse,
     )
@@ -209,6 +263,7 @@ def generate_fastapi_app(
         app = add_health_check(app, health_check_routine[0], health_check_routine[1])
     else:
         app = add_health_check(app)
+    app = add_metrics(app)
     app = add_security(app, routers)
     app = add_cors(app)
     if token_route_handler:
@@ -1,22 +1,50 @@
-from fastapi import Response
+import jwt
+import shortuuid
+from fastapi import HTTPException, Response, status
 
 from tp_auth_serverside.auth.user_specs import UserInfoSchema
+from tp_auth_serverside.config import Secrets
 from tp_auth_serverside.db.memorydb.login import revoke_token, set_token
 from tp_auth_serverside.db.memorydb.refresh import set_restrict_refresh
 from tp_auth_serverside.utilities.jwt_util import JWTUtil
+from tp_auth_serverside.utilities.metrics import metrics
+from tp_auth_serverside.utilities.scope_codec import encode_scopes
 
 
 class AuthenticationHandler:
     async def authenticate(self, response: Response, user_id: str, payload: UserInfoSchema):
         jwt_util = JWTUtil()
-        jwt_token = jwt_util.encode(payload.model_dump())
-        token = await set_token(user_id, jwt_token)
-        await set_restrict_refresh(user_id, token)
+        claims = encode_scopes(payload.model_dump())
+        short_token = None
+        if Secrets.stateless_tokens:
+            # The session handle doubles as the token id revocations refer to.
+            short_token = claims["jti"] = shortuuid.uuid()
+        with metrics.stage("authenticate.sign"):
+            jwt_token = await jwt_util.aencode(claims)
+        with metrics.stage("authenticate.store"):
+            token = await set_token(user_id, jwt_token, short_token=short_token)
+            await set_restrict_refresh(user_id, token)
+        metrics.count("authenticate.issued")
+        if Secrets.stateless_tokens:
+            token = jwt_token
         response.set_cookie(key="user_id", value=user_id, httponly=True, secure=True, samesite="strict")
         response.set_cookie(key="access_token", value=token, httponly=True, secure=True, samesite="strict")
         return token
 
     async def revoke_authentication(self, response: Response, user_id: str, token: str):
+        if Secrets.stateless_tokens:
+            # Without its id the token could only be revoked by revoking every session of the user.
+            try:
+                claims = await JWTUtil().adecode(token)
+            except jwt.InvalidTokenError:
+                claims = {}
+            token = claims.get("jti")
+            if not token or claims.get("user_id") != user_id:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
         await revoke_token(user_id, token)
         response.delete_cookie(key="user_id")
         response.delete_cookie(key="access_token")
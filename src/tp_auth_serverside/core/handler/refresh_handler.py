@@ -1,29 +1,113 @@
-import logging
+import asyncio
+import time
 
-from tp_auth_serverside.db.memorydb.login import get_token, set_token
-from tp_auth_serverside.db.memorydb.refresh import is_refresh_restricted, set_restrict_refresh
+from tp_auth_serverside.config import Secrets
+from tp_auth_serverside.db.memorydb.login import extend_tokens, get_token_records, replace_tokens
+from tp_auth_serverside.db.memorydb.refresh import claim_refreshes, release_refreshes
 from tp_auth_serverside.pb import refresh_pb2
 from tp_auth_serverside.pb.refresh_pb2_grpc import RefreshServiceServicer
+from tp_auth_serverside.utilities.hot_logging import Masked, hot_log
 from tp_auth_serverside.utilities.jwt_util import JWTUtil
+from tp_auth_serverside.utilities.metrics import metrics
 
 
 class RefreshHandler(RefreshServiceServicer):
     async def RefreshToken(self, request, context):
-        user_id = request.user_id
-        token = request.token
-        if await is_refresh_restricted(user_id, token):
-            logging.warning(f"Refresh token is restricted for user_id: {user_id}, token: {token}")
-            return refresh_pb2.RefreshResponse()
-        jwt_token = await get_token(user_id, token)
-        if not jwt_token:
-            return refresh_pb2.RefreshResponse()
-        jwt_util = JWTUtil()
-        try:
-            logging.info(f"Refreshing token for user_id: {user_id}, token: {token}")
-            payload = jwt_util.decode(jwt_token)
-            jwt_token = jwt_util.encode(payload=payload)
-            await set_token(user_id, jwt_token, short_token=token)
-            await set_restrict_refresh(user_id, token)
-        except Exception as e:
-            logging.error(f"Error refreshing token for user_id: {user_id}, token: {token}, error: {e}")
+        with metrics.stage("refresh"):
+            await self._refresh_many([request])
         return refresh_pb2.RefreshResponse()
+
+    async def BatchRefresh(self, request, context):
+        with metrics.stage("refresh.batch"):
+            refreshed = await self._refresh_many(request.requests)
+        return refresh_pb2.BatchRefreshResponse(refreshed=refreshed)
+
+    async def StreamRefresh(self, request_iterator, context):
+        refreshed = 0
+        pending = []
+        async for request in request_iterator:
+            pending.append(request)
+            if len(pending) >= Secrets.refresh_batch_size:
+                refreshed += await self._refresh_many(pending)
+                pending = []
+        if pending:
+            refreshed += await self._refresh_many(pending)
+        return refresh_pb2.BatchRefreshResponse(refreshed=refreshed)
+
+    async def _refresh_many(self, requests) -> int:
+        """Refresh sessions with a read and a claim round trip, local signing and one conditional write.
+
+        Restrictions are only claimed for sessions that were found, and are lifted again for
+        sessions that could not be signed or written, so a failed refresh can be retried.
+        The write-back only lands on sessions that still hold the record that was signed,
+        so a logout racing with a refresh is never undone. With sliding expiry, sessions whose
+        JWT is not close to its own `exp` only get their field expiry extended, skipping signing.
+        """
+        sessions = list(dict.fromkeys((request.user_id, request.token) for request in requests))
+        if not sessions:
+            return 0
+        metrics.count("refresh.requested", len(sessions))
+        with metrics.stage("refresh.read"):
+            found = [
+                (session, jwt_token, record)
+                for session, (jwt_token, record) in zip(sessions, await get_token_records(sessions))
+                if jwt_token
+            ]
+            claimed = await claim_refreshes([session for session, _, _ in found]) if found else []
+        jwt_util = JWTUtil()
+        sliding = Secrets.sliding_expiry
+        resign_before = time.time() + Secrets.resign_threshold_minutes * 60
+        updates = []
+        extensions = []
+        failed = []
+
+        async def prepare(user_id: str, token: str, jwt_token: str, record: str) -> None:
+            try:
+                hot_log.info("refresh.session", "Refreshing token for user_id: %s, token: %s", user_id, Masked(token))
+                payload = await jwt_util.adecode(jwt_token, verify_exp=not sliding)
+                if sliding and payload.get("exp", 0) > resign_before:
+                    extensions.append((user_id, token))
+                    return
+                updates.append((user_id, token, record, await jwt_util.aencode(payload=payload)))
+            except Exception as e:
+                failed.append((user_id, token))
+                hot_log.error(
+                    "refresh.failed",
+                    "Error refreshing token for user_id: %s, token: %s, error: %s",
+                    user_id,
+                    Masked(token),
+                    e,
+                )
+
+        pending = []
+        for ((user_id, token), jwt_token, record), is_claimed in zip(found, claimed):
+            if not is_claimed:
+                metrics.count("refresh.restricted")
+                hot_log.warning(
+                    "refresh.restricted",
+                    "Refresh token is restricted for user_id: %s, token: %s",
+                    user_id,
+                    Masked(token),
+                )
+                continue
+            pending.append(prepare(user_id, token, jwt_token, record))
+        # Preparing concurrently lets the signing batcher sign the whole batch in one pool job.
+        with metrics.stage("refresh.sign"):
+            await asyncio.gather(*pending)
+        written = []
+        with metrics.stage("refresh.write"):
+            try:
+                if extensions:
+                    written += zip(extensions, await extend_tokens(extensions))
+                if updates:
+                    written += zip((update[:2] for update in updates), await replace_tokens(updates))
+            except Exception:
+                await release_refreshes([*failed, *extensions, *(update[:2] for update in updates)])
+                raise
+        # Sessions revoked or rewritten since they were read.
+        failed += [session for session, ok in written if not ok]
+        if failed:
+            await release_refreshes(failed)
+        refreshed = sum(ok for _, ok in written)
+        metrics.count("refresh.refreshed", refreshed)
+        return refreshed
@@ -1,11 +1,131 @@
 import asyncio
+from typing import Callable
+from urllib.parse import urlsplit, urlunsplit
 
-from mem_db_utils.asyncio import MemDBConnector
-from redis import Redis
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.cluster import RedisCluster
+from redis.asyncio.sentinel import Sentinel
 
-from tp_auth_serverside.config import Database
+from tp_auth_serverside.config import Database, ReplicaReads
+from tp_auth_serverside.db.memorydb.inprocess import InProcessRedis
 
-mem_connector = MemDBConnector()
+# Redis-compatible servers addressed with their own URL scheme.
+REDIS_COMPATIBLE_SCHEMES = {"dragonfly": "redis", "valkey": "redis", "valkeys": "rediss"}
 
-login_db: Redis = asyncio.run(mem_connector.connect(db=Database.login_redis_db, decode_response=True))
-refresh_restrict_db: Redis = asyncio.run(mem_connector.connect(db=Database.refresh_restrict_db, decode_response=True))
+_clients: dict[tuple[int, bool], Redis] = {}
+# DB_URL schemes served by a client factory instead of a Redis connection pool, called with the database number.
+_backends: dict[str, Callable[[int], Redis]] = {"memory": InProcessRedis}
+
+
+def register_backend(scheme: str, factory: Callable[[int], Redis]) -> None:
+    """Serve `DB_URL`s with the given scheme by `factory(db)`, which returns a Redis-compatible async client."""
+    _backends[scheme] = factory
+
+
+def cluster_mode() -> bool:
+    return Database.redis_connection_type == "cluster"
+
+
+def _connection_kwargs() -> dict:
+    return {
+        "decode_responses": True,
+        "max_connections": Database.db_pool_max_connections,
+        "socket_timeout": Database.db_socket_timeout,
+        "socket_connect_timeout": Database.db_socket_connect_timeout,
+        "socket_keepalive": True,
+        "health_check_interval": Database.db_health_check_interval,
+    }
+
+
+def _server_url(url: str) -> str:
+    # The database number in the URL path would override the per-pool database, drop it.
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(scheme=REDIS_COMPATIBLE_SCHEMES.get(parts.scheme, parts.scheme), path=""))
+
+
+def _has_replicas() -> bool:
+    if urlsplit(Database.db_url or "").scheme in _backends:
+        return False
+    return Database.redis_connection_type in ("cluster", "sentinel") or bool(Database.db_replica_url)
+
+
+def _create_client(db: int, replica: bool = False) -> Redis:
+    if not Database.db_url:
+        raise ValueError("DB_URL must be set to connect to the memory database")
+    parts = urlsplit(Database.db_url)
+    if parts.scheme in _backends:
+        return _backends[parts.scheme](db)
+    if cluster_mode():
+        # Numbered databases do not exist in a cluster, keys are namespaced instead (see `keys.py`).
+        return RedisCluster.from_url(_server_url(Database.db_url), read_from_replicas=replica, **_connection_kwargs())
+    if Database.redis_connection_type == "sentinel":
+        sentinel = Sentinel([(parts.hostname, parts.port or 26379)], password=parts.password)
+        if replica:
+            return sentinel.slave_for(Database.redis_master_service, db=db, **_connection_kwargs())
+        return sentinel.master_for(Database.redis_master_service, db=db, **_connection_kwargs())
+    url = _server_url(Database.db_replica_url if replica else Database.db_url)
+    return Redis.from_pool(ConnectionPool.from_url(url, db=db, **_connection_kwargs()))
+
+
+def _get_client(db: int, replica: bool = False) -> Redis:
+    # Clients only connect on first command, so they bind to the event loop that uses them.
+    key = (0 if cluster_mode() else db, replica)
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = _create_client(key[0], replica)
+    return client
+
+
+def get_login_db() -> Redis:
+    return _get_client(Database.login_redis_db)
+
+
+def get_login_replica_db() -> Redis:
+    """Client for session reads that may be served by a replica, the primary when replica reads are off."""
+    if Database.db_replica_reads == ReplicaReads.OFF or not _has_replicas():
+        return get_login_db()
+    return _get_client(Database.login_redis_db, replica=True)
+
+
+def get_refresh_restrict_db() -> Redis:
+    return _get_client(Database.refresh_restrict_db)
+
+
+def login_db_index() -> int:
+    """Database number of the login hashes as it appears in keyspace notification channels."""
+    return 0 if cluster_mode() else Database.login_redis_db
+
+
+def keyspace_pubsubs() -> list:
+    """Pub/sub connections receiving the keyspace notifications of every primary holding login hashes.
+
+    Notifications are not propagated between cluster nodes, so a cluster needs one connection per primary.
+    """
+    client = get_login_db()
+    if isinstance(client, RedisCluster):
+        return [client.pubsub(node=node) for node in client.get_primaries()]
+    return [client.pubsub()]
+
+
+async def open_pools() -> None:
+    """Warm up the connection pools, failing fast when the memory database is unreachable."""
+    await asyncio.gather(get_login_db().ping(), get_refresh_restrict_db().ping())
+
+
+async def close_pools() -> None:
+    clients = list({id(client): client for client in _clients.values()}.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+__all__ = [
+    "cluster_mode",
+    "get_login_db",
+    "get_login_replica_db",
+    "get_refresh_restrict_db",
+    "keyspace_pubsubs",
+    "login_db_index",
+    "open_pools",
+    "close_pools",
+    "register_backend",
+]
@@ -0,0 +1,579 @@
+"""In-process memory database for single-node deployments, local development and benchmarks.
+
+`InProcessRedis` implements the subset of the `redis.asyncio.Redis` API used by this package:
+strings with expiry, hashes with per-field expiry (HEXPIRE), sorted sets, SCAN, pipelines, the Lua
+scripts of `scripts.py` (as Python equivalents), PUBLISH and keyspace notifications through `pubsub()`.
+Binary values are kept as bytes and `execute_command` honours `NEVER_DECODE`.
+Data lives in the process, so every worker has its own store; use it with a single worker only.
+Select it with `DB_URL=memory://`.
+"""
+
+import asyncio
+import fnmatch
+import functools
+import heapq
+import itertools
+import math
+import time
+from typing import Any, AsyncIterator, Callable, Optional
+
+from redis.client import NEVER_DECODE
+
+from tp_auth_serverside.db.memorydb.scripts import ADD_SESSION, REPLACE_TOKEN, REWRITE_RECORD
+
+
+def _encode(value: Any) -> str | bytes:
+    # Mirrors `decode_responses=True`: stored values read back as strings, binary values stay bytes.
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return value
+    return str(value)
+
+
+def _raw(value: Any) -> Any:
+    # The reply of a command sent with `NEVER_DECODE`.
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, dict):
+        return {_raw(key): _raw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_raw(item) for item in value]
+    return value
+
+
+class _Keyspace:
+    """One numbered database: plain keys, hashes, sorted sets and the deadlines of expiring keys and hash fields."""
+
+    def __init__(self, store: "InProcessStore", db: int) -> None:
+        self.store = store
+        self.db = db
+        self.strings: dict[str, str] = {}
+        self.hashes: dict[str, dict[str, str]] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+        # (key, None) for key expiry, (key, field) for hash field expiry.
+        self.deadlines: dict[tuple[str, Optional[str]], float] = {}
+
+    # Expiry
+
+    def _expire_at(self, key: str, field: Optional[str], deadline: float) -> None:
+        self.deadlines[(key, field)] = deadline
+        self.store.schedule(self, key, field, deadline)
+
+    def _live(self, key: str, field: Optional[str] = None) -> bool:
+        deadline = self.deadlines.get((key, field))
+        if deadline is not None and deadline <= time.monotonic():
+            self.expire_due(key, field, deadline)
+            return False
+        return True
+
+    def expire_due(self, key: str, field: Optional[str], deadline: float) -> None:
+        if self.deadlines.get((key, field)) != deadline:
+            return
+        del self.deadlines[(key, field)]
+        if field is None:
+            if self._drop(key):
+                self.store.notify(self.db, key, "expired")
+            return
+        fields = self.hashes.get(key)
+        if fields is not None and fields.pop(field, None) is not None:
+            if not fields:
+                del self.hashes[key]
+            self.store.notify(self.db, key, "hexpired")
+
+    def _drop(self, key: str) -> bool:
+        self.deadlines.pop((key, None), None)
+        fields = self.hashes.pop(key, None)
+        for field in fields or ():
+            self.deadlines.pop((key, field), None)
+        members = self.zsets.pop(key, None)
+        return self.strings.pop(key, None) is not None or fields is not None or members is not None
+
+    def _hash(self, key: str) -> Optional[dict[str, str]]:
+        if key in self.hashes and self._live(key):
+            return self.hashes.get(key)
+        return None
+
+    def _field(self, key: str, field: str) -> Optional[str]:
+        fields = self._hash(key)
+        if fields is None or field not in fields or not self._live(key, field):
+            return None
+        return fields.get(field)
+
+    # Generic commands
+
+    def ping(self) -> bool:
+        return True
+
+    def exists(self, *names: str) -> int:
+        return sum(
+            1
+            for name in names
+            if (name in self.strings or name in self.hashes or name in self.zsets) and self._live(name)
+        )
+
+    def delete(self, *names: str) -> int:
+        deleted = 0
+        for name in names:
+            if self._live(name) and self._drop(name):
+                deleted += 1
+                self.store.notify(self.db, name, "del")
+        return deleted
+
+    def expire(self, name: str, seconds: int, gt: bool = False) -> bool:
+        if not self.exists(name):
+            return False
+        deadline = time.monotonic() + seconds
+        current = self.deadlines.get((name, None))
+        # Like Redis, GT treats a key without expiry as never expiring.
+        if gt and (current is None or current >= deadline):
+            return False
+        self._expire_at(name, None, deadline)
+        self.store.notify(self.db, name, "expire")
+        return True
+
+    def ttl(self, name: str) -> int:
+        if not self.exists(name):
+            return -2
+        deadline = self.deadlines.get((name, None))
+        return -1 if deadline is None else math.ceil(deadline - time.monotonic())
+
+    def keys_of_type(self, type_: Optional[str] = None) -> list[str]:
+        containers = {"string": self.strings, "hash": self.hashes, "zset": self.zsets}
+        if type_ is not None:
+            containers = {type_.lower(): containers.get(type_.lower(), {})}
+        return [key for container in containers.values() for key in list(container) if self._live(key)]
+
+    def config_get(self, pattern: str = "*") -> dict[str, str]:
+        config = {"notify-keyspace-events": "AK"}
+        return {name: value for name, value in config.items() if fnmatch.fnmatchcase(name, pattern)}
+
+    # String commands
+
+    def get(self, name: str) -> Optional[str]:
+        if name in self.strings and self._live(name):
+            return self.strings.get(name)
+        return None
+
+    def set(
+        self, name: str, value: Any, ex: int = None, px: int = None, nx: bool = False, xx: bool = False
+    ) -> Optional[bool]:
+        exists = self.exists(name) == 1
+        if (nx and exists) or (xx and not exists):
+            return None
+        self._drop(name)
+        self.strings[name] = _encode(value)
+        if ex is not None or px is not None:
+            self._expire_at(name, None, time.monotonic() + (ex if ex is not None else px / 1000))
+        self.store.notify(self.db, name, "set")
+        return True
+
+    # Hash commands
+
+    def hset(self, name: str, key: str = None, value: Any = None, mapping: dict = None) -> int:
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        fields = self._hash(name)
+        if fields is None:
+            fields = self.hashes[name] = {}
+        added = 0
+        for field, field_value in items.items():
+            if field not in fields or not self._live(name, field):
+                added += 1
+            fields[field] = _encode(field_value)
+            # Overwriting a field clears its TTL, like Redis.
+            self.deadlines.pop((name, field), None)
+        self.hashes[name] = fields
+        self.store.notify(self.db, name, "hset")
+        return added
+
+    def hget(self, name: str, key: str) -> Optional[str]:
+        return self._field(name, key)
+
+    def hgetall(self, name: str) -> dict[str, str]:
+        fields = self._hash(name) or {}
+        return {field: value for field, value in list(fields.items()) if self._live(name, field)}
+
+    def hkeys(self, name: str) -> list[str]:
+        return list(self.hgetall(name))
+
+    def hlen(self, name: str) -> int:
+        return len(self.hgetall(name))
+
+    def hdel(self, name: str, *keys: str) -> int:
+        fields = self._hash(name)
+        if fields is None:
+            return 0
+        deleted = 0
+        for key in keys:
+            if key in fields and self._live(name, key):
+                del fields[key]
+                self.deadlines.pop((name, key), None)
+                deleted += 1
+        if not fields:
+            self.hashes.pop(name, None)
+        if deleted:
+            self.store.notify(self.db, name, "hdel")
+        return deleted
+
+    def hexpire(self, name: str, seconds: int, *fields: str) -> list[int]:
+        hash_fields = self._hash(name)
+        results = []
+        for field in fields:
+            if hash_fields is None or field not in hash_fields or not self._live(name, field):
+                results.append(-2)
+            elif seconds <= 0:
+                self.hdel(name, field)
+                results.append(2)
+            else:
+                self._expire_at(name, field, time.monotonic() + seconds)
+                results.append(1)
+        if 1 in results:
+            self.store.notify(self.db, name, "hexpire")
+        return results
+
+    # Sorted set commands
+
+    def _zset(self, key: str) -> Optional[dict[str, float]]:
+        if key in self.zsets and self._live(key):
+            return self.zsets.get(key)
+        return None
+
+    def _zrange_by_score(self, name: str, min: Any, max: Any) -> list[tuple[str, float]]:
+        low, high = float(min), float(max)
+        members = self._zset(name) or {}
+        return sorted(
+            ((member, score) for member, score in members.items() if low <= score <= high), key=lambda m: (m[1], m[0])
+        )
+
+    def zadd(self, name: str, mapping: dict, nx: bool = False, xx: bool = False) -> int:
+        members = self._zset(name)
+        if members is None:
+            members = {}
+        added = 0
+        for member, score in mapping.items():
+            member = _encode(member)
+            exists = member in members
+            if (nx and exists) or (xx and not exists):
+                continue
+            added += not exists
+            members[member] = float(score)
+        if members:
+            self.zsets[name] = members
+            self.store.notify(self.db, name, "zadd")
+        return added
+
+    def zrem(self, name: str, *values: Any) -> int:
+        members = self._zset(name)
+        if members is None:
+            return 0
+        removed = sum(1 for value in values if members.pop(_encode(value), None) is not None)
+        if not members:
+            self._drop(name)
+        if removed:
+            self.store.notify(self.db, name, "zrem")
+        return removed
+
+    def zcard(self, name: str) -> int:
+        return len(self._zset(name) or ())
+
+    def zscore(self, name: str, value: Any) -> Optional[float]:
+        return (self._zset(name) or {}).get(_encode(value))
+
+    def zrange(self, name: str, start: int, end: int, withscores: bool = False) -> list:
+        ordered = sorted((self._zset(name) or {}).items(), key=lambda m: (m[1], m[0]))
+        end = len(ordered) if end == -1 else end + 1
+        selected = ordered[start:end]
+        return selected if withscores else [member for member, _ in selected]
+
+    def zrangebyscore(self, name: str, min: Any, max: Any, withscores: bool = False) -> list:
+        selected = self._zrange_by_score(name, min, max)
+        return selected if withscores else [member for member, _ in selected]
+
+    def zremrangebyscore(self, name: str, min: Any, max: Any) -> int:
+        selected = self._zrange_by_score(name, min, max)
+        return self.zrem(name, *(member for member, _ in selected)) if selected else 0
+
+    # Pub/sub commands
+
+    def publish(self, channel: str, message: Any) -> int:
+        return self.store.publish(channel, _encode(message))
+
+
+def _replace_token(keyspace: _Keyspace, keys: list, args: list) -> int:
+    name, (field, expected, record, ttl) = keys[0], args
+    if keyspace.hget(name, field) != _encode(expected):
+        return 0
+    keyspace.hset(name, field, record)
+    keyspace.hexpire(name, int(ttl), field)
+    return 1
+
+
+def _rewrite_record(keyspace: _Keyspace, keys: list, args: list) -> int:
+    name, (field, expected, record) = keys[0], args
+    if keyspace.hget(name, field) != _encode(expected):
+        return 0
+    deadline = keyspace.deadlines.get((name, field))
+    keyspace.hset(name, field, record)
+    if deadline is not None:
+        keyspace._expire_at(name, field, deadline)
+    return 1
+
+
+def _add_session(keyspace: _Keyspace, keys: list, args: list) -> list[str]:
+    (name, index), (field, record, ttl, score, limit) = keys, args
+    keyspace.hset(name, field, record)
+    keyspace.hexpire(name, int(ttl), field)
+    fields = keyspace.hgetall(name)
+    stale = [member for member in keyspace.zrange(index, 0, -1) if member not in fields]
+    if stale:
+        keyspace.zrem(index, *stale)
+    now = time.monotonic()
+    for unindexed in fields.keys() - set(keyspace.zrange(index, 0, -1)):
+        left = keyspace.deadlines.get((name, unindexed), now) - now
+        keyspace.zadd(index, {unindexed: float(score) - int(ttl) + max(left, 0)})
+    keyspace.zadd(index, {field: score})
+    if keyspace.ttl(index) < int(ttl):
+        keyspace.expire(index, int(ttl))
+    excess = keyspace.zcard(index) - int(limit)
+    if excess <= 0:
+        return []
+    evicted = keyspace.zrange(index, 0, excess - 1)
+    keyspace.hdel(name, *evicted)
+    keyspace.zrem(index, *evicted)
+    return evicted
+
+
+# Python equivalents of the server-side scripts, keyed by their Lua source.
+SCRIPTS: dict[str, Callable[[_Keyspace, list, list], Any]] = {
+    REPLACE_TOKEN: _replace_token,
+    REWRITE_RECORD: _rewrite_record,
+    ADD_SESSION: _add_session,
+}
+
+
+def _script(script: str) -> Callable[[_Keyspace, list, list], Any]:
+    function = SCRIPTS.get(script)
+    if function is None:
+        raise NotImplementedError("Script has no in-process implementation")
+    return function
+
+
+def _command(keyspace: _Keyspace, args: tuple, options: dict) -> Callable[[], Any]:
+    """`execute_command` of the supported commands, EVAL included."""
+    name, *args = args
+    name = name.lower()
+    if name == "eval":
+        script, key_count, *rest = args
+        key_count = int(key_count)
+        call = functools.partial(_script(script), keyspace, rest[:key_count], rest[key_count:])
+    elif name in COMMANDS:
+        call = functools.partial(getattr(keyspace, name), *args)
+    else:
+        raise NotImplementedError(f"{name.upper()} is not supported by the in-process memory database")
+    if NEVER_DECODE in options:
+        return lambda: _raw(call())
+    return call
+
+
+COMMANDS = frozenset(
+    [
+        *["ping", "exists", "delete", "expire", "ttl", "config_get", "get", "set", "publish"],
+        *["hset", "hget", "hgetall", "hkeys", "hlen", "hdel", "hexpire"],
+        *["zadd", "zrem", "zcard", "zscore", "zrange", "zrangebyscore", "zremrangebyscore"],
+    ]
+)
+
+
+class InProcessStore:
+    """Numbered keyspaces sharing one expiry timer and one keyspace notification bus."""
+
+    def __init__(self) -> None:
+        self.keyspaces: dict[int, _Keyspace] = {}
+        self._heap: list[tuple[float, int, _Keyspace, str, Optional[str]]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_deadline: Optional[float] = None
+        self._subscribers: set["InProcessPubSub"] = set()
+
+    def keyspace(self, db: int) -> _Keyspace:
+        keyspace = self.keyspaces.get(db)
+        if keyspace is None:
+            keyspace = self.keyspaces[db] = _Keyspace(self, db)
+        return keyspace
+
+    def schedule(self, keyspace: _Keyspace, key: str, field: Optional[str], deadline: float) -> None:
+        heapq.heappush(self._heap, (deadline, next(self._counter), keyspace, key, field))
+        if len(self._heap) > 1024 and len(self._heap) > 2 * sum(len(ks.deadlines) for ks in self.keyspaces.values()):
+            # Re-armed and deleted entries leave stale timers behind, drop them once they dominate.
+            self._heap = [entry for entry in self._heap if entry[2].deadlines.get((entry[3], entry[4])) == entry[0]]
+            heapq.heapify(self._heap)
+        if self._timer_deadline is None or deadline < self._timer_deadline:
+            self._arm(deadline)
+
+    def _arm(self, deadline: float) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Without a loop, expired entries are still dropped lazily when accessed.
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_deadline = deadline
+        self._timer = loop.call_later(max(deadline - time.monotonic(), 0), self._expire)
+
+    def _expire(self) -> None:
+        self._timer = self._timer_deadline = None
+        now = time.monotonic()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, _, keyspace, key, field = heapq.heappop(heap)
+            keyspace.expire_due(key, field, deadline)
+        if heap:
+            self._arm(heap[0][0])
+
+    def notify(self, db: int, key: str, event: str) -> None:
+        if self._subscribers:
+            self.publish(f"__keyspace@{db}__:{key}", event)
+
+    def publish(self, channel: str, message: str) -> int:
+        return sum(subscriber.deliver(channel, message) for subscriber in list(self._subscribers))
+
+    def subscribe(self, pubsub: "InProcessPubSub") -> None:
+        self._subscribers.add(pubsub)
+
+    def unsubscribe(self, pubsub: "InProcessPubSub") -> None:
+        self._subscribers.discard(pubsub)
+
+
+class InProcessPubSub:
+    """Pattern subscriptions to the published messages and keyspace notifications of an `InProcessStore`."""
+
+    def __init__(self, store: InProcessStore) -> None:
+        self.store = store
+        self.patterns: list[str] = []
+        self._messages: asyncio.Queue = asyncio.Queue()
+
+    async def psubscribe(self, *patterns: str) -> None:
+        self.patterns.extend(patterns)
+        self.store.subscribe(self)
+        for pattern in patterns:
+            self._messages.put_nowait(
+                {"type": "psubscribe", "pattern": None, "channel": pattern, "data": len(self.patterns)}
+            )
+
+    def deliver(self, channel: str, message: str) -> bool:
+        for pattern in self.patterns:
+            if fnmatch.fnmatchcase(channel, pattern):
+                self._messages.put_nowait({"type": "pmessage", "pattern": pattern, "channel": channel, "data": message})
+                return True
+        return False
+
+    async def listen(self) -> AsyncIterator[dict]:
+        while True:
+            yield await self._messages.get()
+
+    async def aclose(self) -> None:
+        self.store.unsubscribe(self)
+        self.patterns.clear()
+
+
+class InProcessScript:
+    def __init__(self, client: "InProcessRedis", function: Callable[[_Keyspace, list, list], Any]) -> None:
+        self.client = client
+        self.function = function
+
+    async def __call__(self, keys: list = None, args: list = None, client: Any = None) -> Any:
+        target = client if client is not None else self.client
+        if isinstance(target, InProcessPipeline):
+            return target.queue_script(self.function, list(keys or []), list(args or []))
+        return self.function(target.keyspace, list(keys or []), list(args or []))
+
+
+class InProcessPipeline:
+    """Buffers commands and runs them back to back, which is atomic since nothing else runs in between."""
+
+    def __init__(self, client: "InProcessRedis") -> None:
+        self.client = client
+        self._commands: list[tuple[Callable, tuple, dict]] = []
+
+    def __getattr__(self, name: str) -> Callable[..., "InProcessPipeline"]:
+        if name not in COMMANDS:
+            raise AttributeError(f"{type(self).__name__!r} does not support {name!r}")
+        command = getattr(self.client.keyspace, name)
+
+        def queue(*args, **kwargs) -> "InProcessPipeline":
+            self._commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    def execute_command(self, *args, **options) -> "InProcessPipeline":
+        self._commands.append((_command(self.client.keyspace, args, options), (), {}))
+        return self
+
+    def eval(self, script: str, numkeys: int, *keys_and_args) -> "InProcessPipeline":
+        return self.execute_command("EVAL", script, numkeys, *keys_and_args)
+
+    def queue_script(self, function: Callable, keys: list, args: list) -> "InProcessPipeline":
+        self._commands.append((function, (self.client.keyspace, keys, args), {}))
+        return self
+
+    async def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+    async def __aenter__(self) -> "InProcessPipeline":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._commands.clear()
+
+
+class InProcessRedis:
+    """Drop-in for the `redis.asyncio.Redis` client of one numbered database of an `InProcessStore`."""
+
+    def __init__(self, db: int = 0, store: InProcessStore = None) -> None:
+        self.store = store if store is not None else default_store
+        self.keyspace = self.store.keyspace(db)
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        if name not in COMMANDS:
+            raise AttributeError(f"{type(self).__name__!r} does not support {name!r}")
+        command = getattr(self.keyspace, name)
+
+        async def call(*args, **kwargs) -> Any:
+            return command(*args, **kwargs)
+
+        return call
+
+    async def execute_command(self, *args, **options) -> Any:
+        return _command(self.keyspace, args, options)()
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args) -> Any:
+        return await self.execute_command("EVAL", script, numkeys, *keys_and_args)
+
+    async def scan_iter(self, match: str = None, count: int = None, _type: str = None) -> AsyncIterator[str]:
+        for key in self.keyspace.keys_of_type(_type):
+            if match is None or fnmatch.fnmatchcase(key, match):
+                yield key
+
+    def pipeline(self, transaction: bool = True) -> InProcessPipeline:
+        return InProcessPipeline(self)
+
+    def pubsub(self) -> InProcessPubSub:
+        return InProcessPubSub(self.store)
+
+    def register_script(self, script: str) -> InProcessScript:
+        return InProcessScript(self, _script(script))
+
+    async def aclose(self) -> None:
+        # The data outlives connections, as it would on a server.
+        return None
+
+
+default_store = InProcessStore()
+
+__all__ = ["InProcessPubSub", "InProcessRedis", "InProcessStore", "default_store"]
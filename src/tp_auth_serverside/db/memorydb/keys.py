@@ -0,0 +1,49 @@
+"""Key layout of the session storage.
+
+On a single server the login hashes and refresh restrictions live in their own numbered databases
+and keep the original layout: the login hash is named after the user id and restrictions are
+`<user_id>__<token>`. A cluster has only one database, so keys are namespaced and carry the user id
+as a hash tag, which places every key of a user in the same slot. Multi-key operations and
+transactions on one user therefore never cross nodes.
+
+The session index of a user, which orders their sessions for `MAX_SESSIONS_PER_USER`, is namespaced
+and hash tagged on every deployment, placing it next to the login hash on a cluster.
+"""
+
+from typing import Optional
+
+from tp_auth_serverside.db.memorydb import cluster_mode
+
+LOGIN_PREFIX = "tp_auth:login:"
+RESTRICT_PREFIX = "tp_auth:refresh:"
+SESSIONS_PREFIX = "tp_auth:sessions:"
+# Keys of this package that share the login database, none of them is a login hash.
+NAMESPACE = "tp_auth:"
+
+
+def login_key(user_id: str) -> str:
+    if cluster_mode():
+        return f"{LOGIN_PREFIX}{{{user_id}}}"
+    return user_id
+
+
+def restrict_key(user_id: str, token: str) -> str:
+    if cluster_mode():
+        return f"{RESTRICT_PREFIX}{{{user_id}}}:{token}"
+    return f"{user_id}__{token}"
+
+
+def sessions_key(user_id: str) -> str:
+    return f"{SESSIONS_PREFIX}{{{user_id}}}"
+
+
+def login_user_id(key: str) -> Optional[str]:
+    """User id of a login hash key, None for keys that are not login hashes."""
+    if not cluster_mode():
+        return None if key.startswith(NAMESPACE) else key
+    if key.startswith(LOGIN_PREFIX + "{") and key.endswith("}"):
+        return key[len(LOGIN_PREFIX) + 1 : -1]
+    return None
+
+
+__all__ = ["login_key", "login_user_id", "restrict_key", "sessions_key"]
@@ -1,26 +1,281 @@
-import orjson
+import functools
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Optional
+
 import shortuuid
+from redis.client import NEVER_DECODE
+from redis.exceptions import RedisError
+
+from tp_auth_serverside.config import Database, ReplicaReads, Secrets, SessionEviction
+from tp_auth_serverside.db.memorydb import cluster_mode, get_login_db, get_login_replica_db
+from tp_auth_serverside.db.memorydb.keys import login_key, login_user_id, sessions_key
+from tp_auth_serverside.db.memorydb.records import decode_record, encode_record, record_format_of
+from tp_auth_serverside.db.memorydb.revocation import publish_revocation, publish_revocations
+from tp_auth_serverside.db.memorydb.scripts import ADD_SESSION, REPLACE_TOKEN, REWRITE_RECORD
+from tp_auth_serverside.utilities.metrics import instrumented, metrics
+
+# Called with `(user_id, short_token)` for the sessions this process revoked or rewrote, `short_token`
+# None for every session of the user, once the change is written. In-process caches use them to drop
+# their copies immediately; other processes learn about changes from keyspace notifications.
+_session_listeners: list[Callable[[str, Optional[str]], None]] = []
+
+
+def add_session_listener(listener: Callable[[str, Optional[str]], None]) -> None:
+    _session_listeners.append(listener)
+
+
+def remove_session_listener(listener: Callable[[str, Optional[str]], None]) -> None:
+    if listener in _session_listeners:
+        _session_listeners.remove(listener)
+
+
+def _sessions_changed(sessions: Iterable[tuple[str, Optional[str]]]) -> None:
+    if not _session_listeners:
+        return
+    for user_id, short_token in list(sessions):
+        for listener in _session_listeners:
+            listener(user_id, short_token)
+
+
+@functools.cache
+def _registered_script(script: str):
+    # Only the SHA and encoder come from the registering client, every call passes its own pipeline.
+    return get_login_db().register_script(script)
 
-from tp_auth_serverside.config import Secrets
-from tp_auth_serverside.db.memorydb import login_db
+
+async def _queue_script(pipe, script: str, keys: list[str], args: list) -> None:
+    if cluster_mode():
+        # Cluster pipelines do not load scripts on the nodes they reach, send the source.
+        pipe.eval(script, len(keys), *keys, *args)
+    else:
+        await _registered_script(script)(keys=keys, args=args, client=pipe)
+
+
+def _queue_index_refresh(pipe, sessions: list[tuple[str, str]], ttl: int) -> None:
+    # The session index has to outlive the sessions it orders; with `lru` eviction a refresh also
+    # moves the session to the back of the queue.
+    now = time.time()
+    for user_id, short_token in sessions:
+        if Secrets.session_eviction == SessionEviction.LEAST_RECENTLY_REFRESHED:
+            pipe.zadd(sessions_key(user_id), {short_token: now}, xx=True)
+        pipe.expire(sessions_key(user_id), ttl, gt=True)
+
+
+async def _add_capped_session(user_id: str, short_token: str, record: bytes, expire_minutes: int) -> None:
+    args = [short_token, record, expire_minutes * 60, time.time(), Secrets.max_sessions_per_user]
+    async with get_login_db().pipeline(transaction=False) as pipe:
+        await _queue_script(pipe, ADD_SESSION, [login_key(user_id), sessions_key(user_id)], args)
+        (evicted,) = await pipe.execute()
+    if evicted:
+        metrics.count("session.evicted", len(evicted))
+        _sessions_changed((user_id, evicted_token) for evicted_token in evicted)
+        if Secrets.stateless_tokens:
+            await publish_revocations((user_id, evicted_token) for evicted_token in evicted)
 
 
+@instrumented("memorydb.set_token")
 async def set_token(user_id: str, token: str, expire_minutes: int = Secrets.expiry, short_token: str = None) -> str:
+    """Store a session, evicting the user's surplus sessions when `MAX_SESSIONS_PER_USER` is set."""
     short_token = short_token or shortuuid.uuid()
-    await login_db.hset(user_id, short_token, orjson.dumps({"token": token, "expire": expire_minutes}))
-    await login_db.hexpire(user_id, expire_minutes * 60, short_token)
+    record = encode_record(token, expire_minutes)
+    if Secrets.max_sessions_per_user:
+        await _add_capped_session(user_id, short_token, record, expire_minutes)
+        return short_token
+    key = login_key(user_id)
+    async with get_login_db().pipeline(transaction=True) as pipe:
+        pipe.hset(key, short_token, record)
+        pipe.hexpire(key, expire_minutes * 60, short_token)
+        await pipe.execute()
     return short_token
 
 
+@instrumented("memorydb.get_token")
 async def get_token(user_id: str, short_token: str) -> str | None:
-    token_data = await login_db.hget(user_id, short_token)
-    if token_data:
-        return orjson.loads(token_data).get("token")
-    return None
+    """Read a session, from a replica when `DB_REPLICA_READS` allows it.
+
+    With `fallback`, sessions missing on the replica (usually just issued) and replica errors are
+    retried on the primary; with `stale` only errors are.
+    """
+    # Records are read undecoded, binary records are not valid UTF-8.
+    command = ("HGET", login_key(user_id), short_token)
+    client = get_login_replica_db()
+    primary = get_login_db()
+    try:
+        record = await client.execute_command(*command, **{NEVER_DECODE: True})
+    except RedisError:
+        if client is primary:
+            raise
+        record = await primary.execute_command(*command, **{NEVER_DECODE: True})
+    if not record and client is not primary and Database.db_replica_reads == ReplicaReads.FALLBACK:
+        record = await primary.execute_command(*command, **{NEVER_DECODE: True})
+    return decode_record(record)
+
+
+@instrumented("memorydb.get_token_records")
+async def get_token_records(sessions: list[tuple[str, str]]) -> list[tuple[str | None, bytes | None]]:
+    """Return `(token, raw_record)` per session, the raw record being the compare value for `replace_tokens`."""
+    async with get_login_db().pipeline(transaction=False) as pipe:
+        for user_id, short_token in sessions:
+            pipe.execute_command("HGET", login_key(user_id), short_token, **{NEVER_DECODE: True})
+        results = await pipe.execute()
+    return [(decode_record(record), record) if record else (None, None) for record in results]
+
+
+@instrumented("memorydb.replace_tokens")
+async def replace_tokens(
+    sessions: list[tuple[str, str, bytes, str]], expire_minutes: int = Secrets.expiry
+) -> list[bool]:
+    """Atomically swap `(user_id, short_token, expected_record, token)` sessions whose record is unchanged.
 
+    Sessions revoked or rewritten since they were read are left untouched. The new records are
+    written in `SESSION_RECORD_FORMAT`, which migrates sessions as they are refreshed.
+    """
+    async with get_login_db().pipeline(transaction=False) as pipe:
+        for user_id, short_token, expected_record, token in sessions:
+            args = [short_token, expected_record, encode_record(token, expire_minutes), expire_minutes * 60]
+            await _queue_script(pipe, REPLACE_TOKEN, [login_key(user_id)], args)
+        if Secrets.max_sessions_per_user:
+            _queue_index_refresh(pipe, [session[:2] for session in sessions], expire_minutes * 60)
+        results = await pipe.execute()
+    replaced = [result == 1 for result in results[: len(sessions)]]
+    _sessions_changed(session[:2] for session, ok in zip(sessions, replaced) if ok)
+    return replaced
 
+
+@instrumented("memorydb.extend_tokens")
+async def extend_tokens(sessions: list[tuple[str, str]], expire_minutes: int = Secrets.expiry) -> list[bool]:
+    """Push the expiry of existing session fields forward without rewriting them."""
+    async with get_login_db().pipeline(transaction=False) as pipe:
+        for user_id, short_token in sessions:
+            pipe.hexpire(login_key(user_id), expire_minutes * 60, short_token)
+        if Secrets.max_sessions_per_user:
+            _queue_index_refresh(pipe, sessions, expire_minutes * 60)
+        results = await pipe.execute()
+    extended = [bool(result) and result[0] == 1 for result in results[: len(sessions)]]
+    _sessions_changed(session for session, ok in zip(sessions, extended) if ok)
+    return extended
+
+
+@instrumented("memorydb.revoke_token")
 async def revoke_token(user_id: str, short_token: str = None):
-    if short_token:
-        await login_db.hdel(user_id, short_token)
-    else:
-        await login_db.delete(user_id)
+    async with get_login_db().pipeline(transaction=True) as pipe:
+        if short_token:
+            pipe.hdel(login_key(user_id), short_token)
+            pipe.zrem(sessions_key(user_id), short_token)
+        else:
+            pipe.delete(login_key(user_id), sessions_key(user_id))
+        await pipe.execute()
+    _sessions_changed([(user_id, short_token)])
+    if Secrets.stateless_tokens:
+        # Stateless tokens stay valid without their session, the resource servers have to be told.
+        await publish_revocation(user_id, short_token)
+
+
+async def iter_login_users(count: int = 1000) -> AsyncIterator[str]:
+    """User ids of every login hash, walked with SCAN so the server is never blocked."""
+    async for key in get_login_db().scan_iter(match=login_key("*"), count=count, _type="hash"):
+        user_id = login_user_id(key)
+        if user_id is not None:
+            yield user_id
+
+
+async def _batches(user_ids: AsyncIterable[str] | Iterable[str], size: int) -> AsyncIterator[list[str]]:
+    if not isinstance(user_ids, AsyncIterable):
+        user_ids = _aiter(user_ids)
+    batch = []
+    async for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _aiter(items: Iterable[str]) -> AsyncIterator[str]:
+    for item in items:
+        yield item
+
+
+@instrumented("memorydb.migrate_session_records")
+async def migrate_session_records(user_ids: Iterable[str] = None, batch_size: int = 500) -> int:
+    """Rewrite stored sessions into `SESSION_RECORD_FORMAT`, keeping their expiry.
+
+    Every login hash is visited unless `user_ids` is given. Sessions changed while being migrated are
+    left as they are. Returns the number of rewritten sessions.
+    """
+    target = Database.session_record_format
+    migrated = 0
+    async for batch in _batches(user_ids if user_ids is not None else iter_login_users(), batch_size):
+        async with get_login_db().pipeline(transaction=False) as pipe:
+            for user_id in batch:
+                pipe.execute_command("HGETALL", login_key(user_id), **{NEVER_DECODE: True})
+            hashes = await pipe.execute()
+        async with get_login_db().pipeline(transaction=False) as pipe:
+            queued = 0
+            for user_id, fields in zip(batch, hashes):
+                for short_token, record in fields.items():
+                    token = decode_record(record)
+                    if token is None or record_format_of(record) == target:
+                        continue
+                    if isinstance(short_token, bytes):
+                        short_token = short_token.decode("utf-8")
+                    migrated_record = encode_record(token, Secrets.expiry, target)
+                    if record_format_of(migrated_record) != target:
+                        # Tokens that cannot be stored in binary form stay JSON.
+                        continue
+                    args = [short_token, record, migrated_record]
+                    await _queue_script(pipe, REWRITE_RECORD, [login_key(user_id)], args)
+                    queued += 1
+            if queued:
+                migrated += sum(result == 1 for result in await pipe.execute())
+    return migrated
+
+
+async def list_sessions(user_ids: Iterable[str] = None, batch_size: int = 500) -> AsyncIterator[tuple[str, list[str]]]:
+    """`(user_id, short_tokens)` of every user with live sessions, or of the given `user_ids`.
+
+    Users are read `batch_size` at a time in one pipeline each.
+    """
+    async for batch in _batches(user_ids if user_ids is not None else iter_login_users(), batch_size):
+        async with get_login_db().pipeline(transaction=False) as pipe:
+            for user_id in batch:
+                pipe.hkeys(login_key(user_id))
+            results = await pipe.execute()
+        for user_id, short_tokens in zip(batch, results):
+            if short_tokens:
+                yield user_id, short_tokens
+
+
+@instrumented("memorydb.count_sessions")
+async def count_sessions(user_ids: Iterable[str] = None, batch_size: int = 500) -> int:
+    """Number of live sessions of every user, or of the given `user_ids`."""
+    count = 0
+    async for batch in _batches(user_ids if user_ids is not None else iter_login_users(), batch_size):
+        async with get_login_db().pipeline(transaction=False) as pipe:
+            for user_id in batch:
+                pipe.hlen(login_key(user_id))
+            count += sum(await pipe.execute())
+    return count
+
+
+@instrumented("memorydb.revoke_sessions")
+async def revoke_sessions(user_ids: Iterable[str] = None, batch_size: int = 500) -> int:
+    """Revoke every session of the given `user_ids`, or of every user, and return the number of users logged out.
+
+    Users are logged out `batch_size` at a time in one pipeline each, and with stateless tokens
+    their revocations are published in one pipeline per batch.
+    """
+    revoked = 0
+    async for batch in _batches(user_ids if user_ids is not None else iter_login_users(), batch_size):
+        async with get_login_db().pipeline(transaction=False) as pipe:
+            for user_id in batch:
+                pipe.delete(login_key(user_id))
+                pipe.delete(sessions_key(user_id))
+            results = await pipe.execute()
+        logged_out = [user_id for user_id, deleted in zip(batch, results[::2]) if deleted]
+        revoked += len(logged_out)
+        _sessions_changed((user_id, None) for user_id in logged_out)
+        if logged_out and Secrets.stateless_tokens:
+            await publish_revocations((user_id, None) for user_id in logged_out)
+    return revoked
@@ -0,0 +1,117 @@
+"""Formats of the session records stored in the login hash.
+
+`json` is the original `{"token": <jwt>, "expire": <minutes>}` document. `binary` keeps the JWT in
+its decoded form: the header and claims JSON and the raw signature bytes, which is about a quarter
+smaller than the base64url text. `compressed` additionally deflates the header and claims against a
+preset dictionary of the claim names this package issues.
+
+Binary records start with a version byte, JSON records with `{`, so every reader understands both
+and records are migrated in either direction as they are rewritten (see `migrate_session_records`).
+The expiry lives on the hash field, binary records do not repeat it.
+"""
+
+import base64
+import binascii
+import struct
+import zlib
+from typing import Optional
+
+import orjson
+
+from tp_auth_serverside.config import Database, SessionRecordFormat
+
+# Layout version 1: version, flags, JWT header length, body length, then the body (JWT header and claims,
+# deflated when compressed) and the signature.
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct(">BBHH")
+_FLAG_COMPRESSED = 0x01
+_JSON_START = ord("{")
+# Preset deflate dictionary of version 1. Changing it requires a new layout version.
+ZLIB_DICTIONARY = (
+    b'{"alg":"HS256","typ":"JWT"}{"alg":"RS256","typ":"JWT"}{"alg":"ES256","typ":"JWT"}{"alg":"EdDSA","typ":"JWT"}'
+    b'"kid":"{"username":"","email":"@","user_id":"","scopes":[":","scm":"","scv":1,'
+    b'"jti":"","iss":"prismaticain","exp":17,"iat":17,"token_type":"access"}'
+)
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _compress(data: bytes) -> bytes:
+    compressor = zlib.compressobj(level=9, wbits=-15, zdict=ZLIB_DICTIONARY)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data: bytes) -> bytes:
+    decompressor = zlib.decompressobj(wbits=-15, zdict=ZLIB_DICTIONARY)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def _encode_binary(token: str, compress: bool) -> Optional[bytes]:
+    try:
+        header_segment, claims_segment, signature_segment = token.split(".")
+        header, claims, signature = map(_b64decode, (header_segment, claims_segment, signature_segment))
+    except (ValueError, binascii.Error):
+        return None
+    # Only canonical base64url can be restored byte for byte, anything else would break the signature.
+    if (_b64encode(header), _b64encode(claims), _b64encode(signature)) != (
+        header_segment,
+        claims_segment,
+        signature_segment,
+    ):
+        return None
+    body = header + claims
+    flags = 0
+    if compress:
+        body, flags = _compress(body), _FLAG_COMPRESSED
+    if len(header) > 0xFFFF or len(body) > 0xFFFF:
+        return None
+    return _BINARY_HEADER.pack(BINARY_VERSION, flags, len(header), len(body)) + body + signature
+
+
+def encode_record(token: str, expire_minutes: int, record_format: SessionRecordFormat = None) -> bytes:
+    """Session record of `token` in `record_format`, `SESSION_RECORD_FORMAT` by default.
+
+    Tokens that cannot be stored in binary form are kept as JSON.
+    """
+    record_format = record_format or Database.session_record_format
+    if record_format != SessionRecordFormat.JSON:
+        record = _encode_binary(token, compress=record_format == SessionRecordFormat.COMPRESSED)
+        if record is not None:
+            return record
+    return orjson.dumps({"token": token, "expire": expire_minutes})
+
+
+def record_format_of(record: bytes | str) -> Optional[SessionRecordFormat]:
+    if not record:
+        return None
+    if isinstance(record, str) or record[0] == _JSON_START:
+        return SessionRecordFormat.JSON
+    if record[0] == BINARY_VERSION:
+        return SessionRecordFormat.COMPRESSED if record[1] & _FLAG_COMPRESSED else SessionRecordFormat.BINARY
+    return None
+
+
+def decode_record(record: bytes | str | None) -> Optional[str]:
+    """JWT held by a session record of any format, None for a missing or unreadable record."""
+    if not record:
+        return None
+    if isinstance(record, str) or record[0] == _JSON_START:
+        return orjson.loads(record).get("token")
+    if record[0] != BINARY_VERSION:
+        return None
+    _, flags, header_length, body_length = _BINARY_HEADER.unpack_from(record)
+    signature_start = _BINARY_HEADER.size + body_length
+    body = record[_BINARY_HEADER.size : signature_start]
+    if flags & _FLAG_COMPRESSED:
+        body = _decompress(body)
+    header, claims = body[:header_length], body[header_length:]
+    return f"{_b64encode(header)}.{_b64encode(claims)}.{_b64encode(record[signature_start:])}"
+
+
+__all__ = ["decode_record", "encode_record", "record_format_of"]
@@ -1,15 +1,46 @@
-import logging
-
 from tp_auth_serverside.config import Secrets
-from tp_auth_serverside.db.memorydb import refresh_restrict_db
+from tp_auth_serverside.db.memorydb import get_refresh_restrict_db
+from tp_auth_serverside.db.memorydb.keys import restrict_key
+from tp_auth_serverside.utilities.hot_logging import Masked, hot_log
+from tp_auth_serverside.utilities.metrics import instrumented
 
 
+@instrumented("memorydb.set_restrict_refresh")
 async def set_restrict_refresh(user_id: str, token: str) -> None:
-    logging.info(f"Setting refresh restrict for user_id: {user_id}, token: {token}")
-    await refresh_restrict_db.set(f"{user_id}__{token}", "restricted", ex=Secrets.refresh_restrict_minutes * 60)
+    hot_log.info("refresh.restrict", "Setting refresh restrict for user_id: %s, token: %s", user_id, Masked(token))
+    await get_refresh_restrict_db().set(
+        restrict_key(user_id, token), "restricted", ex=Secrets.refresh_restrict_minutes * 60
+    )
 
 
+@instrumented("memorydb.is_refresh_restricted")
 async def is_refresh_restricted(user_id: str, token: str) -> bool:
-    result = await refresh_restrict_db.exists(f"{user_id}__{token}")
-    logging.info(f"Checking refresh restrict for user_id: {user_id}, token: {token}, exists: {result}")
+    result = await get_refresh_restrict_db().exists(restrict_key(user_id, token))
+    hot_log.info(
+        "refresh.restrict_check",
+        "Checking refresh restrict for user_id: %s, token: %s, exists: %s",
+        user_id,
+        Masked(token),
+        result,
+    )
     return result == 1
+
+
+@instrumented("memorydb.claim_refreshes")
+async def claim_refreshes(sessions: list[tuple[str, str]]) -> list[bool]:
+    """Set the refresh restriction only where it is absent, returning which sessions were claimed.
+
+    SET NX makes check-and-restrict a single atomic step, so concurrent refreshes of a session
+    cannot both pass the restriction.
+    """
+    async with get_refresh_restrict_db().pipeline(transaction=False) as pipe:
+        for user_id, token in sessions:
+            pipe.set(restrict_key(user_id, token), "restricted", ex=Secrets.refresh_restrict_minutes * 60, nx=True)
+        results = await pipe.execute()
+    return [bool(result) for result in results]
+
+
+@instrumented("memorydb.release_refreshes")
+async def release_refreshes(sessions: list[tuple[str, str]]) -> None:
+    """Lift the restrictions `claim_refreshes` set for sessions that were not refreshed after all."""
+    await get_refresh_restrict_db().delete(*(restrict_key(user_id, token) for user_id, token in sessions))
@@ -0,0 +1,76 @@
+import time
+from typing import Callable, Iterable, Optional
+
+import orjson
+
+from tp_auth_serverside.config import Secrets
+from tp_auth_serverside.db.memorydb import get_login_db
+from tp_auth_serverside.utilities.metrics import instrumented
+
+REVOCATION_CHANNEL = "tp_auth:revocations"
+# Sorted set of the revocations still in effect, scored by the time they can be forgotten.
+REVOCATION_KEY = "tp_auth:revocations"
+
+Revocation = tuple[str, Optional[str], float]
+
+# Called with each revocation this process publishes, before it is stored. In-process revocation lists
+# enforce it from then on; other processes receive it over pub/sub.
+_revocation_listeners: list[Callable[[Revocation], None]] = []
+
+
+def add_revocation_listener(listener: Callable[[Revocation], None]) -> None:
+    _revocation_listeners.append(listener)
+
+
+def remove_revocation_listener(listener: Callable[[Revocation], None]) -> None:
+    if listener in _revocation_listeners:
+        _revocation_listeners.remove(listener)
+
+
+def encode_revocation(user_id: str, short_token: Optional[str], revoked_at: float) -> bytes:
+    return orjson.dumps([user_id, short_token, revoked_at])
+
+
+def decode_revocation(entry: str | bytes) -> Revocation:
+    user_id, short_token, revoked_at = orjson.loads(entry)
+    return user_id, short_token, revoked_at
+
+
+@instrumented("memorydb.publish_revocation")
+async def publish_revocation(user_id: str, short_token: str = None) -> None:
+    """Record a revocation for the snapshot and broadcast it to the subscribed resource servers.
+
+    Without `short_token` every token of the user issued up to now is revoked. Entries are kept
+    until the last token they cover has expired.
+    """
+    await publish_revocations([(user_id, short_token)])
+
+
+@instrumented("memorydb.publish_revocations")
+async def publish_revocations(revoked: Iterable[tuple[str, Optional[str]]]) -> None:
+    """`publish_revocation` for many `(user_id, short_token)` pairs in two round trips."""
+    revoked_at = time.time()
+    revocations = [(user_id, short_token, revoked_at) for user_id, short_token in revoked]
+    if not revocations:
+        return
+    for revocation in revocations:
+        for listener in _revocation_listeners:
+            listener(revocation)
+    entries = [encode_revocation(*revocation) for revocation in revocations]
+    async with get_login_db().pipeline(transaction=True) as pipe:
+        pipe.zadd(REVOCATION_KEY, dict.fromkeys(entries, revoked_at + (Secrets.expiry + Secrets.leeway) * 60))
+        pipe.zremrangebyscore(REVOCATION_KEY, "-inf", revoked_at)
+        await pipe.execute()
+    # Published once stored, so a subscriber that reloads the snapshot after a message never misses it.
+    # PUBLISH has no key, which also keeps it out of the single-slot transaction on a cluster.
+    async with get_login_db().pipeline(transaction=False) as pipe:
+        for entry in entries:
+            pipe.publish(REVOCATION_CHANNEL, entry)
+        await pipe.execute()
+
+
+@instrumented("memorydb.get_revocations")
+async def get_revocations() -> list[Revocation]:
+    """Snapshot of the revocations still in effect."""
+    entries = await get_login_db().zrangebyscore(REVOCATION_KEY, time.time(), "+inf")
+    return [decode_revocation(entry) for entry in entries]
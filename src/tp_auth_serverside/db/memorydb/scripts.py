@@ -0,0 +1,63 @@
+# Server-side scripts, loaded once per connection pool through SCRIPT LOAD and invoked by EVALSHA.
+
+# Rewrite a session field only if it still holds the record read before signing, then re-arm its expiry.
+# KEYS[1]: login hash, ARGV[1]: short token, ARGV[2]: expected record, ARGV[3]: new record, ARGV[4]: ttl seconds
+REPLACE_TOKEN = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('HEXPIRE', KEYS[1], ARGV[4], 'FIELDS', 1, ARGV[1])
+return 1
+"""
+
+# Rewrite a session field in another record format if it still holds the record read, keeping its expiry.
+# KEYS[1]: login hash, ARGV[1]: short token, ARGV[2]: expected record, ARGV[3]: new record
+REWRITE_RECORD = """
+if redis.call('HGET', KEYS[1], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+local ttl = redis.call('HPTTL', KEYS[1], 'FIELDS', 1, ARGV[1])[1]
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+if ttl > 0 then
+    redis.call('HPEXPIRE', KEYS[1], ttl, 'FIELDS', 1, ARGV[1])
+end
+return 1
+"""
+
+# Store a session and evict the surplus sessions of the user, lowest score in the session index first.
+# Index entries of expired or revoked sessions are dropped. Sessions missing from the index (stored before the
+# cap was enabled) are indexed at the time their expiry was last set, derived from the time left on the field.
+# KEYS[1]: login hash, KEYS[2]: session index, ARGV[1]: short token, ARGV[2]: record, ARGV[3]: ttl seconds,
+# ARGV[4]: score, ARGV[5]: maximum sessions. Returns the evicted short tokens.
+ADD_SESSION = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HEXPIRE', KEYS[1], ARGV[3], 'FIELDS', 1, ARGV[1])
+for _, field in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    if redis.call('HEXISTS', KEYS[1], field) == 0 then
+        redis.call('ZREM', KEYS[2], field)
+    end
+end
+if redis.call('HLEN', KEYS[1]) > redis.call('ZCARD', KEYS[2]) + 1 then
+    for _, field in ipairs(redis.call('HKEYS', KEYS[1])) do
+        if not redis.call('ZSCORE', KEYS[2], field) then
+            local left = redis.call('HPTTL', KEYS[1], 'FIELDS', 1, field)[1]
+            redis.call('ZADD', KEYS[2], ARGV[4] - ARGV[3] + math.max(left, 0) / 1000, field)
+        end
+    end
+end
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[1])
+if redis.call('TTL', KEYS[2]) < tonumber(ARGV[3]) then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[5])
+if excess <= 0 then
+    return {}
+end
+local evicted = redis.call('ZRANGE', KEYS[2], 0, excess - 1)
+for _, field in ipairs(evicted) do
+    redis.call('HDEL', KEYS[1], field)
+    redis.call('ZREM', KEYS[2], field)
+end
+return evicted
+"""
@@ -18,7 +18,7 @@ _sym_db = _symbol_database.Default()
 
 
 DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(
-    b'\n\rrefresh.proto\x12\x07refresh"0\n\x0eRefreshRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\r\n\x05token\x18\x02 \x01(\t"\x11\n\x0fRefreshResponse2S\n\x0eRefreshService\x12\x41\n\x0cRefreshToken\x12\x17.refresh.RefreshRequest\x1a\x18.refresh.RefreshResponseb\x06proto3'
+    b'\n\rrefresh.proto\x12\x07refresh"0\n\x0eRefreshRequest\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\r\n\x05token\x18\x02 \x01(\t"\x11\n\x0fRefreshResponse"@\n\x13\x42\x61tchRefreshRequest\x12)\n\x08requests\x18\x01 \x03(\x0b\x32\x17.refresh.RefreshRequest")\n\x14\x42\x61tchRefreshResponse\x12\x11\n\trefreshed\x18\x01 \x01(\x05\x32\xeb\x01\n\x0eRefreshService\x12\x41\n\x0cRefreshToken\x12\x17.refresh.RefreshRequest\x1a\x18.refresh.RefreshResponse\x12K\n\x0c\x42\x61tchRefresh\x12\x1c.refresh.BatchRefreshRequest\x1a\x1d.refresh.BatchRefreshResponse\x12I\n\rStreamRefresh\x12\x17.refresh.RefreshRequest\x1a\x1d.refresh.BatchRefreshResponse(\x01\x62\x06proto3'
 )
 
 _globals = globals()
@@ -30,6 +30,10 @@ if not _descriptor._USE_C_DESCRIPTORS:
     _globals["_REFRESHREQUEST"]._serialized_end = 74
     _globals["_REFRESHRESPONSE"]._serialized_start = 76
     _globals["_REFRESHRESPONSE"]._serialized_end = 93
-    _globals["_REFRESHSERVICE"]._serialized_start = 95
-    _globals["_REFRESHSERVICE"]._serialized_end = 178
+    _globals["_BATCHREFRESHREQUEST"]._serialized_start = 95
+    _globals["_BATCHREFRESHREQUEST"]._serialized_end = 159
+    _globals["_BATCHREFRESHRESPONSE"]._serialized_start = 161
+    _globals["_BATCHREFRESHRESPONSE"]._serialized_end = 202
+    _globals["_REFRESHSERVICE"]._serialized_start = 205
+    _globals["_REFRESHSERVICE"]._serialized_end = 440
 # @@protoc_insertion_point(module_scope)
@@ -41,6 +41,18 @@ class RefreshServiceStub(object):
             response_deserializer=refresh__pb2.RefreshResponse.FromString,
             _registered_method=True,
         )
+        self.BatchRefresh = channel.unary_unary(
+            "/refresh.RefreshService/BatchRefresh",
+            request_serializer=refresh__pb2.BatchRefreshRequest.SerializeToString,
+            response_deserializer=refresh__pb2.BatchRefreshResponse.FromString,
+            _registered_method=True,
+        )
+        self.StreamRefresh = channel.stream_unary(
+            "/refresh.RefreshService/StreamRefresh",
+            request_serializer=refresh__pb2.RefreshRequest.SerializeToString,
+            response_deserializer=refresh__pb2.BatchRefreshResponse.FromString,
+            _registered_method=True,
+        )
 
 
 class RefreshServiceServicer(object):
@@ -52,6 +64,18 @@ class RefreshServiceServicer(object):
         context.set_details("Method not implemented!")
         raise NotImplementedError("Method not implemented!")
 
+    def BatchRefresh(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def StreamRefresh(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
 
 def add_RefreshServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -60,6 +84,16 @@ def add_RefreshServiceServicer_to_server(servicer, server):
             request_deserializer=refresh__pb2.RefreshRequest.FromString,
             response_serializer=refresh__pb2.RefreshResponse.SerializeToString,
         ),
+        "BatchRefresh": grpc.unary_unary_rpc_method_handler(
+            servicer.BatchRefresh,
+            request_deserializer=refresh__pb2.BatchRefreshRequest.FromString,
+            response_serializer=refresh__pb2.BatchRefreshResponse.SerializeToString,
+        ),
+        "StreamRefresh": grpc.stream_unary_rpc_method_handler(
+            servicer.StreamRefresh,
+            request_deserializer=refresh__pb2.RefreshRequest.FromString,
+            response_serializer=refresh__pb2.BatchRefreshResponse.SerializeToString,
+        ),
     }
     generic_handler = grpc.method_handlers_generic_handler("refresh.RefreshService", rpc_method_handlers)
     server.add_generic_rpc_handlers((generic_handler,))
@@ -99,3 +133,63 @@ class RefreshService(object):
             metadata,
             _registered_method=True,
         )
+
+    @staticmethod
+    def BatchRefresh(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/refresh.RefreshService/BatchRefresh",
+            refresh__pb2.BatchRefreshRequest.SerializeToString,
+            refresh__pb2.BatchRefreshResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def StreamRefresh(
+        request_iterator,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            "/refresh.RefreshService/StreamRefresh",
+            refresh__pb2.RefreshRequest.SerializeToString,
+            refresh__pb2.BatchRefreshResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
@@ -0,0 +1,100 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+from tp_auth_serverside.config import CryptoExecutor, Secrets
+
+_executor: Optional[Executor] = None
+
+
+def get_crypto_executor() -> Optional[Executor]:
+    """Return the pool JWT operations are offloaded to, or None when offloading is disabled."""
+    global _executor
+    if _executor is None:
+        if Secrets.crypto_executor == CryptoExecutor.THREAD:
+            _executor = ThreadPoolExecutor(max_workers=Secrets.crypto_workers, thread_name_prefix="tp-auth-crypto")
+        elif Secrets.crypto_executor == CryptoExecutor.PROCESS:
+            # Workers are spawned, forking after gRPC or the event loop started threads can deadlock them.
+            _executor = ProcessPoolExecutor(
+                max_workers=Secrets.crypto_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+    return _executor
+
+
+def shutdown_crypto_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class SigningBatcher:
+    """Coalesce signing requests that arrive together into one executor job.
+
+    Requests sharing a key are collected until the event loop gets back to the batcher
+    (or `CRYPTO_BATCH_WINDOW_MS` elapses), then signed by a single `run_batch` call in the pool.
+    `run_batch` receives the list of items and returns one `(ok, value)` pair per item.
+    """
+
+    def __init__(self, window_ms: int = None, max_size: int = None) -> None:
+        self._window_ms = window_ms
+        self._max_size = max_size
+        self._pending: dict[tuple[int, Hashable], tuple[list, list[asyncio.Future], Callable, asyncio.Handle]] = {}
+
+    @property
+    def window(self) -> float:
+        return (Secrets.crypto_batch_window_ms if self._window_ms is None else self._window_ms) / 1000
+
+    @property
+    def max_size(self) -> int:
+        return max(self._max_size or Secrets.crypto_batch_size, 1)
+
+    def submit(self, key: Hashable, item: Any, run_batch: Callable[[list], list]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending_key = (id(loop), key)
+        pending = self._pending.get(pending_key)
+        if pending is None:
+            if self.window:
+                handle = loop.call_later(self.window, self._flush, pending_key)
+            else:
+                handle = loop.call_soon(self._flush, pending_key)
+            pending = self._pending[pending_key] = ([], [], run_batch, handle)
+        items, futures, _, _ = pending
+        items.append(item)
+        futures.append(future)
+        if len(items) >= self.max_size:
+            self._flush(pending_key)
+        return future
+
+    def _flush(self, pending_key: tuple[int, Hashable]) -> None:
+        pending = self._pending.pop(pending_key, None)
+        if pending is None:
+            return
+        items, futures, run_batch, handle = pending
+        # A batch flushed early on `max_size` must not leave its timer to cut the next batch short.
+        handle.cancel()
+        job = asyncio.get_running_loop().run_in_executor(get_crypto_executor(), run_batch, items)
+        job.add_done_callback(lambda done: self._resolve(done, futures))
+
+    @staticmethod
+    def _resolve(done: asyncio.Future, futures: list[asyncio.Future]) -> None:
+        if done.cancelled() or done.exception() is not None:
+            error = asyncio.CancelledError() if done.cancelled() else done.exception()
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, (ok, value) in zip(futures, done.result()):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+signing_batcher = SigningBatcher()
+
+__all__ = ["SigningBatcher", "get_crypto_executor", "shutdown_crypto_executor", "signing_batcher"]
@@ -0,0 +1,73 @@
+import logging
+import os
+import socket
+import stat
+from typing import Optional
+
+import grpc
+
+from tp_auth_serverside.config import RefreshCompression, Secrets
+
+_COMPRESSION = {
+    RefreshCompression.NONE: grpc.Compression.NoCompression,
+    RefreshCompression.GZIP: grpc.Compression.Gzip,
+    RefreshCompression.DEFLATE: grpc.Compression.Deflate,
+}
+
+
+def compression() -> grpc.Compression:
+    return _COMPRESSION[Secrets.refresh_compression]
+
+
+def _keepalive_options() -> list[tuple[str, int]]:
+    if not Secrets.refresh_keepalive_seconds:
+        return []
+    return [
+        ("grpc.keepalive_time_ms", Secrets.refresh_keepalive_seconds * 1000),
+        ("grpc.keepalive_timeout_ms", Secrets.refresh_keepalive_timeout_seconds * 1000),
+        ("grpc.keepalive_permit_without_calls", 1),
+    ]
+
+
+def channel_options() -> list[tuple[str, int]]:
+    """Options of the refresh channels of `RefreshClient`."""
+    # Channels to the same target otherwise share one connection, which would defeat the channel pool.
+    return [("grpc.use_local_subchannel_pool", 1), *_keepalive_options()]
+
+
+def server_options() -> list[tuple[str, int]]:
+    """Options of the refresh server."""
+    options = _keepalive_options()
+    if Secrets.refresh_keepalive_seconds:
+        # Accept the pings of clients using the same interval instead of closing their connections.
+        options.append(("grpc.http2.min_recv_ping_interval_without_data_ms", Secrets.refresh_keepalive_seconds * 1000))
+    if Secrets.refresh_max_connection_age_seconds:
+        options.append(("grpc.max_connection_age_ms", Secrets.refresh_max_connection_age_seconds * 1000))
+    if Secrets.refresh_max_connection_age_grace_seconds:
+        options.append(("grpc.max_connection_age_grace_ms", Secrets.refresh_max_connection_age_grace_seconds * 1000))
+    return options
+
+
+def unix_socket_path(url: str) -> Optional[str]:
+    """Path of a `unix:path` or `unix:///absolute/path` gRPC address, None for other addresses."""
+    if url.startswith("unix://"):
+        return url[len("unix://") :]
+    if url.startswith("unix:"):
+        return url[len("unix:") :]
+    return None
+
+
+def remove_stale_socket(url: str) -> None:
+    """Remove the socket file a crashed server left behind at a Unix socket address, which would fail the bind."""
+    path = unix_socket_path(url)
+    if path is None or not os.path.exists(path) or not stat.S_ISSOCK(os.stat(path).st_mode):
+        return
+    with socket.socket(socket.AF_UNIX) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            logging.info(f"Removing stale refresh service socket {path}")
+            os.unlink(path)
+
+
+__all__ = ["channel_options", "compression", "remove_stale_socket", "server_options", "unix_socket_path"]
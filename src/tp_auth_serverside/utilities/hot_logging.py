@@ -0,0 +1,174 @@
+import functools
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+from tp_auth_serverside.config import Service
+from tp_auth_serverside.utilities.metrics import metrics
+
+LOGGER_NAME = "tp_auth_serverside"
+
+
+class Masked:
+    """A session handle or token that is logged by its first characters only, masked when formatted."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __str__(self) -> str:
+        if not self.value:
+            return str(self.value)
+        return f"{str(self.value)[:4]}..."
+
+
+class _MessageState:
+    __slots__ = ("allowance", "checked_at", "seen", "suppressed")
+
+    def __init__(self, allowance: float, now: float) -> None:
+        self.allowance = allowance
+        self.checked_at = now
+        self.seen = 0
+        self.suppressed = 0
+
+
+class HotPathLogger:
+    """Logging for the per-request and per-refresh paths.
+
+    Messages are %-style templates formatted only when a record is emitted, and nothing is done
+    for levels the logger does not handle. Each message type (`key`) is sampled with its rate
+    from `LOG_SAMPLE_RATES` and then limited to `LOG_RATE_LIMIT` records per second, with bursts
+    of as many. Dropped records are counted as the `log.suppressed` event, and the next record of
+    the type that gets through reports how many were dropped before it.
+    """
+
+    def __init__(self, name: str = LOGGER_NAME, rate: Optional[float] = None, sample_rates: dict = None) -> None:
+        self.logger = logging.getLogger(name)
+        self._rate = rate
+        self._sample_rates = sample_rates
+        self._states: dict[str, _MessageState] = {}
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def rate(self) -> float:
+        return Service.log_rate_limit if self._rate is None else self._rate
+
+    @functools.cached_property
+    def sample_every(self) -> dict[str, int]:
+        # Sampling keeps every n-th record, which needs no random numbers.
+        sample_rates = Service.log_sample_rates if self._sample_rates is None else self._sample_rates
+        return {key: max(round(1 / rate), 1) if rate > 0 else 0 for key, rate in (sample_rates or {}).items()}
+
+    def _admit(self, key: str) -> Optional[int]:
+        """None when the record is dropped, otherwise the number of records of its type dropped before it."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _MessageState(self.rate, now)
+            state.seen += 1
+            every = self.sample_every.get(key, 1)
+            sampled = every > 0 and (state.seen - 1) % every == 0
+            if sampled and self.rate > 0:
+                state.allowance = min(self.rate, state.allowance + (now - state.checked_at) * self.rate)
+                state.checked_at = now
+                sampled = state.allowance >= 1
+                if sampled:
+                    state.allowance -= 1
+            if not sampled:
+                state.suppressed += 1
+                metrics.count("log.suppressed")
+                return None
+            suppressed, state.suppressed = state.suppressed, 0
+            return suppressed
+
+    def log(self, level: int, key: str, msg: str, *args: Any, exc_info: Any = None, stacklevel: int = 2) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._admit(key)
+        if suppressed is None:
+            return
+        if suppressed:
+            msg, args = f"{msg} (%d similar messages suppressed)", (*args, suppressed)
+        self.logger.log(level, msg, *args, exc_info=exc_info, stacklevel=stacklevel)
+
+    def debug(self, key: str, msg: str, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.DEBUG, key, msg, *args, stacklevel=3, **kwargs)
+
+    def info(self, key: str, msg: str, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.INFO, key, msg, *args, stacklevel=3, **kwargs)
+
+    def warning(self, key: str, msg: str, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.WARNING, key, msg, *args, stacklevel=3, **kwargs)
+
+    def error(self, key: str, msg: str, *args: Any, **kwargs: Any) -> None:
+        self.log(logging.ERROR, key, msg, *args, stacklevel=3, **kwargs)
+
+
+hot_log = HotPathLogger()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: records are dropped while the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records stay in the process, so formatting is left to the listener thread.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.count("log.dropped")
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than failing the shutdown of a full queue.
+        self.queue.put(self._sentinel)
+
+
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_listener: Optional[_QueueListener] = None
+
+
+def start_log_queue(size: int = None) -> None:
+    """Emit the records of the `tp_auth_serverside` logger from a background thread.
+
+    Records are passed through a queue of `LOG_QUEUE_SIZE` and written by the root logger's
+    handlers as configured at this call. Records logged while the queue is full are dropped.
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        return
+    handlers = logging.getLogger().handlers or [logging.lastResort]
+    _queue_handler = _DroppingQueueHandler(queue.Queue(size or Service.log_queue_size))
+    _listener = _QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.addHandler(_queue_handler)
+    logger.propagate = False
+    _listener.start()
+
+
+def stop_log_queue() -> None:
+    """Write out the queued records and log directly again."""
+    global _queue_handler, _listener
+    if _listener is None:
+        return
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.removeHandler(_queue_handler)
+    logger.propagate = True
+    _listener.stop()
+    _queue_handler = _listener = None
+
+
+__all__ = ["HotPathLogger", "Masked", "hot_log", "start_log_queue", "stop_log_queue"]
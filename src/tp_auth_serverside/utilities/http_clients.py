@@ -0,0 +1,200 @@
+import asyncio
+import contextlib
+import importlib.util
+import logging
+import threading
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+import httpx
+
+from tp_auth_serverside.config import Service
+
+VerifyType = bool | str
+
+_lock = threading.Lock()
+_sync_clients: dict[VerifyType, httpx.Client] = {}
+_sync_host_slots: dict[str, threading.BoundedSemaphore] = {}
+
+
+class _LoopClients:
+    """Asynchronous clients and host slots of one event loop, they cannot be shared with another."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.clients: dict[VerifyType, httpx.AsyncClient] = {}
+        self.host_slots: dict[str, asyncio.Semaphore] = {}
+        # `asyncio.run` cancels the tasks left when its coroutine returns, which closes the clients of the loop.
+        self.closer = loop.create_task(_close_on_shutdown())
+
+
+_loops: dict[asyncio.AbstractEventLoop, _LoopClients] = {}
+
+
+def _http2_enabled() -> bool:
+    if not Service.http_client_http2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logging.warning("HTTP_CLIENT_HTTP2 is set but `h2` is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def _client_kwargs(verify: VerifyType) -> dict:
+    return {
+        "verify": verify,
+        "http2": _http2_enabled(),
+        "timeout": httpx.Timeout(Service.http_client_timeout, connect=Service.http_client_connect_timeout),
+        "limits": httpx.Limits(
+            max_connections=Service.http_client_max_connections,
+            max_keepalive_connections=Service.http_client_max_keepalive_connections,
+            keepalive_expiry=Service.http_client_keepalive_expiry,
+        ),
+        # Shared clients serve every user, so cookies set by a response must never be stored.
+        "cookies": CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+    }
+
+
+def get_http_client(verify: VerifyType = False) -> httpx.Client:
+    """Return the process-wide synchronous client for the given TLS verification setting."""
+    client = _sync_clients.get(verify)
+    if client is None or client.is_closed:
+        with _lock:
+            client = _sync_clients.get(verify)
+            if client is None or client.is_closed:
+                client = _sync_clients[verify] = httpx.Client(**_client_kwargs(verify))
+    return client
+
+
+def _loop_clients() -> _LoopClients:
+    loop = asyncio.get_running_loop()
+    entry = _loops.get(loop)
+    if entry is None:
+        # Loops closed without cancelling their tasks are forgotten here, their clients cannot be closed anymore.
+        for closed in [other for other in _loops if other.is_closed()]:
+            del _loops[closed]
+        entry = _loops[loop] = _LoopClients(loop)
+    return entry
+
+
+async def _close_on_shutdown() -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.create_future()
+    finally:
+        await _close_loop_clients(loop)
+
+
+async def _close_loop_clients(loop: asyncio.AbstractEventLoop) -> None:
+    entry = _loops.pop(loop, None)
+    if entry is None:
+        return
+    if entry.closer is not asyncio.current_task():
+        entry.closer.cancel()
+    await asyncio.gather(*(client.aclose() for client in entry.clients.values()), return_exceptions=True)
+
+
+def get_async_http_client(verify: VerifyType = False) -> httpx.AsyncClient:
+    """Return the asynchronous client of the running event loop for the given TLS verification setting."""
+    clients = _loop_clients().clients
+    client = clients.get(verify)
+    if client is None or client.is_closed:
+        client = clients[verify] = httpx.AsyncClient(**_client_kwargs(verify))
+    return client
+
+
+@contextlib.contextmanager
+def host_slot(url: httpx.URL | str) -> Iterator[None]:
+    """Hold one of the `HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST` slots of the host of `url`."""
+    limit = Service.http_client_max_connections_per_host
+    if not limit:
+        yield
+        return
+    host = httpx.URL(url).host
+    slot = _sync_host_slots.get(host)
+    if slot is None:
+        with _lock:
+            slot = _sync_host_slots.setdefault(host, threading.BoundedSemaphore(limit))
+    with slot:
+        yield
+
+
+async def acquire_async_host_slot(url: httpx.URL | str) -> Callable[[], None]:
+    """Take a slot like `async_host_slot` and return the callable giving it back, which is safe to call twice."""
+    limit = Service.http_client_max_connections_per_host
+    if not limit:
+        return _no_slot
+    host_slots = _loop_clients().host_slots
+    host = httpx.URL(url).host
+    slot = host_slots.get(host)
+    if slot is None:
+        slot = host_slots[host] = asyncio.Semaphore(limit)
+    await slot.acquire()
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            slot.release()
+
+    return release
+
+
+def _no_slot() -> None:
+    pass
+
+
+@contextlib.asynccontextmanager
+async def async_host_slot(url: httpx.URL | str) -> AsyncIterator[None]:
+    """Asynchronous counterpart of `host_slot`."""
+    release = await acquire_async_host_slot(url)
+    try:
+        yield
+    finally:
+        release()
+
+
+class SlotHoldingStream(httpx.AsyncByteStream):
+    """Body of a streamed response that gives its host slot back once the response is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]) -> None:
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def cookie_header(cookies: Optional[dict | httpx.Cookies]) -> Optional[str]:
+    if not cookies:
+        return None
+    return "; ".join(f"{name}={value}" for name, value in httpx.Cookies(cookies).items())
+
+
+async def close_http_clients() -> None:
+    """Close the clients of the running event loop and every synchronous client."""
+    await _close_loop_clients(asyncio.get_running_loop())
+    with _lock:
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in sync_clients:
+        client.close()
+
+
+__all__ = [
+    "SlotHoldingStream",
+    "acquire_async_host_slot",
+    "async_host_slot",
+    "close_http_clients",
+    "cookie_header",
+    "get_async_http_client",
+    "get_http_client",
+    "host_slot",
+]
@@ -1,9 +1,15 @@
-import logging
+import asyncio
+import functools
+import math
+from concurrent.futures import ProcessPoolExecutor
 from datetime import UTC, datetime, timedelta
 
 import jwt
 
 from tp_auth_serverside.config import Secrets, SupportedAlgorithms
+from tp_auth_serverside.utilities.crypto_executor import get_crypto_executor, signing_batcher
+from tp_auth_serverside.utilities.hot_logging import hot_log
+from tp_auth_serverside.utilities.keyset import KeySet, get_keyset
 
 
 class JWTUtil:
@@ -13,52 +19,108 @@ class JWTUtil:
         algorithm: SupportedAlgorithms = None,
         write_key: str = None,
         read_key: str = None,
+        keyset: KeySet = None,
     ) -> None:
         self.token_type = token_type
-        self.algorithm = algorithm or Secrets.algorithm
-        if self.algorithm == SupportedAlgorithms.RS256:
+        self.algorithm = SupportedAlgorithms(algorithm or Secrets.algorithm)
+        if self.algorithm.asymmetric:
             self.read_key = read_key or Secrets.public_key
             if Secrets.authorization_server or write_key:
                 self.write_key = write_key or Secrets.private_key
             else:
                 self.write_key = None
-        elif self.algorithm == SupportedAlgorithms.HS256:
+        else:
             self.read_key = read_key or Secrets.secret_key
             self.write_key = write_key or Secrets.secret_key
+        self.keyset = keyset or get_keyset(self.algorithm, self.write_key, self.read_key)
+        # Everything a pool worker needs to rebuild this instance; custom keysets cannot leave the process.
+        self._worker_args = None if keyset else (self.token_type, self.algorithm, self.write_key, self.read_key)
 
     def encode(self, payload: dict, exp_time: int = None) -> str:
         try:
+            now = datetime.now(UTC)
             payload |= {
                 "iss": Secrets.issuer,
-                "exp": datetime.now(UTC) + timedelta(minutes=exp_time or Secrets.expiry),
-                "iat": datetime.now(UTC),
+                "exp": now + timedelta(minutes=exp_time or Secrets.expiry),
+                # Milliseconds, rounded down, so revocations can tell apart tokens issued within the same second.
+                "iat": math.floor(now.timestamp() * 1000) / 1000,
                 "token_type": self.token_type,
             }
-            return jwt.encode(payload, self.write_key, algorithm=self.algorithm)
+            return jwt.encode(payload, self.keyset.signing_key, algorithm=self.algorithm, headers=self.keyset.headers)
         except Exception as e:
-            logging.error(f"Error encoding token: {e}")
+            hot_log.error("jwt.encode_failed", "Error encoding token: %s", e)
             raise e
 
-    def decode(self, token: str) -> dict:
+    def encode_many(self, items: list[tuple[dict, int]]) -> list[tuple[bool, str | Exception]]:
+        """Sign `(payload, exp_time)` items, returning `(ok, token_or_error)` for each."""
+        results = []
+        for payload, exp_time in items:
+            try:
+                results.append((True, self.encode(payload, exp_time)))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+    async def aencode(self, payload: dict, exp_time: int = None) -> str:
+        """`encode` on the configured crypto pool, batching signatures requested together.
+
+        Runs inline when `CRYPTO_EXECUTOR` is `none`.
+        """
+        executor = get_crypto_executor()
+        if executor is None:
+            return self.encode(payload, exp_time)
+        if isinstance(executor, ProcessPoolExecutor):
+            if self._worker_args is None:
+                return self.encode(payload, exp_time)
+            run_batch = functools.partial(_encode_batch, *self._worker_args)
+            return await signing_batcher.submit(self._worker_args, (payload, exp_time), run_batch)
+        return await signing_batcher.submit((id(self.keyset), self.token_type), (payload, exp_time), self.encode_many)
+
+    async def adecode(self, token: str, verify_exp: bool = True) -> dict:
+        """`decode` on the configured crypto pool, inline when `CRYPTO_EXECUTOR` is `none`."""
+        executor = get_crypto_executor()
+        if executor is None:
+            return self.decode(token, verify_exp)
+        loop = asyncio.get_running_loop()
+        if isinstance(executor, ProcessPoolExecutor):
+            if self._worker_args is None:
+                return self.decode(token, verify_exp)
+            return await loop.run_in_executor(executor, _decode, *self._worker_args, token, verify_exp)
+        return await loop.run_in_executor(executor, self.decode, token, verify_exp)
+
+    def decode(self, token: str, verify_exp: bool = True) -> dict:
         try:
-            return jwt.decode(token, self.read_key, algorithms=[self.algorithm])
+            return jwt.decode(
+                token,
+                self.keyset.verification_key(token),
+                algorithms=[self.algorithm],
+                options={"verify_exp": verify_exp},
+            )
         except Exception as e:
-            logging.error(f"Error decoding token: {e}")
+            hot_log.error("jwt.decode_failed", "Error decoding token: %s", e)
             raise e
 
     def verify(self, token: str) -> bool:
         try:
-            jwt.decode(token, self.read_key, algorithms=[self.algorithm])
+            jwt.decode(token, self.keyset.verification_key(token), algorithms=[self.algorithm])
             return True
         except jwt.InvalidSignatureError as e:
-            logging.error(f"Invalid signature: {e}")
+            hot_log.error("jwt.invalid_signature", "Invalid signature: %s", e)
             return False
         except jwt.ExpiredSignatureError as e:
-            logging.error(f"Expired signature: {e}")
+            hot_log.error("jwt.expired", "Expired signature: %s", e)
             return False
         except jwt.InvalidTokenError as e:
-            logging.error(f"Invalid token: {e}")
+            hot_log.error("jwt.invalid", "Invalid token: %s", e)
             return False
         except Exception as e:
-            logging.error(f"Error verifying token: {e}")
+            hot_log.error("jwt.verify_failed", "Error verifying token: %s", e)
             raise e
+
+
+def _encode_batch(token_type, algorithm, write_key, read_key, items):
+    return JWTUtil(token_type, algorithm, write_key, read_key).encode_many(items)
+
+
+def _decode(token_type, algorithm, write_key, read_key, token, verify_exp):
+    return JWTUtil(token_type, algorithm, write_key, read_key).decode(token, verify_exp)
@@ -0,0 +1,100 @@
+import base64
+import functools
+import hashlib
+from typing import Any, Optional
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+
+from tp_auth_serverside.config import Secrets, SupportedAlgorithms
+
+
+def load_key(algorithm: SupportedAlgorithms, material: str | bytes, private: bool = False) -> Any:
+    """Parse key material once into the object PyJWT signs or verifies with."""
+    if isinstance(material, str):
+        material = material.encode("utf-8")
+    if not algorithm.asymmetric:
+        return material
+    if private:
+        return serialization.load_pem_private_key(material, password=None)
+    return serialization.load_pem_public_key(material)
+
+
+def key_thumbprint(public_key: Any) -> str:
+    """Stable `kid` for a public key: the truncated SHA-256 of its SubjectPublicKeyInfo."""
+    der = public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return base64.urlsafe_b64encode(hashlib.sha256(der).digest()[:12]).decode("ascii")
+
+
+class KeySet:
+    """Loaded signing key and verification keys indexed by `kid`.
+
+    Tokens without a `kid` header, or any token when only one verification key is known,
+    are verified with the primary key. Verification keys can be added and removed at runtime
+    so a new signing key can be rolled out before tokens signed with it arrive.
+    """
+
+    def __init__(
+        self,
+        algorithm: SupportedAlgorithms,
+        signing_key: Any = None,
+        signing_kid: Optional[str] = None,
+        verification_keys: Optional[dict[Optional[str], Any]] = None,
+        primary_kid: Optional[str] = None,
+    ) -> None:
+        self.algorithm = algorithm
+        self.signing_key = signing_key
+        self.signing_kid = signing_kid
+        self._verification_keys: dict[Optional[str], Any] = dict(verification_keys or {})
+        self.primary_kid = primary_kid if primary_kid is not None else signing_kid
+
+    @property
+    def headers(self) -> Optional[dict]:
+        return {"kid": self.signing_kid} if self.signing_kid else None
+
+    @property
+    def kids(self) -> list[Optional[str]]:
+        return list(self._verification_keys)
+
+    def add_verification_key(self, kid: str, key: Any) -> None:
+        self._verification_keys[kid] = key
+
+    def remove_verification_key(self, kid: str) -> None:
+        self._verification_keys.pop(kid, None)
+
+    def verification_key(self, token: str) -> Any:
+        keys = self._verification_keys
+        if len(keys) == 1:
+            return next(iter(keys.values()))
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = keys.get(kid if kid is not None else self.primary_kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key id: {kid}")
+        return key
+
+
+@functools.lru_cache(maxsize=32)
+def get_keyset(
+    algorithm: SupportedAlgorithms, write_key: Optional[str] = None, read_key: Optional[str] = None
+) -> KeySet:
+    """Build, once per distinct key material, the keyset used by `JWTUtil`."""
+    if not algorithm.asymmetric:
+        read_key = read_key or write_key
+        kid = Secrets.key_id
+        verification_keys = {kid: load_key(algorithm, read_key)} if read_key else {}
+        signing_key = load_key(algorithm, write_key) if write_key else None
+    else:
+        public_key = load_key(algorithm, read_key) if read_key else None
+        kid = Secrets.key_id or (key_thumbprint(public_key) if public_key is not None else None)
+        verification_keys = {kid: public_key} if public_key is not None else {}
+        signing_key = load_key(algorithm, write_key, private=True) if write_key else None
+    for extra_kid, material in (Secrets.verification_keys or {}).items():
+        key = load_key(algorithm, material)
+        verification_keys.setdefault(extra_kid, key)
+        if algorithm.asymmetric:
+            # Tokens signed without an explicit KEY_ID carry the thumbprint of their key.
+            verification_keys.setdefault(key_thumbprint(key), key)
+    return KeySet(algorithm, signing_key=signing_key, signing_kid=kid, verification_keys=verification_keys)
+
+
+__all__ = ["KeySet", "get_keyset", "key_thumbprint", "load_key"]
@@ -0,0 +1,178 @@
+import bisect
+import functools
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from tp_auth_serverside.config import Service
+
+# Upper bounds in seconds, tuned for sub-millisecond cache hits up to slow network round trips.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self._series: dict[str, list] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        series = self._series.get(label_value)
+        if series is None:
+            # Per-bucket (non-cumulative) counts, then sum and count.
+            series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str, label: str) -> None:
+        self.name = name
+        self.description = description
+        self.label = label
+        self._values: dict[str, int] = {}
+
+    def inc(self, label_value: str, amount: int = 1) -> None:
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        lines.extend(f'{self.name}{{{self.label}="{value}"}} {count}' for value, count in sorted(self._values.items()))
+        return lines
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopStage":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start", "span", "context_token")
+
+    def __init__(self, metrics: "Metrics", name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.span = None
+
+    def __enter__(self) -> "_Stage":
+        tracer = self.metrics.tracer
+        if tracer is not None:
+            from opentelemetry import context, trace
+
+            self.span = tracer.start_span(self.name, attributes=self.metrics.span_attributes())
+            # Make the span current so the stages nested in it become its children.
+            self.context_token = context.attach(trace.set_span_in_context(self.span))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.metrics.stage_duration.observe(self.name, time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.events.inc(f"{self.name}.error")
+        if self.span is not None:
+            from opentelemetry import context
+
+            if exc is not None:
+                self.span.record_exception(exc)
+            self.span.end()
+            context.detach(self.context_token)
+
+
+class Metrics:
+    """Stage timings and event counters of the auth pipeline, exported in the Prometheus text format.
+
+    While disabled (`METRICS_ENABLED` is unset) `stage()` returns a shared no-op context
+    and `count()` returns immediately. With `TRACING_ENABLED` and `opentelemetry-api` installed,
+    every stage is also recorded as an OpenTelemetry span carrying the request correlation id.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, tracing: Optional[bool] = None) -> None:
+        self._enabled = enabled
+        self._tracing = tracing
+        self.stage_duration = Histogram(
+            "tp_auth_stage_duration_seconds", "Time spent in each stage of the auth pipeline.", "stage"
+        )
+        self.events = Counter("tp_auth_events_total", "Outcomes and events of the auth pipeline.", "event")
+
+    @functools.cached_property
+    def enabled(self) -> bool:
+        return Service.metrics_enabled if self._enabled is None else self._enabled
+
+    @functools.cached_property
+    def tracer(self) -> Any:
+        tracing = Service.tracing_enabled if self._tracing is None else self._tracing
+        if not (self.enabled and tracing):
+            return None
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logging.warning("TRACING_ENABLED is set but opentelemetry-api is not installed, spans are disabled")
+            return None
+        return trace.get_tracer("tp_auth_serverside")
+
+    @staticmethod
+    def span_attributes() -> dict:
+        from asgi_correlation_id import correlation_id
+
+        request_id = correlation_id.get()
+        return {"correlation_id": request_id} if request_id else {}
+
+    def stage(self, name: str) -> _Stage | _NoopStage:
+        if not self.enabled:
+            return _NOOP_STAGE
+        return _Stage(self, name)
+
+    def count(self, event: str, amount: int = 1) -> None:
+        if self.enabled:
+            self.events.inc(event, amount)
+
+    def render(self) -> str:
+        return "\n".join([*self.stage_duration.render(), *self.events.render()]) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrumented(stage: str) -> Callable[[Callable], Callable]:
+    """Time every call of the decorated coroutine function as `stage`, a no-op when metrics are disabled.
+
+    Whether metrics are enabled is looked up per call, decorating at import time does not read the settings.
+    """
+
+    def decorate(function: Callable) -> Callable:
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return await function(*args, **kwargs)
+            with metrics.stage(stage):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+__all__ = ["CONTENT_TYPE", "Counter", "Histogram", "Metrics", "instrumented", "metrics"]
@@ -0,0 +1,114 @@
+import functools
+from typing import Iterable, Optional
+
+import jwt
+
+from tp_auth_serverside.config import ScopeEncoding, Secrets
+
+MASK_CLAIM = "scm"
+VERSION_CLAIM = "scv"
+
+
+class ScopeCodec:
+    """Encode granted scopes as a bitmask over the scope table defined by `AUTH_SCOPES`.
+
+    Bit `i` stands for the i-th configured scope. The mask is carried in the `scm` claim as a hex
+    string together with the table version in `scv`; scopes missing from the table stay in the
+    `scopes` claim as names. Tokens encoded against another table version are rejected.
+    """
+
+    def __init__(self, scopes: Iterable[str], version: int = 1) -> None:
+        self.names = tuple(scopes)
+        self.version = version
+        self._bits = {name: 1 << index for index, name in enumerate(self.names)}
+        # Users sharing a role set share a mask, so the decoded name lists are reused.
+        self.names_of = functools.lru_cache(maxsize=1024)(self._names_of)
+
+    def _names_of(self, mask: int) -> tuple[str, ...]:
+        return tuple(name for index, name in enumerate(self.names) if mask >> index & 1)
+
+    def mask_of(self, scopes: Iterable[str]) -> tuple[int, list[str]]:
+        """Mask of the scopes found in the table and the names of those that are not."""
+        mask = 0
+        unknown = []
+        for scope in scopes:
+            bit = self._bits.get(scope)
+            if bit is None:
+                unknown.append(scope)
+            else:
+                mask |= bit
+        return mask, unknown
+
+    def required_mask(self, scopes: Iterable[str]) -> Optional[int]:
+        """Mask of required route scopes, or None when one of them is not in the table."""
+        mask, unknown = self.mask_of(scopes)
+        return None if unknown else mask
+
+    def encode_claims(self, payload: dict) -> dict:
+        scopes = payload.get("scopes")
+        if not scopes:
+            return payload
+        mask, unknown = self.mask_of(scopes)
+        claims = {**payload, MASK_CLAIM: format(mask, "x"), VERSION_CLAIM: self.version}
+        if unknown:
+            claims["scopes"] = unknown
+        else:
+            del claims["scopes"]
+        return claims
+
+    def decode_claims(self, payload: dict) -> tuple[dict, Optional[int]]:
+        """Claims of `payload` with the compact scope claims replaced by scope names, and the mask.
+
+        `payload` itself is left untouched. The mask is None when the token carries its scopes as names only.
+        """
+        if MASK_CLAIM not in payload and VERSION_CLAIM not in payload:
+            return payload, None
+        claims = dict(payload)
+        encoded = claims.pop(MASK_CLAIM, None)
+        version = claims.pop(VERSION_CLAIM, None)
+        if encoded is None:
+            return claims, None
+        if version != self.version:
+            raise jwt.InvalidTokenError(f"Token scopes use scope table version {version}, expected {self.version}")
+        try:
+            mask = int(encoded, 16)
+        except (TypeError, ValueError):
+            raise jwt.InvalidTokenError("Malformed scope mask") from None
+        if mask >> len(self.names):
+            raise jwt.InvalidTokenError("Scope mask references scopes missing from the scope table")
+        claims["scopes"] = [*self.names_of(mask), *(claims.get("scopes") or ())]
+        return claims, mask
+
+
+@functools.lru_cache(maxsize=1)
+def get_scope_codec() -> Optional[ScopeCodec]:
+    """Codec of the configured scope table, or None when `AUTH_SCOPES` is not set."""
+    if not Secrets.scopes:
+        return None
+    return ScopeCodec(Secrets.scopes, version=Secrets.scope_table_version)
+
+
+def encode_scopes(payload: dict) -> dict:
+    """Apply the configured `SCOPE_ENCODING` to the claims of a token about to be issued."""
+    codec = get_scope_codec()
+    if codec is None or Secrets.scope_encoding != ScopeEncoding.BITMASK:
+        return payload
+    return codec.encode_claims(payload)
+
+
+def decode_scopes(payload: dict) -> tuple[dict, Optional[int]]:
+    """Claims of a decoded token with compact scopes expanded to names, and the scope mask if it had one.
+
+    Returns `payload` itself when there is nothing to expand, it is never modified.
+    """
+    if MASK_CLAIM not in payload:
+        if VERSION_CLAIM not in payload:
+            return payload, None
+        return {name: value for name, value in payload.items() if name != VERSION_CLAIM}, None
+    codec = get_scope_codec()
+    if codec is None:
+        raise jwt.InvalidTokenError("Token scopes are encoded but AUTH_SCOPES is not configured")
+    return codec.decode_claims(payload)
+
+
+__all__ = ["MASK_CLAIM", "VERSION_CLAIM", "ScopeCodec", "decode_scopes", "encode_scopes", "get_scope_codec"]
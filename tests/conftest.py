@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+# Settings are read on first use, so the test environment only has to be in place before that.
+os.environ.setdefault("SECRET_KEY", "test-secret-key-with-at-least-32-bytes")
+os.environ.setdefault("DB_URL", "memory://")
+
+from tp_auth_serverside.db import memorydb
+from tp_auth_serverside.db.memorydb.inprocess import InProcessRedis, InProcessStore
+
+
+@pytest.fixture(autouse=True)
+def memory_db():
+    """A fresh in-process memory database for every test."""
+    store = InProcessStore()
+    memorydb.register_backend("memory", lambda db: InProcessRedis(db, store))
+    yield store
+    memorydb._clients.clear()
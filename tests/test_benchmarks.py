@@ -0,0 +1,37 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+BENCHMARKS = pathlib.Path(__file__).parent.parent / "benchmarks"
+
+# Shortest runs that still go through every case of each shipped benchmark.
+SMOKE_ARGS = {
+    "hot_logging.py": ["--iterations", "10"],
+    "hot_paths.py": ["--iterations", "5", "--warmup", "1"],
+    "import_time.py": ["--runs", "1"],
+    "jwt_algorithms.py": ["--seconds", "0.01"],
+    "refresh_load.py": ["--requests", "20", "--concurrency", "2"],
+    "session_records.py": ["--iterations", "10"],
+    "validator_fast_path.py": ["--iterations", "10"],
+}
+
+
+def test_every_benchmark_is_smoke_tested():
+    scripts = {path.name for path in BENCHMARKS.glob("*.py") if path.name != "harness.py"}
+    assert scripts == set(SMOKE_ARGS)
+
+
+@pytest.mark.parametrize("script", sorted(SMOKE_ARGS))
+def test_benchmark_runs(script):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run(
+        [sys.executable, str(BENCHMARKS / script), *SMOKE_ARGS[script]],
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
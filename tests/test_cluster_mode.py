@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from fastapi.security import SecurityScopes
+from redis.asyncio.cluster import RedisCluster
+from redis.crc import key_slot
+
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.auth.session_cache import SessionCache
+from tp_auth_serverside.config import Database, Secrets
+from tp_auth_serverside.db.memorydb.keys import login_key, restrict_key, sessions_key
+from tp_auth_serverside.db.memorydb.login import get_token, revoke_token, set_token
+from tp_auth_serverside.db.memorydb.refresh import is_refresh_restricted, set_restrict_refresh
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+USER_ID = "user_1"
+CLAIMS = {"user_id": USER_ID, "username": "User", "scopes": []}
+
+
+@pytest.fixture
+def cluster(monkeypatch):
+    monkeypatch.setattr(Database, "redis_connection_type", "cluster")
+
+
+def test_cluster_client_supports_transactions_and_pubsub():
+    # Sessions are written in cluster transactions and the listeners subscribe on every primary.
+    client = RedisCluster(host="127.0.0.1", port=7000)
+    client.pipeline(transaction=True)
+    assert callable(getattr(client, "pubsub", None))
+
+
+def test_keys_of_a_user_share_one_slot(cluster, monkeypatch, memory_db):
+    monkeypatch.setattr(Secrets, "max_sessions_per_user", 2)
+
+    async def scenario():
+        short_token = await set_token(USER_ID, JWTUtil().encode(dict(CLAIMS)))
+        await set_restrict_refresh(USER_ID, short_token)
+        assert await get_token(USER_ID, short_token) is not None
+        assert await is_refresh_restricted(USER_ID, short_token)
+
+        keys = [*memory_db.keyspace(0).keys_of_type(), restrict_key(USER_ID, short_token)]
+        assert login_key(USER_ID) in keys and sessions_key(USER_ID) in keys
+        assert len({key_slot(key.encode()) for key in keys}) == 1
+
+        await revoke_token(USER_ID)
+        assert await get_token(USER_ID, short_token) is None
+
+    asyncio.run(scenario())
+
+
+def test_session_cache_follows_cluster_keyspace_events(cluster, memory_db):
+    async def scenario():
+        cache = SessionCache()
+        await cache.start()
+        await asyncio.sleep(0)
+        try:
+            assert cache.active
+            short_token = await set_token(USER_ID, JWTUtil().encode(dict(CLAIMS)))
+            await AuthValidator(session_cache=cache)(
+                SecurityScopes(), token=short_token, user_id=USER_ID, refresh=False
+            )
+            assert cache.get(USER_ID, short_token) is not None
+            # Written behind the validator's back, only the keyspace notification tells the cache.
+            memory_db.keyspace(0).hdel(login_key(USER_ID), short_token)
+            await asyncio.sleep(0)
+            assert cache.get(USER_ID, short_token) is None
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+import asyncio
+
+from tp_auth_serverside.utilities.crypto_executor import SigningBatcher
+
+
+def test_early_flush_cancels_the_window_timer():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return [(True, item) for item in items]
+
+    async def scenario():
+        batcher = SigningBatcher(window_ms=100, max_size=2)
+        first = [batcher.submit("key", item, run_batch) for item in ("a", "b")]
+        assert await asyncio.gather(*first) == ["a", "b"]
+        await asyncio.sleep(0.06)
+        third = batcher.submit("key", "c", run_batch)
+        # The timer of the first batch is due now, it must not flush the second one.
+        await asyncio.sleep(0.06)
+        assert not third.done()
+        assert await third == "c"
+
+    asyncio.run(scenario())
+    assert batches == [["a", "b"], ["c"]]
@@ -0,0 +1,22 @@
+import asyncio
+
+from tp_auth_serverside.utilities import http_clients
+from tp_auth_serverside.utilities.http_clients import get_async_http_client
+
+
+def test_clients_of_a_loop_are_closed_when_asyncio_run_returns():
+    async def job():
+        return get_async_http_client(), asyncio.get_running_loop()
+
+    client, loop = asyncio.run(job())
+    assert client.is_closed
+    assert loop not in http_clients._loops
+
+
+def test_each_loop_gets_its_own_client():
+    async def job():
+        return get_async_http_client()
+
+    first, second = asyncio.run(job()), asyncio.run(job())
+    assert first is not second
+    assert not http_clients._loops
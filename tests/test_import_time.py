@@ -0,0 +1,44 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+BENCHMARK = Path(__file__).resolve().parent.parent / "benchmarks" / "import_time.py"
+
+# Generous enough for a cold CI runner, far below what the eager imports cost.
+PACKAGE_BUDGET_MS = 200
+
+
+def _load_benchmark():
+    spec = importlib.util.spec_from_file_location("import_time", BENCHMARK)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+import_time = _load_benchmark()
+
+
+@pytest.fixture(scope="module")
+def env():
+    return import_time.environment()
+
+
+@pytest.fixture(scope="module")
+def startup(env):
+    return import_time.startup_modules(env)
+
+
+@pytest.mark.parametrize(
+    "statement, forbidden",
+    [(statement, forbidden) for _, statement, forbidden in import_time.TARGETS if forbidden],
+    ids=[label for label, _, forbidden in import_time.TARGETS if forbidden],
+)
+def test_target_does_not_import_forbidden_modules(env, startup, statement, forbidden):
+    _, modules = import_time.measure(statement, env, startup)
+    assert import_time.leaked_modules(modules, forbidden) == []
+
+
+def test_package_import_within_budget(env, startup):
+    elapsed = min(import_time.measure("import tp_auth_serverside", env, startup)[0] for _ in range(3))
+    assert elapsed < PACKAGE_BUDGET_MS
@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from tp_auth_serverside.core import fastapi_configurer
+from tp_auth_serverside.core.fastapi_configurer import FastAPIConfig, generate_fastapi_app
+
+
+def test_services_shut_down_when_the_app_fails(monkeypatch):
+    closed = []
+
+    async def close_pools():
+        closed.append("pools")
+
+    monkeypatch.setattr(fastapi_configurer, "close_pools", close_pools)
+    app = generate_fastapi_app(FastAPIConfig(title="test", version="0", description="", root_path=""), routers=[])
+
+    async def scenario():
+        async with app.router.lifespan_context(app):
+            raise RuntimeError("app failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+    assert closed == ["pools"]
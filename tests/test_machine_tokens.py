@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import HTTPException
+from fastapi.security import SecurityScopes
+
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.auth.machine_token import (
+    MACHINE_TOKEN_TYPE,
+    MachineTokenProvider,
+    MachineTokenVerifier,
+    machine_key_id,
+)
+from tp_auth_serverside.config import Secrets, SupportedAlgorithms
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+from tp_auth_serverside.utilities.keyset import KeySet
+
+ORDERS_KEY = "orders-machine-key-with-at-least-32-bytes"
+BILLING_KEY = "billing-machine-key-with-at-least-32-bytes"
+SERVICES = {
+    "orders": {"key": ORDERS_KEY, "scopes": ["orders:read", "users:read"]},
+    "billing": {"key": BILLING_KEY, "scopes": []},
+}
+
+
+def _validator(services: dict = None) -> AuthValidator:
+    return AuthValidator(machine_tokens=True, machine_verifier=MachineTokenVerifier(services or SERVICES))
+
+
+async def _validate(validator: AuthValidator, token: str, scopes: list[str] = (), user_id: str = None):
+    return await validator(SecurityScopes(scopes=list(scopes)), token=token, user_id=user_id, refresh=False)
+
+
+def _status(validator: AuthValidator, token: str, scopes: list[str] = ()) -> int:
+    try:
+        asyncio.run(_validate(validator, token, scopes))
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def _forged(service_id: str, key: str, claims: dict) -> str:
+    keyset = KeySet(SupportedAlgorithms.HS256, signing_key=key.encode(), signing_kid=machine_key_id(service_id))
+    return JWTUtil(token_type=MACHINE_TOKEN_TYPE, keyset=keyset).encode({"username": service_id, **claims})
+
+
+def test_token_of_a_listed_service_is_accepted():
+    provider = MachineTokenProvider(service_id="orders", scopes=["orders:read"], key=ORDERS_KEY)
+    user_info = asyncio.run(_validate(_validator(), provider.token(), ["orders:read"]))
+    assert user_info.user_id == "orders"
+    assert user_info._machine
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        lambda: JWTUtil(token_type=MACHINE_TOKEN_TYPE).encode({"user_id": "orders", "username": "orders"}),
+        lambda: MachineTokenProvider(service_id="search", scopes=[], key=ORDERS_KEY).token(),
+        lambda: _forged("orders", BILLING_KEY, {"user_id": "orders", "scopes": []}),
+        lambda: _forged("billing", BILLING_KEY, {"user_id": "orders", "scopes": []}),
+        lambda: MachineTokenProvider(service_id="orders", scopes=["users:write"], key=ORDERS_KEY).token(),
+    ],
+    ids=["shared_signing_key", "unlisted_service", "key_of_another_service", "other_service_id", "scope_not_allowed"],
+)
+def test_unacceptable_machine_tokens_are_rejected(token):
+    assert _status(_validator(), token()) == 401
+
+
+def test_machine_tokens_are_rejected_when_disabled():
+    provider = MachineTokenProvider(service_id="orders", scopes=[], key=ORDERS_KEY)
+    assert _status(AuthValidator(machine_tokens=False), provider.token()) == 401
+
+
+def test_route_scopes_still_apply():
+    provider = MachineTokenProvider(service_id="orders", scopes=["users:read"], key=ORDERS_KEY)
+    assert _status(_validator(), provider.token(), ["orders:read"]) == 403
+
+
+def test_issuing_requires_a_machine_token_key():
+    with pytest.raises(ValueError, match="MACHINE_TOKEN_KEY"):
+        MachineTokenProvider(service_id="orders", scopes=[]).token()
+
+
+def test_asymmetric_service_keys(monkeypatch):
+    monkeypatch.setattr(Secrets, "algorithm", SupportedAlgorithms.ES256)
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = (
+        private_key.public_key()
+        .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        .decode()
+    )
+    provider = MachineTokenProvider(service_id="orders", scopes=["orders:read"], key=private_pem)
+    validator = _validator({"orders": {"key": public_pem, "scopes": ["orders:read"]}})
+    assert asyncio.run(_validate(validator, provider.token(), ["orders:read"])).user_id == "orders"
@@ -0,0 +1,18 @@
+import asyncio
+
+from tp_auth_serverside.utilities.metrics import instrumented, metrics
+
+
+def test_instrumented_checks_enabled_per_call(monkeypatch):
+    monkeypatch.setitem(metrics.__dict__, "enabled", False)
+
+    @instrumented("test.instrumented")
+    async def double(value: int) -> int:
+        return value * 2
+
+    assert asyncio.run(double(1)) == 2
+    assert "test.instrumented" not in metrics.render()
+
+    monkeypatch.setitem(metrics.__dict__, "enabled", True)
+    assert asyncio.run(double(2)) == 4
+    assert 'tp_auth_stage_duration_seconds_count{stage="test.instrumented"} 1' in metrics.render()
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from redis.client import NEVER_DECODE
+
+from tp_auth_serverside.config import Database, SessionRecordFormat
+from tp_auth_serverside.db.memorydb import get_login_db
+from tp_auth_serverside.db.memorydb.keys import login_key
+from tp_auth_serverside.db.memorydb.login import get_token, migrate_session_records, set_token
+from tp_auth_serverside.db.memorydb.records import decode_record, encode_record, record_format_of
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+CLAIMS = {"user_id": "user_1", "username": "User", "email": "user@prismatica.in", "scopes": ["user:read"]}
+
+
+def _es256_util() -> JWTUtil:
+    key = ec.generate_private_key(ec.SECP256R1())
+    private = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return JWTUtil(algorithm="ES256", write_key=private.decode(), read_key=public.decode())
+
+
+@pytest.mark.parametrize("record_format", list(SessionRecordFormat))
+@pytest.mark.parametrize("jwt_util", [JWTUtil, _es256_util], ids=["HS256", "ES256"])
+def test_round_trip(record_format, jwt_util):
+    token = jwt_util().encode(dict(CLAIMS))
+    record = encode_record(token, 30, record_format)
+    assert record_format_of(record) == record_format
+    assert decode_record(record) == token
+
+
+def test_binary_formats_are_smaller():
+    token = JWTUtil().encode(dict(CLAIMS))
+    json, binary, compressed = (len(encode_record(token, 30, record_format)) for record_format in SessionRecordFormat)
+    assert compressed < binary < json
+
+
+def test_json_record_read_as_text():
+    token = JWTUtil().encode(dict(CLAIMS))
+    record = encode_record(token, 30, SessionRecordFormat.JSON).decode()
+    assert record_format_of(record) == SessionRecordFormat.JSON
+    assert decode_record(record) == token
+
+
+@pytest.mark.parametrize(
+    "mangle",
+    [
+        lambda token: token.replace(".", "=.", 1),
+        lambda token: f"{token}.extra",
+        lambda token: token.rsplit(".", 1)[0],
+        lambda token: token.replace(".", ".!", 1),
+    ],
+    ids=["padded_segment", "four_segments", "two_segments", "invalid_base64"],
+)
+@pytest.mark.parametrize("record_format", [SessionRecordFormat.BINARY, SessionRecordFormat.COMPRESSED])
+def test_non_canonical_tokens_fall_back_to_json(record_format, mangle):
+    token = mangle(JWTUtil().encode(dict(CLAIMS)))
+    record = encode_record(token, 30, record_format)
+    assert record_format_of(record) == SessionRecordFormat.JSON
+    assert decode_record(record) == token
+
+
+@pytest.mark.parametrize("record", [None, b"", b"\x07garbage"], ids=["missing", "empty", "unknown_version"])
+def test_unreadable_records(record):
+    assert decode_record(record) is None
+
+
+async def _stored_record(user_id: str, short_token: str) -> bytes:
+    return await get_login_db().execute_command("HGET", login_key(user_id), short_token, **{NEVER_DECODE: True})
+
+
+@pytest.mark.parametrize(
+    "source, target",
+    [
+        (SessionRecordFormat.JSON, SessionRecordFormat.COMPRESSED),
+        (SessionRecordFormat.COMPRESSED, SessionRecordFormat.JSON),
+        (SessionRecordFormat.BINARY, SessionRecordFormat.COMPRESSED),
+    ],
+)
+def test_migrate_session_records(monkeypatch, memory_db, source, target):
+    monkeypatch.setattr(Database, "session_record_format", source)
+    tokens = {f"user_{i}": JWTUtil().encode({**CLAIMS, "user_id": f"user_{i}"}) for i in range(3)}
+
+    async def scenario():
+        sessions = {user_id: await set_token(user_id, token) for user_id, token in tokens.items()}
+        keyspace = memory_db.keyspace(Database.login_redis_db)
+        deadlines = dict(keyspace.deadlines)
+
+        monkeypatch.setattr(Database, "session_record_format", target)
+        assert await migrate_session_records(["user_0"]) == 1
+        assert await migrate_session_records(batch_size=2) == 2
+        assert await migrate_session_records() == 0
+
+        for user_id, short_token in sessions.items():
+            assert record_format_of(await _stored_record(user_id, short_token)) == target
+            assert await get_token(user_id, short_token) == tokens[user_id]
+        # Records are rewritten in place, the session expiry is untouched.
+        assert keyspace.deadlines == deadlines
+
+    asyncio.run(scenario())
+
+
+def test_migration_keeps_tokens_without_a_binary_form(monkeypatch):
+    token = JWTUtil().encode(dict(CLAIMS)).replace(".", "=.", 1)
+
+    async def scenario():
+        short_token = await set_token("user_1", token)
+        monkeypatch.setattr(Database, "session_record_format", SessionRecordFormat.BINARY)
+        assert await migrate_session_records() == 0
+        assert record_format_of(await _stored_record("user_1", short_token)) == SessionRecordFormat.JSON
+        assert await get_token("user_1", short_token) == token
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from tp_auth_serverside.core.handler import refresh_handler
+from tp_auth_serverside.core.handler.refresh_handler import RefreshHandler
+from tp_auth_serverside.db.memorydb.login import get_token, set_token
+from tp_auth_serverside.db.memorydb.refresh import is_refresh_restricted
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+USER_ID = "user_1"
+
+
+async def _session() -> str:
+    return await set_token(USER_ID, JWTUtil().encode({"user_id": USER_ID, "username": "User", "scopes": []}))
+
+
+async def _refresh(short_token: str) -> int:
+    return await RefreshHandler()._refresh_many([SimpleNamespace(user_id=USER_ID, token=short_token)])
+
+
+def test_refresh_restricts_the_session_until_the_window_passes():
+    async def scenario():
+        short_token = await _session()
+        assert await _refresh(short_token) == 1
+        assert await is_refresh_restricted(USER_ID, short_token)
+        assert await _refresh(short_token) == 0
+
+    asyncio.run(scenario())
+
+
+def test_missing_session_is_not_restricted():
+    async def scenario():
+        assert await _refresh("missing") == 0
+        assert not await is_refresh_restricted(USER_ID, "missing")
+
+    asyncio.run(scenario())
+
+
+def test_signing_failure_releases_the_restriction(monkeypatch):
+    async def scenario():
+        short_token = await _session()
+
+        async def fail(self, payload, exp_time=None):
+            raise ValueError("signing failed")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(JWTUtil, "aencode", fail)
+            assert await _refresh(short_token) == 0
+        assert not await is_refresh_restricted(USER_ID, short_token)
+        assert await _refresh(short_token) == 1
+
+    asyncio.run(scenario())
+
+
+def test_write_failure_releases_the_restriction(monkeypatch):
+    async def scenario():
+        short_token = await _session()
+        stored = await get_token(USER_ID, short_token)
+
+        async def fail(sessions, expire_minutes=None):
+            raise ConnectionError("write failed")
+
+        with monkeypatch.context() as patched:
+            patched.setattr(refresh_handler, "replace_tokens", fail)
+            with pytest.raises(ConnectionError):
+                await _refresh(short_token)
+        assert not await is_refresh_restricted(USER_ID, short_token)
+        assert await get_token(USER_ID, short_token) == stored
+        assert await _refresh(short_token) == 1
+
+    asyncio.run(scenario())
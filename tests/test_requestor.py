@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+
+from tp_auth_serverside.auth.machine_token import MachineTokenProvider, machine_tokens
+from tp_auth_serverside.auth.requestor import TPRequestor
+from tp_auth_serverside.config import Service
+from tp_auth_serverside.utilities import http_clients
+
+
+def _use_transport(handler) -> None:
+    """Route the pooled client of the running loop through `handler` instead of the network."""
+    http_clients._loop_clients().clients[False] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def _body(request: httpx.Request):
+    yield request.url.path.encode()
+
+
+def test_streamed_response_holds_the_host_slot_until_closed(monkeypatch):
+    monkeypatch.setattr(Service, "http_client_max_connections_per_host", 1)
+
+    async def scenario():
+        _use_transport(lambda request: httpx.Response(200, content=_body(request)))
+        requestor = TPRequestor("user-token")
+        try:
+            async with requestor.aio_stream(method="GET", url="http://resource/stream") as response:
+                queued = asyncio.ensure_future(requestor.aio_request(method="GET", url="http://resource/queued"))
+                await asyncio.sleep(0.05)
+                assert not queued.done()
+                assert await response.aread() == b"/stream"
+            assert (await queued).content == b"/queued"
+        finally:
+            await http_clients.close_http_clients()
+
+    asyncio.run(scenario())
+
+
+def _send(requestor: TPRequestor) -> httpx.Request:
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return httpx.Response(200)
+
+    async def scenario():
+        _use_transport(handler)
+        try:
+            await requestor.aio_get(url="http://resource/items")
+        finally:
+            await http_clients.close_http_clients()
+
+    asyncio.run(scenario())
+    return sent[0]
+
+
+def test_user_requestor_forwards_the_user_token():
+    assert _send(TPRequestor("user-token")).headers["Authorization"] == "Bearer user-token"
+
+
+def test_requestor_without_a_user_token_sends_no_credentials(monkeypatch):
+    # Machine tokens must only be sent through `as_service`, even when this service can issue them.
+    monkeypatch.setattr(machine_tokens, "_service_id", "orders")
+    assert "Authorization" not in _send(TPRequestor(None)).headers
+
+
+def test_service_requestor_sends_a_machine_token():
+    provider = MachineTokenProvider(
+        service_id="orders", scopes=["orders:read"], key="orders-machine-key-with-at-least-32-bytes"
+    )
+    token = provider.token()
+    assert _send(TPRequestor.as_service(provider)).headers["Authorization"] == f"Bearer {token}"
@@ -0,0 +1,148 @@
+import asyncio
+
+import jwt
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.security import SecurityScopes
+
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.auth.revocation_list import RevocationList, get_revocation_list
+from tp_auth_serverside.auth.user_specs import UserInfoSchema
+from tp_auth_serverside.config import Secrets
+from tp_auth_serverside.core.handler.authentication_handler import AuthenticationHandler
+from tp_auth_serverside.db.memorydb.login import revoke_token
+from tp_auth_serverside.db.memorydb.revocation import publish_revocation
+
+USER_ID = "user_1"
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+    monkeypatch.setattr(Secrets, "stateless_tokens", True)
+
+
+async def _login() -> str:
+    return await AuthenticationHandler().authenticate(
+        Response(), USER_ID, UserInfoSchema(user_id=USER_ID, username="User", scopes=[])
+    )
+
+
+async def _is_valid(validator: AuthValidator, token: str) -> bool:
+    try:
+        await validator(SecurityScopes(), token=token, user_id=USER_ID, refresh=False)
+    except HTTPException as e:
+        assert e.status_code == 401
+        return False
+    return True
+
+
+def test_tokens_are_revoked_until_the_first_snapshot_loads():
+    async def scenario():
+        await publish_revocation(USER_ID, "revoked")
+        revocations = RevocationList()
+        assert revocations.is_revoked(USER_ID, "active", 0)
+        await revocations.start()
+        try:
+            assert revocations.synced_at is not None
+            assert revocations.is_revoked(USER_ID, "revoked", 0)
+            assert not revocations.is_revoked(USER_ID, "active", 0)
+        finally:
+            await revocations.stop()
+
+    asyncio.run(scenario())
+
+
+def test_logout_revokes_the_token_in_this_process_immediately(stateless):
+    async def scenario():
+        revocations = RevocationList()
+        await revocations.start()
+        validator = AuthValidator(revocations=revocations)
+        try:
+            token, other = await _login(), await _login()
+            assert await _is_valid(validator, token)
+            await AuthenticationHandler().revoke_authentication(Response(), USER_ID, token)
+            # No chance for the pub/sub message to arrive before the next request.
+            assert not await _is_valid(validator, token)
+            assert await _is_valid(validator, other)
+        finally:
+            await revocations.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(
+    "forged",
+    [
+        jwt.encode({"user_id": USER_ID}, "not-the-secret-key-but-long-enough-for-hs256"),
+        "garbage",
+    ],
+    ids=["wrong_key", "garbage"],
+)
+def test_logout_rejects_unverified_tokens_without_revoking_the_user(stateless, forged):
+    async def scenario():
+        revocations = RevocationList()
+        await revocations.start()
+        validator = AuthValidator(revocations=revocations)
+        try:
+            token = await _login()
+            with pytest.raises(HTTPException) as error:
+                await AuthenticationHandler().revoke_authentication(Response(), USER_ID, forged)
+            assert error.value.status_code == 401
+            assert await _is_valid(validator, token)
+        finally:
+            await revocations.stop()
+
+    asyncio.run(scenario())
+
+
+def test_logout_rejects_a_token_of_another_user(stateless):
+    async def scenario():
+        token = await _login()
+        with pytest.raises(HTTPException):
+            await AuthenticationHandler().revoke_authentication(Response(), "user_2", token)
+
+    asyncio.run(scenario())
+
+
+def test_login_right_after_revoking_every_session_is_valid(stateless):
+    async def scenario():
+        revocations = RevocationList()
+        await revocations.start()
+        validator = AuthValidator(revocations=revocations)
+        try:
+            token = await _login()
+            await revoke_token(USER_ID)
+            # Tokens carry their issue time in milliseconds, a login within the same one still counts as revoked.
+            await asyncio.sleep(0.002)
+            relogin = await _login()
+            assert not await _is_valid(validator, token)
+            assert await _is_valid(validator, relogin)
+        finally:
+            await revocations.stop()
+
+    asyncio.run(scenario())
+
+
+def test_validators_share_one_revocation_list_started_on_first_use(stateless):
+    get_revocation_list.cache_clear()
+    validator, other = AuthValidator(), AuthValidator()
+    assert validator.revocations is other.revocations
+    revocations = validator.revocations
+
+    async def scenario(revoke: bool):
+        token = await _login()
+        if revoke:
+            await AuthenticationHandler().revoke_authentication(Response(), USER_ID, token)
+            assert not await _is_valid(other, token)
+        else:
+            assert await _is_valid(validator, token)
+        assert revocations.following
+
+    try:
+        asyncio.run(scenario(revoke=False))
+        # The tasks of the first event loop are gone, the list follows again on the next one.
+        assert not revocations.following
+        asyncio.run(scenario(revoke=True))
+    finally:
+        asyncio.run(revocations.stop())
+        get_revocation_list.cache_clear()
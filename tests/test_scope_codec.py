@@ -0,0 +1,96 @@
+import jwt
+import pytest
+
+from tp_auth_serverside.config import ScopeEncoding, Secrets
+from tp_auth_serverside.utilities.scope_codec import (
+    MASK_CLAIM,
+    VERSION_CLAIM,
+    ScopeCodec,
+    decode_scopes,
+    encode_scopes,
+    get_scope_codec,
+)
+
+
+@pytest.fixture
+def scope_table(monkeypatch):
+    monkeypatch.setattr(Secrets, "scopes", {"read": "Read", "write": "Write", "admin": "Admin"})
+    monkeypatch.setattr(Secrets, "scope_encoding", ScopeEncoding.BITMASK)
+    get_scope_codec.cache_clear()
+    yield
+    get_scope_codec.cache_clear()
+
+
+def test_round_trip_keeps_unknown_scopes():
+    codec = ScopeCodec(["read", "write", "admin"])
+    payload = {"user_id": "u1", "scopes": ["admin", "legacy", "read"]}
+
+    encoded = codec.encode_claims(payload)
+    assert encoded[MASK_CLAIM] == "5"
+    assert encoded[VERSION_CLAIM] == 1
+    assert encoded["scopes"] == ["legacy"]
+    assert payload["scopes"] == ["admin", "legacy", "read"]
+
+    claims, mask = codec.decode_claims(encoded)
+    assert mask == 0b101
+    assert claims == {"user_id": "u1", "scopes": ["read", "admin", "legacy"]}
+    assert encoded[MASK_CLAIM] == "5" and encoded["scopes"] == ["legacy"]
+
+
+def test_all_known_scopes_drop_the_names():
+    codec = ScopeCodec(["read", "write"])
+    encoded = codec.encode_claims({"scopes": ["write"]})
+    assert "scopes" not in encoded
+    assert codec.decode_claims(encoded) == ({"scopes": ["write"]}, 0b10)
+
+
+def test_names_only_payload_is_returned_as_is():
+    codec = ScopeCodec(["read"])
+    payload = {"scopes": ["read"]}
+    assert codec.decode_claims(payload) == (payload, None)
+    assert codec.decode_claims(payload)[0] is payload
+
+
+@pytest.mark.parametrize(
+    "claims, message",
+    [
+        ({MASK_CLAIM: "1", VERSION_CLAIM: 2}, "version 2"),
+        ({MASK_CLAIM: "1"}, "version None"),
+        ({MASK_CLAIM: "zz", VERSION_CLAIM: 1}, "Malformed"),
+        ({MASK_CLAIM: 3, VERSION_CLAIM: 1}, "Malformed"),
+        ({MASK_CLAIM: "4", VERSION_CLAIM: 1}, "missing from the scope table"),
+    ],
+    ids=["version_mismatch", "version_missing", "malformed_mask", "integer_mask", "mask_beyond_table"],
+)
+def test_invalid_compact_claims(claims, message):
+    codec = ScopeCodec(["read", "write"])
+    with pytest.raises(jwt.InvalidTokenError, match=message):
+        codec.decode_claims(claims)
+
+
+def test_configured_encoding_round_trip(scope_table):
+    encoded = encode_scopes({"user_id": "u1", "scopes": ["write", "other"]})
+    assert encoded[MASK_CLAIM] == "2"
+
+    claims, mask = decode_scopes(encoded)
+    assert mask == 0b10
+    assert claims["scopes"] == ["write", "other"]
+    assert MASK_CLAIM in encoded
+
+
+def test_stray_version_claim_is_dropped_without_touching_payload():
+    payload = {"scopes": ["read"], VERSION_CLAIM: 1}
+    claims, mask = decode_scopes(payload)
+    assert mask is None
+    assert claims == {"scopes": ["read"]}
+    assert VERSION_CLAIM in payload
+
+
+def test_encoded_token_without_scope_table(monkeypatch):
+    monkeypatch.setattr(Secrets, "scopes", None)
+    get_scope_codec.cache_clear()
+    try:
+        with pytest.raises(jwt.InvalidTokenError, match="AUTH_SCOPES"):
+            decode_scopes({MASK_CLAIM: "1", VERSION_CLAIM: 1})
+    finally:
+        get_scope_codec.cache_clear()
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import SecurityScopes
+from redis.exceptions import ResponseError
+
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.auth.session_cache import SessionCache
+from tp_auth_serverside.db.memorydb import inprocess
+from tp_auth_serverside.db.memorydb.login import extend_tokens, revoke_sessions, revoke_token, set_token
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+USER_ID = "user_1"
+CLAIMS = {"user_id": USER_ID, "username": "User", "scopes": ["user:read"]}
+
+
+async def _validate(validator: AuthValidator, short_token: str):
+    return await validator(SecurityScopes(), token=short_token, user_id=USER_ID, refresh=False)
+
+
+async def _cached_session(cache: SessionCache) -> tuple[AuthValidator, str]:
+    await cache.start()
+    await asyncio.sleep(0)
+    assert cache.active
+    validator = AuthValidator(session_cache=cache)
+    short_token = await set_token(USER_ID, JWTUtil().encode(dict(CLAIMS)))
+    await _validate(validator, short_token)
+    assert cache.get(USER_ID, short_token) is not None
+    return validator, short_token
+
+
+def test_revoke_token_invalidates_local_cache_immediately():
+    async def scenario():
+        cache = SessionCache()
+        validator, short_token = await _cached_session(cache)
+        try:
+            await revoke_token(USER_ID, short_token)
+            # No chance for the keyspace notification to arrive before the next request.
+            assert cache.get(USER_ID, short_token) is None
+            with pytest.raises(HTTPException) as error:
+                await _validate(validator, short_token)
+            assert error.value.status_code == 401
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_revoke_sessions_invalidates_every_cached_session_of_the_user():
+    async def scenario():
+        cache = SessionCache()
+        _, short_token = await _cached_session(cache)
+        try:
+            assert await revoke_sessions([USER_ID]) == 1
+            assert cache.get(USER_ID, short_token) is None
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_refresh_write_invalidates_local_cache():
+    async def scenario():
+        cache = SessionCache()
+        _, short_token = await _cached_session(cache)
+        try:
+            assert await extend_tokens([(USER_ID, short_token)]) == [True]
+            assert cache.get(USER_ID, short_token) is None
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stopped_cache_is_no_longer_notified():
+    async def scenario():
+        cache = SessionCache()
+        _, short_token = await _cached_session(cache)
+        await cache.stop()
+        generation = cache.generation
+        await revoke_token(USER_ID, short_token)
+        assert cache.generation == generation
+
+    asyncio.run(scenario())
+
+
+def test_cache_stays_disabled_when_notifications_cannot_be_checked(monkeypatch):
+    def forbidden(self, pattern="*"):
+        raise ResponseError("unknown command 'CONFIG'")
+
+    monkeypatch.setattr(inprocess._Keyspace, "config_get", forbidden)
+
+    async def scenario():
+        cache = SessionCache()
+        await cache.start()
+        await asyncio.sleep(0.05)
+        try:
+            assert not cache.active
+            validator = AuthValidator(session_cache=cache)
+            short_token = await set_token(USER_ID, JWTUtil().encode(dict(CLAIMS)))
+            await _validate(validator, short_token)
+            assert len(cache) == 0
+        finally:
+            await cache.stop()
+
+    asyncio.run(scenario())
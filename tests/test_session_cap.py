@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from tp_auth_serverside.config import Secrets, SessionEviction
+from tp_auth_serverside.db.memorydb.inprocess import InProcessRedis
+from tp_auth_serverside.db.memorydb.keys import sessions_key
+from tp_auth_serverside.db.memorydb.login import (
+    count_sessions,
+    extend_tokens,
+    get_token,
+    list_sessions,
+    revoke_sessions,
+    set_token,
+)
+from tp_auth_serverside.db.memorydb.scripts import ADD_SESSION
+from tp_auth_serverside.utilities.jwt_util import JWTUtil
+
+USER_ID = "user_1"
+
+
+def _token(user_id: str = USER_ID) -> str:
+    return JWTUtil().encode({"user_id": user_id, "username": "User", "scopes": []})
+
+
+@pytest.fixture
+def capped(monkeypatch):
+    def cap(limit: int, eviction: SessionEviction = SessionEviction.OLDEST) -> None:
+        monkeypatch.setattr(Secrets, "max_sessions_per_user", limit)
+        monkeypatch.setattr(Secrets, "session_eviction", eviction)
+
+    return cap
+
+
+async def _login(count: int, user_id: str = USER_ID) -> list[str]:
+    sessions = []
+    for _ in range(count):
+        sessions.append(await set_token(user_id, _token(user_id)))
+        # Sessions are ordered by wall clock time, keep the scores apart.
+        await asyncio.sleep(0.002)
+    return sessions
+
+
+async def _live(sessions: list[str], user_id: str = USER_ID) -> list[str]:
+    return [short_token for short_token in sessions if await get_token(user_id, short_token)]
+
+
+def test_oldest_sessions_are_evicted(capped):
+    capped(2)
+
+    async def scenario():
+        first, second, third = await _login(3)
+        assert await _live([first, second, third]) == [second, third]
+        assert await count_sessions([USER_ID]) == 2
+        (fourth,) = await _login(1)
+        assert await _live([second, third, fourth]) == [third, fourth]
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_refreshed_sessions_are_evicted(capped):
+    capped(2, SessionEviction.LEAST_RECENTLY_REFRESHED)
+
+    async def scenario():
+        first, second = await _login(2)
+        assert await extend_tokens([(USER_ID, first)]) == [True]
+        await asyncio.sleep(0.002)
+        (third,) = await _login(1)
+        assert await _live([first, second, third]) == [first, third]
+
+    asyncio.run(scenario())
+
+
+def test_refresh_does_not_reorder_oldest_eviction(capped):
+    capped(2)
+
+    async def scenario():
+        first, second = await _login(2)
+        await extend_tokens([(USER_ID, first)])
+        await asyncio.sleep(0.002)
+        (third,) = await _login(1)
+        assert await _live([first, second, third]) == [second, third]
+
+    asyncio.run(scenario())
+
+
+def test_sessions_stored_before_the_cap_are_evicted_by_age(capped):
+    async def scenario():
+        legacy = await _login(3)
+        capped(2)
+        (latest,) = await _login(1)
+        assert await _live([*legacy, latest]) == [legacy[2], latest]
+
+    asyncio.run(scenario())
+
+
+def test_revoked_sessions_free_their_slot(capped):
+    capped(2)
+
+    async def scenario():
+        first, second = await _login(2)
+        await revoke_sessions([USER_ID])
+        third, fourth = await _login(2)
+        assert await _live([first, second, third, fourth]) == [third, fourth]
+
+    asyncio.run(scenario())
+
+
+def test_list_count_and_revoke_sessions(capped, memory_db):
+    capped(3)
+
+    async def scenario():
+        sessions = {f"user_{i}": await _login(i + 1, f"user_{i}") for i in range(4)}
+        listed = {user_id: sorted(short_tokens) async for user_id, short_tokens in list_sessions(batch_size=3)}
+        assert listed == {user_id: sorted(short_tokens[-3:]) for user_id, short_tokens in sessions.items()}
+        assert await count_sessions(batch_size=3) == 1 + 2 + 3 + 3
+        assert await count_sessions(["user_1", "missing"]) == 2
+
+        assert await revoke_sessions(["user_0", "missing"]) == 1
+        assert await revoke_sessions(batch_size=2) == 3
+        assert await count_sessions() == 0
+        assert [user_id async for user_id, _ in list_sessions()] == []
+        assert not memory_db.keyspace(0).exists(*(sessions_key(user_id) for user_id in sessions))
+
+    asyncio.run(scenario())
+
+
+def test_add_session_script_matches_the_in_process_twin(memory_db):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    # Two sessions stored before the cap, an index entry of a revoked session, then logins at a shrinking cap.
+    async def run(client) -> list:
+        await client.hset("login", "legacy_a", "a")
+        await client.hexpire("login", 100, "legacy_a")
+        await client.hset("login", "legacy_b", "b")
+        await client.hexpire("login", 200, "legacy_b")
+        await client.zadd("index", {"revoked": 1.0})
+        steps = []
+        for short_token, score, limit in (("t1", 1000.0, 3), ("t2", 1001.0, 3), ("t3", 1002.0, 2)):
+            evicted = await client.eval(ADD_SESSION, 2, "login", "index", short_token, "record", 300, score, limit)
+            steps.append(
+                (
+                    evicted,
+                    sorted(await client.hkeys("login")),
+                    [(member, round(score)) for member, score in await client.zrange("index", 0, -1, withscores=True)],
+                    await client.ttl("index"),
+                )
+            )
+        return steps
+
+    async def scenario():
+        script = await run(fakeredis.FakeAsyncRedis(decode_responses=True))
+        twin = await run(InProcessRedis(0, memory_db))
+        assert twin == script
+        assert [evicted for evicted, *_ in script] == [[], ["legacy_a"], ["legacy_b", "t1"]]
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+from fastapi.security import SecurityScopes
+
+from tp_auth_serverside.auth.auth_validator import AuthValidator
+from tp_auth_serverside.auth.throttle import FailureThrottle
+
+PROXY = "10.0.0.1"
+
+
+def _request(client: str, forwarded_for: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "client": (client, 50000), "headers": headers})
+
+
+@pytest.mark.parametrize(
+    "client, forwarded_for, expected",
+    [
+        ("203.0.113.7", "198.51.100.1", "203.0.113.7"),
+        (PROXY, "198.51.100.1", "198.51.100.1"),
+        (PROXY, "192.0.2.66, 198.51.100.1, 10.0.0.2", "198.51.100.1"),
+        (PROXY, None, PROXY),
+    ],
+    ids=["untrusted_peer", "trusted_proxy", "forged_entries", "no_header"],
+)
+def test_client_address(client, forwarded_for, expected):
+    throttle = FailureThrottle(trusted_proxies=["10.0.0.0/8"])
+    assert throttle.client_address(_request(client, forwarded_for)) == expected
+
+
+async def _status(validator: AuthValidator, request: Request, token: str = None, user_id: str = None) -> int:
+    try:
+        await validator(SecurityScopes(), token=token, user_id=user_id, refresh=False, request=request)
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def _validator() -> AuthValidator:
+    return AuthValidator(throttle=FailureThrottle(rate=0.001, burst=2, trusted_proxies=[PROXY]))
+
+
+def test_clients_behind_a_trusted_proxy_are_throttled_separately():
+    async def scenario():
+        validator = _validator()
+        attacker = _request(PROXY, "198.51.100.1")
+        assert [await _status(validator, attacker, token="bad") for _ in range(3)] == [401, 401, 429]
+        assert await _status(validator, _request(PROXY, "198.51.100.2"), token="bad") == 401
+
+    asyncio.run(scenario())
+
+
+def test_requests_without_a_token_are_not_throttled():
+    async def scenario():
+        validator = _validator()
+        request = _request("198.51.100.1")
+        assert {await _status(validator, request, user_id="user_1") for _ in range(5)} == {401}
+        assert len(validator.throttle) == 0
+        # The user id of a cookie sent without a token is not locked out either.
+        assert await _status(validator, _request("198.51.100.2"), token="bad", user_id="user_1") == 401
+
+    asyncio.run(scenario())
+
+
+def test_failures_under_a_user_id_do_not_lock_out_that_user():
+    async def scenario():
+        validator = _validator()
+        attacker = _request("198.51.100.1")
+        statuses = [await _status(validator, attacker, token="bad", user_id="victim") for _ in range(3)]
+        assert statuses == [401, 401, 429]
+        # The victim presents their own user id from another address and is not throttled.
+        assert await _status(validator, _request("198.51.100.2"), token="bad", user_id="victim") == 401
+
+    asyncio.run(scenario())
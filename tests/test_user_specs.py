@@ -0,0 +1,27 @@
+import pytest
+
+from tp_auth_serverside.auth.user_specs import UserInfoSchema
+
+CLAIMS = {
+    "user_id": "user_1",
+    "username": "User",
+    "scopes": ["user:read"],
+    "type": "access",
+    "exp": 1,
+    "jti": "abc",
+}
+
+
+def test_from_claims_matches_validation():
+    user_info = UserInfoSchema.from_claims(dict(CLAIMS))
+    validated = UserInfoSchema(**CLAIMS)
+    assert user_info == validated
+    assert user_info.model_dump() == validated.model_dump()
+    assert user_info.model_fields_set == validated.model_fields_set
+    assert user_info.jti == "abc"
+    assert user_info._machine is False
+
+
+def test_from_claims_requires_user_id():
+    with pytest.raises(ValueError):
+        UserInfoSchema.from_claims({"username": "User"})